@@ -1,10 +1,51 @@
 # -*- coding: utf-8 -*-
 # File: app/api.py
 
-from fastapi import APIRouter
+import asyncio
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
+from app.auth import verify_mcp_api_key
+from app.health import HEALTH_MONITOR
+from app.query_stats import merged_top
+from app.shared_state import SHARED_STATE, collect_worker_stats
 router = APIRouter()
 
 @router.get("/")
 def api_root():
     """API root endpoint for the application."""
     return {"status": "ok", "message": "Welcome to the Postgres MCP Service!"}
+
+
+@router.get("/workers", dependencies=[Depends(verify_mcp_api_key)])
+async def api_workers():
+    """Per-worker runtime stats (admission, pinned sessions/transactions) for all live workers."""
+    stats = await asyncio.to_thread(collect_worker_stats)
+    return {"backend": SHARED_STATE.name, "stats": stats}
+
+
+@router.get("/health")
+async def api_health():
+    """Liveness: process còn phục vụ request, không chạm tới database."""
+    return HEALTH_MONITOR.health()
+
+
+@router.get("/ready")
+async def api_ready():
+    """Readiness từ kết quả ping đã cache; trả 503 khi không nên nhận thêm traffic."""
+    ready, detail = HEALTH_MONITOR.readiness()
+    return JSONResponse(detail, status_code=200 if ready else 503)
+
+
+@router.get("/diagnostics", dependencies=[Depends(verify_mcp_api_key)])
+async def api_diagnostics():
+    """Mức dùng connection pool, câu lệnh đang chạy và trạng thái admission."""
+    return HEALTH_MONITOR.diagnostics()
+
+
+@router.get("/query-stats", dependencies=[Depends(verify_mcp_api_key)])
+async def api_query_stats(order_by: str = "total_ms", limit: int = 20):
+    """Top câu lệnh theo fingerprint (calls, thời gian tổng/trung bình/p95, rows, lỗi), gộp mọi worker."""
+    try:
+        return await asyncio.to_thread(merged_top, order_by, limit)
+    except ValueError as e:
+        return JSONResponse({"detail": str(e)}, status_code=400)
@@ -1,13 +1,25 @@
-from typing import Dict, Callable, Any, Optional, Union
+from typing import Dict, Callable, Any, Optional, Union, TypedDict
 from fastapi import Header, HTTPException, status
-from app.config import MCP_API_KEY
+from app.config import API_KEYS
+
+
+class ApiClient(TypedDict):
+    name: str
+    rate: float
+    burst: int
+    max_concurrent: int
+
+
+def get_api_client(api_key: str) -> Optional[ApiClient]:
+    """Return the client configuration for an API key, or None if unknown."""
+    return API_KEYS.get(api_key)
 
 def verify_api_key(api_key: str) -> bool:
     """Verify API key for MCP access."""
-    return api_key == MCP_API_KEY
+    return get_api_client(api_key) is not None
 
-async def verify_mcp_api_key(mcp_api_key: Optional[str] = Header(None, alias="MCP_API_KEY")) -> bool:
-    """Dependency to verify MCP API key from header."""
+async def verify_mcp_api_key(mcp_api_key: Optional[str] = Header(None, alias="MCP_API_KEY")) -> ApiClient:
+    """Dependency to verify MCP API key from header. Returns the calling client."""
     if not mcp_api_key:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -15,11 +27,12 @@ async def verify_mcp_api_key(mcp_api_key: Optional[str] = Header(None, alias="MC
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    if not verify_api_key(mcp_api_key):
+    client = get_api_client(mcp_api_key)
+    if client is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid API key",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    return True
\ No newline at end of file
+    return client
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# File: app/coalesce.py
+"""
+Gộp các tool call đọc giống hệt nhau đang chạy đồng thời (single-flight).
+
+Request đầu tiên với một key (tên tool + arguments đã chuẩn hóa) là leader
+và thực sự chạy; các request trùng key đến khi leader chưa xong chỉ chờ và
+nhận cùng kết quả, nên một đợt request giống nhau chỉ tốn một lần gọi
+database. Kết quả không được cache: khi leader xong, request kế tiếp lại
+chạy mới.
+
+Key gồm mọi argument (kể cả preview_chars, full_columns, value_handles),
+nên chỉ các lời gọi giống hệt nhau mới dùng chung kết quả. Câu SQL gọi hàm
+không xác định (random(), nextval(), now()...) không được gộp vì mỗi lời
+gọi phải thấy kết quả riêng.
+"""
+
+import asyncio
+import json
+import re
+from typing import Any, Awaitable, Callable
+
+from app.shared_state import register_worker_stats
+
+
+_VOLATILE_SQL = re.compile(
+    r"\b(?:random|rand|randomblob|random_bytes|uuid|uuid_short|newid|gen_random_uuid|uuid_generate_v\w*"
+    r"|nextval|setval|currval|lastval|last_insert_id|last_insert_rowid|changes|total_changes"
+    r"|now|sysdate|clock_timestamp|statement_timestamp|transaction_timestamp|timeofday|unix_timestamp"
+    r"|utc_timestamp|julianday|strftime|pg_sleep|sleep|get_lock|txid_current)\s*\("
+    r"|\b(?:current_timestamp|current_date|current_time|localtimestamp|localtime)\b"
+    r"|\bFOR\s+(?:UPDATE|SHARE)\b",
+    re.I
+)
+
+
+def is_deterministic_sql(query: str) -> bool:
+    """Câu SQL không gọi hàm cho kết quả khác nhau giữa các lần chạy."""
+    return not _VOLATILE_SQL.search(query or "")
+
+
+def coalesce_key(tool_name: str, arguments: Any) -> str:
+    """Key ổn định, không phụ thuộc thứ tự key trong arguments."""
+    return tool_name + ":" + json.dumps(arguments, sort_keys=True, separators=(",", ":"), default=str)
+
+
+class SingleFlight:
+    """Chia sẻ kết quả của lần gọi đang chạy cho mọi lời gọi cùng key."""
+
+    def __init__(self):
+        self._in_flight: dict[str, asyncio.Task] = {}
+        self._leaders = 0
+        self._followers = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """Trả về (kết quả, True nếu dùng lại kết quả của leader)."""
+        task = self._in_flight.get(key)
+        shared = task is not None
+        if shared:
+            self._followers += 1
+        else:
+            self._leaders += 1
+            # Chạy trong task riêng: một caller bị hủy không làm hủy các caller còn lại
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task), shared
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._in_flight),
+            "leaders": self._leaders,
+            "coalesced": self._followers,
+        }
+
+
+SINGLE_FLIGHT = SingleFlight()
+register_worker_stats("coalescing", SINGLE_FLIGHT.stats)
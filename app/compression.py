@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# File: app/compression.py
+"""
+Nén response theo Accept-Encoding (zstd, br, gzip) cho payload MCP lớn.
+
+- Response trọn gói nhỏ hơn minimum_size byte được gửi nguyên, vì nén
+  không đáng chi phí CPU.
+- Response streaming (nhiều chunk) được nén từng chunk và flush ngay, nên
+  client vẫn nhận dữ liệu dần dần.
+- zstd cần gói zstandard, br cần gói brotli (extra "compression"); thiếu
+  gói thì encoding đó không được chọn. gzip luôn có sẵn.
+"""
+
+import zlib
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content-Type đã nén sẵn, không đáng nén, hoặc luồng SSE (client cần đọc từng event)
+_SKIP_CONTENT_TYPES = ("image/", "video/", "audio/", "application/zip", "application/gzip", "text/event-stream")
+
+
+class _GzipEncoder:
+    def __init__(self, level: int = 6):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self, quality: int = 5):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self, level: int = 3):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def available_encoders() -> dict:
+    """Encoding được hỗ trợ, theo thứ tự server ưu tiên."""
+    encoders = {}
+    if zstandard is not None:
+        encoders["zstd"] = _ZstdEncoder
+    if brotli is not None:
+        encoders["br"] = _BrotliEncoder
+    encoders["gzip"] = _GzipEncoder
+    return encoders
+
+
+def negotiate_encoding(accept_encoding: str, supported: list[str]) -> Optional[str]:
+    """
+    Chọn encoding từ header Accept-Encoding: q cao nhất thắng, bằng nhau thì
+    theo thứ tự ưu tiên của server; q=0 nghĩa là không chấp nhận.
+    """
+    weights: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in supported:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware:
+    """ASGI middleware nén response HTTP."""
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encoders = available_encoders()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept = ""
+        for key, value in scope.get("headers", []):
+            if key == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        encoding = negotiate_encoding(accept, list(self.encoders)) if accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressingResponder(send, encoding, self.encoders[encoding], self.minimum_size)
+        await self.app(scope, receive, responder)
+
+
+class _CompressingResponder:
+    """Bọc hàm send: quyết định nén khi thấy chunk body đầu tiên."""
+
+    def __init__(self, send, encoding: str, encoder_class, minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.encoder_class = encoder_class
+        self.minimum_size = minimum_size
+        self.start_message: Optional[dict] = None
+        self.encoder = None
+        self.passthrough = False
+
+    def _skip(self, message: dict) -> bool:
+        if message["status"] < 200 or message["status"] in (204, 304):
+            return True
+        for key, value in message.get("headers", []):
+            if key.lower() == b"content-encoding":
+                return True
+            if key.lower() == b"content-type" and value.decode("latin-1").startswith(_SKIP_CONTENT_TYPES):
+                return True
+        return False
+
+    def _headers(self, content_length: Optional[int]) -> list:
+        headers = [
+            (key, value) for key, value in self.start_message.get("headers", [])
+            if key.lower() not in (b"content-length", b"vary")
+        ]
+        vary = [value for key, value in self.start_message.get("headers", []) if key.lower() == b"vary"]
+        headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+        headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+        if content_length is not None:
+            headers.append((b"content-length", str(content_length).encode("latin-1")))
+        return headers
+
+    async def __call__(self, message: dict) -> None:
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            if self._skip(message):
+                self.passthrough = True
+                await self.send(message)
+            else:
+                self.start_message = message
+            return
+        if message_type != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.encoder is None:
+            if not more_body:
+                # Response trọn gói: chỉ nén khi đủ lớn
+                if len(body) < self.minimum_size:
+                    self.passthrough = True
+                    await self.send(self.start_message)
+                    await self.send(message)
+                    return
+                encoder = self.encoder_class()
+                compressed = encoder.compress(body) + encoder.finish()
+                await self.send({**self.start_message, "headers": self._headers(len(compressed))})
+                await self.send({"type": "http.response.body", "body": compressed})
+                return
+
+            # Response streaming: không biết trước độ dài, nén và flush từng chunk
+            self.encoder = self.encoder_class()
+            await self.send({**self.start_message, "headers": self._headers(None)})
+
+        chunk = self.encoder.compress(body) if body else b""
+        if not more_body:
+            chunk += self.encoder.finish()
+        await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
@@ -4,10 +4,20 @@ Module thiết lập kết nối database sử dụng SQLAlchemy.
 
 from sqlalchemy import create_engine, Column, String
 from sqlalchemy.orm import sessionmaker, Session, declarative_base
-from typing import Generator, Optional
+from typing import Any, Generator, Iterable, Optional, Sequence
+from decimal import Decimal
+from datetime import datetime, date
+import random
+import re
 import uuid
+import base64
 
-from app.config import DATABASE_URL
+from app.config import DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, VALUE_PREVIEW_CHARS, BINARY_PREVIEW_BYTES
+from app.logger import get_logger
+from app.tracing import start_span, traced
+from app.values import VALUE_STORE, preview_value
+
+logger = get_logger(__name__)
 
 
 Base = declarative_base()
@@ -18,14 +28,34 @@ class User(Base):
     name = Column(String(50), nullable=False)
     email = Column(String(100), nullable=False, unique=True)
 
-engine = create_engine(DATABASE_URL, echo=True, future=True, pool_size=10, max_overflow=20)
+engine = create_engine(DATABASE_URL, echo=True, future=True, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Câu lệnh của chính server (reflect catalog, health check, bộ đếm thay đổi,
+# đọc thống kê...) được gắn execution option này để query_stats bỏ qua;
+# internal_engine dùng chung pool với engine
+INTERNAL_OPTION = "mcp_internal"
+INTERNAL_EXECUTION = {INTERNAL_OPTION: True}
+internal_engine = engine.execution_options(**INTERNAL_EXECUTION)
 def init_db() -> None:
     """
     Khởi tạo database và tạo bảng users nếu chưa có.
     """
     Base.metadata.create_all(engine)
 
+def new_session() -> Session:
+    """
+    Tạo session cho một lần gọi. Nếu request đang gắn với một MCP session
+    có connection được ghim (xem app.sessions), session dùng connection đó
+    để giữ temp table/session settings giữa các lần gọi.
+    """
+    from app.sessions import current_connection
+
+    connection = current_connection()
+    if connection is not None:
+        return SessionLocal(bind=connection)
+    return SessionLocal()
+
+
 def get_db() -> Generator[Session, None, None]:
     """
     Tạo session kết nối database, dùng cho truy vấn.
@@ -37,31 +67,71 @@ def get_db() -> Generator[Session, None, None]:
         db.close()
 
 
-def execute_query(query: str, params: Optional[dict] = None) -> list[dict]:
+def convert_value(value: Any) -> Any:
+    """Convert non-JSON serializable values"""
+    if isinstance(value, Decimal):
+        return float(value)
+    elif isinstance(value, (datetime, date)):
+        return value.isoformat()
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(value).decode("ascii")
+    return value
+
+
+def rows_to_dicts(
+    columns: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+    preview_chars: Optional[int] = None,
+    full_columns: Optional[Iterable[str]] = None,
+    value_handles: bool = False
+) -> list[dict]:
+    """
+    Chuyển các row kết quả thành list[dict] có thể serialize JSON.
+    Dùng chung cho mọi tool trả dữ liệu bảng.
+    TEXT dài hơn preview_chars (mặc định MCP_VALUE_PREVIEW_CHARS) và binary
+    được rút gọn (xem app.values.preview_value), trừ các cột trong
+    full_columns; value_handles=True kèm handle để đọc đầy đủ bằng fetch_value.
+    """
+    max_chars = VALUE_PREVIEW_CHARS if preview_chars is None else preview_chars
+    full = set(full_columns or ())
+    store = VALUE_STORE if value_handles else None
+    limits = [(0, 0) if col in full else (max_chars, BINARY_PREVIEW_BYTES) for col in columns]
+    return [
+        {
+            col: preview_value(val, *limit, store) if isinstance(val, (str, bytes, bytearray, memoryview))
+            else convert_value(val)
+            for col, val, limit in zip(columns, row, limits)
+        }
+        for row in rows
+    ]
+
+
+@traced("db.execute_query")
+def execute_query(
+    query: str,
+    params: Optional[dict] = None,
+    preview_chars: Optional[int] = None,
+    full_columns: Optional[list[str]] = None,
+    value_handles: bool = False
+) -> list[dict]:
     """
     Thực thi truy vấn SELECT SQLAlchemy, trả về dữ liệu dạng list[dict].
+    Giá trị TEXT/BLOB lớn được rút gọn như trong rows_to_dicts.
     """
     from sqlalchemy import text
-    from decimal import Decimal
-    from datetime import datetime, date
     
-    def convert_value(value):
-        """Convert non-JSON serializable values"""
-        if isinstance(value, Decimal):
-            return float(value)
-        elif isinstance(value, (datetime, date)):
-            return value.isoformat()
-        return value
-    
-    db = SessionLocal()
+    db = new_session()
     try:
-        result = db.execute(text(query), params or {})
-        rows = result.fetchall()
-        columns = result.keys()
-        return [
-            {col: convert_value(val) for col, val in zip(columns, row)} 
-            for row in rows
-        ]
+        with start_span("db.checkout"):
+            db.connection()
+        with start_span("db.execute", {"db.system": engine.dialect.name, "db.statement": query}):
+            result = db.execute(text(query), params or {})
+        with start_span("db.fetch") as span:
+            rows = result.fetchall()
+            span.set_attribute("db.rows", len(rows))
+        columns = list(result.keys())
+        with start_span("db.convert"):
+            return rows_to_dicts(columns, rows, preview_chars, full_columns, value_handles)
     except Exception as e:
         db.rollback()
         raise e
@@ -69,33 +139,44 @@ def execute_query(query: str, params: Optional[dict] = None) -> list[dict]:
         db.close()
 
 
-def execute_command(query: str, params: Optional[dict] = None) -> dict:
+# Forbidden operations for security
+FORBIDDEN_PATTERNS = [
+    r'DROP\s+DATABASE',
+    r'TRUNCATE\s+DATABASE', 
+    r'SHUTDOWN',
+    r'EXEC',
+    r'EXECUTE',
+    r'xp_',
+    r'sp_'
+]
+
+
+def check_forbidden_operations(query: str) -> None:
     """
-    Thực thi các lệnh SQL write operations (INSERT, UPDATE, DELETE, CREATE, ALTER).
-    Trả về thông tin về số rows affected và status.
+    Từ chối các lệnh nguy hiểm (DROP DATABASE, SHUTDOWN, ...).
+    Raise ValueError nếu phát hiện.
     """
-    from sqlalchemy import text
     import re
-    
+
     # Validate SQL command
     query_upper = query.strip().upper()
     
-    # Forbidden operations for security
-    forbidden_patterns = [
-        r'DROP\s+DATABASE',
-        r'TRUNCATE\s+DATABASE', 
-        r'SHUTDOWN',
-        r'EXEC',
-        r'EXECUTE',
-        r'xp_',
-        r'sp_'
-    ]
-    
-    for pattern in forbidden_patterns:
+    for pattern in FORBIDDEN_PATTERNS:
         if re.search(pattern, query_upper):
             raise ValueError(f"Forbidden operation detected: {pattern}")
+
+
+@traced("db.execute_command")
+def execute_command(query: str, params: Optional[dict] = None) -> dict:
+    """
+    Thực thi các lệnh SQL write operations (INSERT, UPDATE, DELETE, CREATE, ALTER).
+    Trả về thông tin về số rows affected và status.
+    """
+    from sqlalchemy import text
     
-    db = SessionLocal()
+    check_forbidden_operations(query)
+    
+    db = new_session()
     try:
         result = db.execute(text(query), params or {})
         rows_affected = getattr(result, 'rowcount', 0)
@@ -113,6 +194,7 @@ def execute_command(query: str, params: Optional[dict] = None) -> dict:
         db.close()
 
 
+@traced("db.execute_transaction")
 def execute_transaction(queries: list[dict]) -> dict:
     """
     Thực thi nhiều câu lệnh SQL trong một transaction.
@@ -120,7 +202,7 @@ def execute_transaction(queries: list[dict]) -> dict:
     """
     from sqlalchemy import text
     
-    db = SessionLocal()
+    db = new_session()
     try:
         total_affected = 0
         results = []
@@ -158,16 +240,137 @@ def execute_transaction(queries: list[dict]) -> dict:
         db.close()
 
 
-def get_table_info(table_name: Optional[str] = None) -> dict:
+@traced("db.get_schema_info")
+def get_schema_info(table_names: Optional[list[str]] = None) -> dict:
+    """
+    Lấy toàn bộ schema (cột, khóa chính, khóa ngoại) của tất cả bảng hoặc
+    của danh sách table_names, dùng multi-table reflection của SQLAlchemy
+    để mỗi loại thông tin chỉ tốn một lượt truy vấn catalog.
+    """
+    from sqlalchemy import inspect
+
+    inspector = inspect(internal_engine)
+    existing = inspector.get_table_names()
+    if table_names:
+        missing = [name for name in table_names if name not in existing]
+        if missing:
+            return {"error": f"Tables not found: {', '.join(missing)}"}
+        names = list(table_names)
+    else:
+        names = existing
+
+    # Các hàm get_multi_* trả về dict với key (schema, table_name)
+    columns = inspector.get_multi_columns(filter_names=names)
+    primary_keys = inspector.get_multi_pk_constraint(filter_names=names)
+    foreign_keys = inspector.get_multi_foreign_keys(filter_names=names)
+
+    tables = {}
+    for name in names:
+        key = (None, name)
+        tables[name] = {
+            "columns": columns.get(key, []),
+            "primary_keys": primary_keys.get(key, {}),
+            "foreign_keys": foreign_keys.get(key, [])
+        }
+
+    return {
+        "tables": tables,
+        "table_count": len(tables)
+    }
+
+
+def _format_column_type(column_type) -> str:
+    """Biểu diễn kiểu cột theo cú pháp của dialect đang dùng."""
+    try:
+        return column_type.compile(dialect=engine.dialect)
+    except Exception:
+        return type(column_type).__name__
+
+
+@traced("db.get_schema_summary")
+def get_schema_summary(
+    pattern: Optional[str] = None,
+    offset: int = 0,
+    limit: int = 100
+) -> dict:
+    """
+    Tóm tắt schema dạng DDL rút gọn, mỗi bảng một dòng, ví dụ:
+    orders(id INTEGER PK, customer_id INTEGER -> customers.id, amount NUMERIC(10, 2))
+    pattern là glob (không phân biệt hoa thường) để lọc tên bảng;
+    offset/limit dùng để phân trang trên danh sách bảng đã sắp xếp.
+    """
+    from sqlalchemy import inspect
+    import fnmatch
+
+    inspector = inspect(internal_engine)
+    names = sorted(inspector.get_table_names())
+    if pattern:
+        names = [
+            name for name in names
+            if fnmatch.fnmatchcase(name.lower(), pattern.lower())
+        ]
+
+    offset = max(offset, 0)
+    page = names[offset:offset + limit] if limit > 0 else []
+
+    lines = []
+    if page:
+        columns = inspector.get_multi_columns(filter_names=page)
+        primary_keys = inspector.get_multi_pk_constraint(filter_names=page)
+        foreign_keys = inspector.get_multi_foreign_keys(filter_names=page)
+
+        for name in page:
+            key = (None, name)
+            pk_columns = set(
+                (primary_keys.get(key) or {}).get("constrained_columns") or []
+            )
+            references = {}
+            for fk in foreign_keys.get(key, []):
+                for local, remote in zip(fk["constrained_columns"], fk["referred_columns"]):
+                    references[local] = f"{fk['referred_table']}.{remote}"
+
+            parts = []
+            for column in columns.get(key, []):
+                part = f"{column['name']} {_format_column_type(column['type'])}"
+                if column["name"] in pk_columns:
+                    part += " PK"
+                elif not column.get("nullable", True):
+                    part += " NOT NULL"
+                if column["name"] in references:
+                    part += f" -> {references[column['name']]}"
+                parts.append(part)
+            lines.append(f"{name}({', '.join(parts)})")
+
+    next_offset = offset + len(page)
+    return {
+        "total_tables": len(names),
+        "offset": offset,
+        "limit": limit,
+        "next_offset": next_offset if next_offset < len(names) else None,
+        "schema": "\n".join(lines)
+    }
+
+
+@traced("db.get_table_info")
+def get_table_info(
+    table_name: Optional[str] = None,
+    table_names: Optional[list[str]] = None,
+    full_schema: bool = False
+) -> dict:
     """
     Lấy thông tin về các bảng trong database.
     Nếu table_name được cung cấp, trả về chi tiết cột của bảng đó.
+    Nếu full_schema=True, trả về chi tiết của tất cả bảng (hoặc các bảng
+    trong table_names) chỉ với vài truy vấn catalog.
     """
     from sqlalchemy import text, inspect
     
-    db = SessionLocal()
+    if full_schema:
+        return get_schema_info(table_names)
+
+    db = new_session()
     try:
-        inspector = inspect(engine)
+        inspector = inspect(internal_engine)
         
         if table_name:
             # Thông tin chi tiết về một bảng
@@ -197,13 +400,666 @@ def get_table_info(table_name: Optional[str] = None) -> dict:
         db.close()
 
 
+MAX_SAMPLE_ROWS = 1000
+# Số row tối đa đọc cho mỗi row cần lấy khi lấy mẫu theo block rồi trộn
+_SAMPLE_OVERSAMPLE = 10
+# Bảng chưa có thống kê: đếm tối đa chừng này row để biết bảng có nhỏ không;
+# bảng nhỏ được lấy mẫu bằng ORDER BY random()
+_SAMPLE_SMALL_TABLE_ROWS = 10000
+
+
+def quote_identifier(name: str) -> str:
+    """Quote tên bảng/cột theo dialect hiện tại."""
+    return engine.dialect.identifier_preparer.quote(name)
+
+
+def _resolve_table_columns(table_name: str, columns: Optional[list[str]] = None) -> list[str]:
+    """
+    Kiểm tra bảng và các cột có tồn tại, trả về danh sách cột cần dùng.
+    Chỉ tên đã được xác thực mới được ghép vào SQL.
+    """
+    from sqlalchemy import inspect
+
+    inspector = inspect(internal_engine)
+    if table_name not in inspector.get_table_names():
+        raise ValueError(f"Table '{table_name}' not found")
+
+    existing = [column["name"] for column in inspector.get_columns(table_name)]
+    if not columns:
+        return existing
+
+    unknown = [column for column in columns if column not in existing]
+    if unknown:
+        raise ValueError(f"Unknown columns for table '{table_name}': {', '.join(unknown)}")
+    return list(columns)
+
+
+def _estimate_row_count(db: Session, table_name: str) -> Optional[int]:
+    """
+    Ước lượng số row từ catalog (không quét bảng). Trả về None nếu không
+    có thống kê.
+    """
+    from sqlalchemy import text
+
+    dialect = engine.dialect.name
+    if dialect == "postgresql":
+        estimate = db.execute(
+            text("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:table)"),
+            {"table": quote_identifier(table_name)},
+            execution_options=INTERNAL_EXECUTION
+        ).scalar()
+    elif dialect == "mysql":
+        estimate = db.execute(
+            text(
+                "SELECT TABLE_ROWS FROM information_schema.tables "
+                "WHERE table_schema = DATABASE() AND table_name = :table"
+            ),
+            {"table": table_name},
+            execution_options=INTERNAL_EXECUTION
+        ).scalar()
+    else:
+        return None
+
+    if estimate is None or estimate <= 0:
+        return None
+    return int(estimate)
+
+
+def _sqlite_without_rowid(db: Session, table_name: str) -> bool:
+    """Bảng SQLite khai báo WITHOUT ROWID (không có cột rowid ẩn)."""
+    from sqlalchemy import text
+
+    ddl = db.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": table_name},
+        execution_options=INTERNAL_EXECUTION
+    ).scalar()
+    return bool(ddl) and re.search(r"\)\s*WITHOUT\s+ROWID\s*;?\s*$", ddl, re.I) is not None
+
+
+@traced("db.sample_table")
+def sample_table(
+    table_name: str,
+    columns: Optional[list[str]] = None,
+    limit: int = 100,
+    percent: Optional[float] = None,
+    preview_chars: Optional[int] = None,
+    full_columns: Optional[list[str]] = None,
+    value_handles: bool = False
+) -> dict:
+    """
+    Lấy mẫu ngẫu nhiên có giới hạn từ một bảng thay vì SELECT ... LIMIT n
+    (luôn lấy các row đầu tiên).
+    - PostgreSQL: TABLESAMPLE SYSTEM (lấy mẫu theo block, không quét toàn bảng)
+    - MySQL: lọc RAND() < tỉ lệ
+    - SQLite: chọn rowid ngẫu nhiên (chỉ đọc rowid, không đọc toàn bộ row);
+      bảng WITHOUT ROWID dùng ORDER BY random()
+    Với PostgreSQL/MySQL, row được lấy dư rồi chọn ngẫu nhiên limit row.
+    Bảng nhỏ (hoặc percent = 100) dùng ORDER BY random() LIMIT; bảng chưa
+    có thống kê được đếm có giới hạn để biết có nhỏ không.
+    percent (0 < percent <= 100) ghi đè tỉ lệ lấy mẫu tự ước lượng từ catalog.
+    Giá trị TEXT/BLOB lớn được rút gọn như trong rows_to_dicts.
+    """
+    from sqlalchemy import text
+
+    if percent is not None and not 0 < percent <= 100:
+        raise ValueError(f"percent must be greater than 0 and at most 100, got {percent}")
+    limit = max(1, min(int(limit), MAX_SAMPLE_ROWS))
+    selected = _resolve_table_columns(table_name, columns)
+    column_sql = ", ".join(quote_identifier(column) for column in selected)
+    table_sql = quote_identifier(table_name)
+    dialect = engine.dialect.name
+
+    db = new_session()
+    try:
+        if percent is None and dialect in ("postgresql", "mysql"):
+            estimate = _estimate_row_count(db, table_name)
+            if estimate is None:
+                # Chưa ANALYZE: đếm có giới hạn; bảng lớn hơn ngưỡng thì coi như
+                # đúng bằng ngưỡng (tỉ lệ cao hơn cần thiết, phần dư bị bỏ khi trộn)
+                estimate = db.execute(
+                    text(f"SELECT COUNT(*) FROM (SELECT 1 FROM {table_sql} LIMIT :cap) AS counted"),
+                    {"cap": _SAMPLE_SMALL_TABLE_ROWS},
+                    execution_options=INTERNAL_EXECUTION
+                ).scalar()
+                if estimate < _SAMPLE_SMALL_TABLE_ROWS:
+                    percent = 100.0
+            if percent is None:
+                # Lấy dư gấp 3 lần vì lấy mẫu theo block có thể trả thiếu row
+                percent = min(100.0, limit * 3 * 100.0 / max(estimate, 1))
+
+        params: dict = {"limit": limit}
+        # Row lấy mẫu theo block trả về theo thứ tự vật lý: lấy dư rồi trộn,
+        # để LIMIT không nghiêng về các block đầu bảng
+        oversampled = False
+        if dialect == "postgresql" and percent is not None and percent < 100:
+            method = "tablesample_system"
+            query = f"SELECT {column_sql} FROM {table_sql} TABLESAMPLE SYSTEM (:percent) LIMIT :fetch_limit"
+            params.update(percent=percent, fetch_limit=limit * _SAMPLE_OVERSAMPLE)
+            oversampled = True
+        elif dialect == "mysql" and percent is not None and percent < 100:
+            method = "random_filter"
+            query = f"SELECT {column_sql} FROM {table_sql} WHERE RAND() < :fraction LIMIT :fetch_limit"
+            params.update(fraction=percent / 100.0, fetch_limit=limit * _SAMPLE_OVERSAMPLE)
+            oversampled = True
+        elif dialect == "sqlite" and not _sqlite_without_rowid(db, table_name):
+            method = "random_rowid"
+            query = (
+                f"SELECT {column_sql} FROM {table_sql} WHERE rowid IN "
+                f"(SELECT rowid FROM {table_sql} ORDER BY random() LIMIT :limit)"
+            )
+        else:
+            # Bảng nhỏ, percent = 100 hoặc bảng WITHOUT ROWID (SQLite): sắp xếp
+            # ngẫu nhiên toàn bảng, không lấy các row đầu theo thứ tự vật lý
+            method = "order_by_random"
+            random_sql = "RAND()" if dialect == "mysql" else "random()"
+            query = f"SELECT {column_sql} FROM {table_sql} ORDER BY {random_sql} LIMIT :limit"
+
+        result = db.execute(text(query), params)
+        fetched = result.fetchall()
+        if oversampled and len(fetched) > limit:
+            fetched = random.sample(fetched, limit)
+        rows = rows_to_dicts(list(result.keys()), fetched, preview_chars, full_columns, value_handles)
+        return {
+            "table_name": table_name,
+            "method": method,
+            "percent": percent,
+            "row_count": len(rows),
+            "rows": rows
+        }
+    except Exception as e:
+        db.rollback()
+        raise e
+    finally:
+        db.close()
+
+
+def _pg_stats_bounds(db: Session, table_name: str, column_types: dict[str, str]) -> dict[str, tuple]:
+    """
+    min/max của cột tính từ cả histogram_bounds lẫn most_common_vals: giá trị
+    phổ biến không nằm trong histogram, và histogram là NULL khi mọi giá trị
+    đều phổ biến. Phần tử được so sánh theo kiểu thật của cột, không theo text.
+    Lỗi thì trả về {} để dùng histogram_bounds như cũ.
+    """
+    from sqlalchemy import text
+
+    if not column_types:
+        return {}
+    parts = []
+    params: dict = {"table": table_name}
+    for index, (column, type_name) in enumerate(column_types.items()):
+        # type_name lấy từ format_type() nên đã được quote đúng cú pháp SQL
+        array_type = f"{type_name}[]"
+        parts.append(
+            f"SELECT CAST(:c{index} AS text) AS attname, MIN(v)::text AS min_value, MAX(v)::text AS max_value "
+            f"FROM pg_stats s, unnest(COALESCE(s.most_common_vals::text::{array_type}, '{{}}') "
+            f"|| COALESCE(s.histogram_bounds::text::{array_type}, '{{}}')) AS v "
+            f"WHERE s.schemaname = current_schema() AND s.tablename = :table AND s.attname = :c{index}"
+        )
+        params[f"c{index}"] = column
+    try:
+        with db.begin_nested():
+            rows = db.execute(text(" UNION ALL ".join(parts)), params, execution_options=INTERNAL_EXECUTION).fetchall()
+    except Exception as e:
+        logger.warning(f"Computing min/max from pg_stats of {table_name} failed: {e}")
+        return {}
+    return {row.attname: (row.min_value, row.max_value) for row in rows}
+
+
+def _profile_from_pg_stats(db: Session, table_name: str, columns: list[str], top_n: int) -> Optional[dict]:
+    """
+    Đọc thống kê cột từ pg_stats (do ANALYZE thu thập) thay vì quét bảng.
+    Trả về None nếu bảng chưa được ANALYZE.
+    """
+    from sqlalchemy import text, bindparam
+
+    row_count = _estimate_row_count(db, table_name)
+    if row_count is None:
+        return None
+
+    result = db.execute(
+        text(
+            "SELECT s.attname, s.null_frac, s.n_distinct, "
+            "s.most_common_vals::text::text[] AS common_values, "
+            "s.most_common_freqs AS common_freqs, "
+            "s.histogram_bounds::text::text[] AS bounds, "
+            # correlation chỉ có với kiểu có toán tử <, tức là có min/max
+            "s.correlation IS NOT NULL AND t.typcategory <> 'A' AS sortable, "
+            "format_type(a.atttypid, NULL) AS type_name "
+            "FROM pg_stats s "
+            "JOIN pg_attribute a ON a.attrelid = format('%I.%I', s.schemaname, s.tablename)::regclass "
+            "AND a.attname = s.attname "
+            "JOIN pg_type t ON t.oid = a.atttypid "
+            "WHERE s.schemaname = current_schema() "
+            "AND s.tablename = :table AND s.attname IN :columns"
+        ).bindparams(bindparam("columns", expanding=True)),
+        {"table": table_name, "columns": columns},
+        execution_options=INTERNAL_EXECUTION
+    )
+    stats = {row.attname: row for row in result}
+    if not stats:
+        return None
+    bounds_by_column = _pg_stats_bounds(
+        db, table_name, {column: row.type_name for column, row in stats.items() if row.sortable}
+    )
+
+    profile = {}
+    for column in columns:
+        row = stats.get(column)
+        if row is None:
+            profile[column] = {}
+            continue
+        # n_distinct âm nghĩa là tỉ lệ so với số row
+        distinct = row.n_distinct
+        if distinct is not None and distinct < 0:
+            distinct = round(-distinct * row_count)
+        bounds = row.bounds or []
+        low, high = bounds_by_column.get(column, (bounds[0], bounds[-1]) if bounds else (None, None))
+        top_values = [
+            {"value": value, "count": round(freq * row_count)}
+            for value, freq in zip(row.common_values or [], row.common_freqs or [])
+        ][:top_n]
+        profile[column] = {
+            "null_fraction": row.null_frac,
+            "distinct_count": int(distinct) if distinct is not None else None,
+            "min": low,
+            "max": high,
+            "top_values": top_values
+        }
+
+    return {"row_count": row_count, "source": "pg_stats", "columns": profile}
+
+
+def _profile_value(value: Any) -> Any:
+    """min/max/top value của profile: TEXT dài và binary được rút gọn như rows_to_dicts."""
+    if isinstance(value, (str, bytes, bytearray, memoryview)):
+        return preview_value(value, VALUE_PREVIEW_CHARS, BINARY_PREVIEW_BYTES)
+    return convert_value(value)
+
+
+def _profile_with_aggregates(db: Session, table_name: str, columns: list[str], top_n: int) -> dict:
+    """
+    Tính thống kê bằng một câu aggregate duy nhất cho cả bảng, cộng một câu
+    GROUP BY cho mỗi cột nếu cần top values.
+    """
+    from sqlalchemy import text, inspect, Boolean, JSON, LargeBinary, ARRAY
+
+    column_types = {
+        column["name"]: column["type"]
+        for column in inspect(internal_engine).get_columns(table_name)
+    }
+    table_sql = quote_identifier(table_name)
+
+    select_parts = ["COUNT(*) AS row_count"]
+    for index, column in enumerate(columns):
+        column_sql = quote_identifier(column)
+        column_type = column_types.get(column)
+        select_parts.append(f"COUNT({column_sql}) AS c{index}_non_null")
+        # Một số kiểu không hỗ trợ so sánh/DISTINCT trên mọi database
+        if isinstance(column_type, (JSON, LargeBinary, ARRAY)):
+            continue
+        select_parts.append(f"COUNT(DISTINCT {column_sql}) AS c{index}_distinct")
+        if not isinstance(column_type, Boolean):
+            select_parts.append(f"MIN({column_sql}) AS c{index}_min")
+            select_parts.append(f"MAX({column_sql}) AS c{index}_max")
+
+    aggregates = db.execute(
+        text(f"SELECT {', '.join(select_parts)} FROM {table_sql}")
+    ).mappings().one()
+    row_count = aggregates["row_count"]
+
+    profile = {}
+    for index, column in enumerate(columns):
+        non_null = aggregates[f"c{index}_non_null"]
+        profile[column] = {
+            "null_fraction": (row_count - non_null) / row_count if row_count else None,
+            "distinct_count": aggregates.get(f"c{index}_distinct"),
+            "min": _profile_value(aggregates.get(f"c{index}_min")),
+            "max": _profile_value(aggregates.get(f"c{index}_max")),
+            "top_values": []
+        }
+        if top_n > 0 and f"c{index}_distinct" in aggregates:
+            column_sql = quote_identifier(column)
+            result = db.execute(
+                text(
+                    f"SELECT {column_sql} AS value, COUNT(*) AS count FROM {table_sql} "
+                    f"WHERE {column_sql} IS NOT NULL GROUP BY {column_sql} "
+                    f"ORDER BY count DESC LIMIT :top_n"
+                ),
+                {"top_n": top_n}
+            )
+            profile[column]["top_values"] = [
+                {"value": _profile_value(row.value), "count": row.count}
+                for row in result
+            ]
+
+    return {"row_count": row_count, "source": "aggregate", "columns": profile}
+
+
+@traced("db.profile_table")
+def profile_table(
+    table_name: str,
+    columns: Optional[list[str]] = None,
+    top_n: int = 5,
+    use_catalog_stats: bool = True
+) -> dict:
+    """
+    Tính thống kê cột (null fraction, distinct count, min/max, top values)
+    ngay trên database, chỉ trả về bản tóm tắt nhỏ thay vì dữ liệu thô.
+    Trên PostgreSQL ưu tiên đọc pg_stats nếu bảng đã được ANALYZE.
+    """
+    selected = _resolve_table_columns(table_name, columns)
+    top_n = max(0, int(top_n))
+
+    db = new_session()
+    try:
+        profile = None
+        if use_catalog_stats and engine.dialect.name == "postgresql":
+            profile = _profile_from_pg_stats(db, table_name, selected, top_n)
+        if profile is not None:
+            # Cột chưa có dòng pg_stats (thêm sau lần ANALYZE cuối, hoặc
+            # attstattarget = 0) được tính bằng aggregate, chỉ riêng các cột đó
+            missing = [column for column, stats in profile["columns"].items() if not stats]
+            if missing:
+                fallback = _profile_with_aggregates(db, table_name, missing, top_n)
+                profile["columns"].update(fallback["columns"])
+                profile["aggregate_columns"] = missing
+        else:
+            profile = _profile_with_aggregates(db, table_name, selected, top_n)
+
+        return {"table_name": table_name, **profile}
+    except Exception as e:
+        db.rollback()
+        raise e
+    finally:
+        db.close()
+
+
+MAX_SCAN_ROWS = 10000
+
+
+def _resolve_scan_key(table_name: str, key: Optional[str] = None) -> tuple[str, list[str]]:
+    """
+    Chọn bộ cột duy nhất, không NULL để phân trang keyset: mặc định là primary
+    key (hoặc unique key NOT NULL đầu tiên), hoặc unique constraint/index có
+    tên key. Trả về (tên, danh sách cột).
+    """
+    from sqlalchemy import inspect
+
+    inspector = inspect(internal_engine)
+    if table_name not in inspector.get_table_names():
+        raise ValueError(f"Table '{table_name}' not found")
+    nullable = {column["name"]: column.get("nullable", True) for column in inspector.get_columns(table_name)}
+
+    usable: list[tuple[str, list[str]]] = []
+    pk = inspector.get_pk_constraint(table_name)
+    if pk and pk.get("constrained_columns"):
+        usable.append((pk.get("name") or "primary_key", pk["constrained_columns"]))
+    unique = [
+        (constraint.get("name") or f"unique({', '.join(constraint['column_names'])})", constraint["column_names"])
+        for constraint in inspector.get_unique_constraints(table_name)
+    ] + [
+        (index["name"], index["column_names"])
+        for index in inspector.get_indexes(table_name) if index.get("unique")
+    ]
+    for name, columns in unique:
+        # Cột nullable không dùng được: NULL không so sánh được trong điều kiện keyset
+        if columns and all(column and not nullable.get(column, True) for column in columns):
+            if all(name != existing for existing, _ in usable):
+                usable.append((name, columns))
+
+    if key is not None:
+        for name, columns in usable:
+            if name == key:
+                return name, columns
+        names = ", ".join(name for name, _ in usable) or "none"
+        raise ValueError(f"'{key}' is not a usable unique key of table '{table_name}' (available: {names})")
+    if not usable:
+        raise ValueError(f"Table '{table_name}' has no primary key or NOT NULL unique index to scan by")
+    return usable[0]
+
+
+def _encode_scan_token(table_name: str, key_columns: list[str], values: Sequence[Any]) -> str:
+    import base64
+    import json
+
+    payload = json.dumps({"t": table_name, "k": key_columns, "v": list(values)}, default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_scan_token(token: str, table_name: str, key_columns: list[str]) -> list[Any]:
+    import base64
+    import json
+
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        values = payload["v"]
+    except Exception:
+        raise ValueError("Invalid continuation token") from None
+    if payload.get("t") != table_name or payload.get("k") != key_columns or len(values) != len(key_columns):
+        raise ValueError("Continuation token belongs to a different table or key")
+    return values
+
+
+def _keyset_predicate(key_sql: list[str], prefix: str = "k", upper: bool = False) -> str:
+    """
+    Điều kiện "key > key của row cuối" (tham số :k0, :k1, ...) cho key một
+    hoặc nhiều cột; upper=True cho điều kiện cận trên "key <= ...".
+    """
+    operator = "<=" if upper else ">"
+    names = [f":{prefix}{i}" for i in range(len(key_sql))]
+    if len(key_sql) == 1:
+        return f"{key_sql[0]} {operator} {names[0]}"
+    if engine.dialect.name in ("postgresql", "sqlite"):
+        # Row value comparison dùng được index trên cả bộ cột
+        return f"({', '.join(key_sql)}) {operator} ({', '.join(names)})"
+    # MySQL tối ưu dạng OR lồng nhau tốt hơn row constructor
+    strict = "<" if upper else ">"
+    clauses = []
+    for i in range(len(key_sql)):
+        equal = [f"{key_sql[j]} = {names[j]}" for j in range(i)]
+        clauses.append("(" + " AND ".join(equal + [f"{key_sql[i]} {strict} {names[i]}"]) + ")")
+    if upper:
+        clauses.append("(" + " AND ".join(f"{column} = {name}" for column, name in zip(key_sql, names)) + ")")
+    return " OR ".join(clauses)
+
+
+@traced("db.scan_table")
+def scan_table(
+    table_name: str,
+    columns: Optional[list[str]] = None,
+    after: Optional[str] = None,
+    limit: int = 1000,
+    key: Optional[str] = None,
+    preview_chars: Optional[int] = None,
+    full_columns: Optional[list[str]] = None,
+    value_handles: bool = False
+) -> dict:
+    """
+    Duyệt bảng theo từng trang bằng keyset pagination: mỗi trang là
+    WHERE key > key_cuối ORDER BY key LIMIT n, nên chi phí mỗi trang không
+    tăng theo vị trí như OFFSET. after là continuation token của trang trước.
+    Giá trị TEXT/BLOB lớn được rút gọn như trong rows_to_dicts.
+    """
+    from sqlalchemy import text
+
+    limit = max(1, min(int(limit), MAX_SCAN_ROWS))
+    key_name, key_columns = _resolve_scan_key(table_name, key)
+    selected = _resolve_table_columns(table_name, columns)
+    # Cột key luôn được đọc để tạo continuation token
+    selected += [column for column in key_columns if column not in selected]
+
+    key_sql = [quote_identifier(column) for column in key_columns]
+    query = f"SELECT {', '.join(quote_identifier(column) for column in selected)} FROM {quote_identifier(table_name)}"
+    params: dict = {"limit": limit + 1}
+    if after:
+        values = _decode_scan_token(after, table_name, key_columns)
+        params.update({f"k{i}": value for i, value in enumerate(values)})
+        query += f" WHERE {_keyset_predicate(key_sql)}"
+    query += f" ORDER BY {', '.join(key_sql)} LIMIT :limit"
+
+    db = new_session()
+    try:
+        result = db.execute(text(query), params)
+        rows = result.fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_token = None
+        if has_more:
+            positions = [selected.index(column) for column in key_columns]
+            next_token = _encode_scan_token(table_name, key_columns, [rows[-1][i] for i in positions])
+        return {
+            "table_name": table_name,
+            "key": key_name,
+            "key_columns": key_columns,
+            "row_count": len(rows),
+            "has_more": has_more,
+            "next_token": next_token,
+            "rows": rows_to_dicts(selected, rows, preview_chars, full_columns, value_handles)
+        }
+    except Exception as e:
+        db.rollback()
+        raise e
+    finally:
+        db.close()
+
+
+MAX_WRITE_CHUNK_SIZE = 100000
+
+
+@traced("db.batched_write")
+def batched_write(
+    table_name: str,
+    operation: str,
+    where: str,
+    values: Optional[dict] = None,
+    params: Optional[dict] = None,
+    chunk_size: int = 1000,
+    pause_ms: int = 0,
+    max_chunks: Optional[int] = None,
+    resume_token: Optional[str] = None
+) -> dict:
+    """
+    Chạy UPDATE/DELETE lớn theo từng khoảng primary key, commit sau mỗi
+    khoảng, để không giữ lock trên cả bảng và không phình WAL/undo.
+
+    Mỗi chunk: tìm key cuối của chunk_size row tiếp theo thỏa where (đọc
+    index), rồi UPDATE/DELETE ... WHERE (where) AND key > key_trước AND
+    key <= key_cuối và commit. Nghỉ pause_ms giữa các chunk. Dừng sau
+    max_chunks chunk hoặc khi lỗi thì trả về resume_token để chạy tiếp.
+    """
+    from sqlalchemy import text
+    import time
+
+    operation = (operation or "").lower()
+    if operation not in ("update", "delete"):
+        raise ValueError("operation must be 'update' or 'delete'")
+    if not where or not where.strip():
+        raise ValueError("A where condition is required; use '1=1' to touch every row")
+    if ";" in where:
+        raise ValueError("The where condition must be a single SQL expression")
+    check_forbidden_operations(where)
+    chunk_size = max(1, min(int(chunk_size), MAX_WRITE_CHUNK_SIZE))
+
+    key_name, key_columns = _resolve_scan_key(table_name)
+    key_sql = [quote_identifier(column) for column in key_columns]
+    table_sql = quote_identifier(table_name)
+    params = dict(params or {})
+
+    if operation == "update":
+        if not values:
+            raise ValueError("values is required for update")
+        set_columns = _resolve_table_columns(table_name, list(values))
+        if set(set_columns) & set(key_columns):
+            raise ValueError("Key columns cannot be updated by batched_write")
+        set_sql = ", ".join(f"{quote_identifier(column)} = :set_{index}" for index, column in enumerate(set_columns))
+        params.update({f"set_{index}": values[column] for index, column in enumerate(set_columns)})
+        write_sql = f"UPDATE {table_sql} SET {set_sql}"
+    else:
+        write_sql = f"DELETE FROM {table_sql}"
+
+    last_key = _decode_scan_token(resume_token, table_name, key_columns) if resume_token else None
+    chunks = 0
+    rows_affected = 0
+    started = time.monotonic()
+
+    def _progress(status: str, **extra) -> dict:
+        token = _encode_scan_token(table_name, key_columns, last_key) if last_key is not None else None
+        return {
+            "status": status,
+            "table_name": table_name,
+            "operation": operation,
+            "key": key_name,
+            "chunks": chunks,
+            "rows_affected": rows_affected,
+            "elapsed_seconds": round(time.monotonic() - started, 3),
+            "resume_token": token,
+            **extra
+        }
+
+    db = new_session()
+    try:
+        while max_chunks is None or chunks < max_chunks:
+            lower_sql = ""
+            chunk_params = dict(params)
+            if last_key is not None:
+                lower_sql = f" AND ({_keyset_predicate(key_sql)})"
+                chunk_params.update({f"k{i}": value for i, value in enumerate(last_key)})
+
+            # Key cuối của chunk: row thứ chunk_size kể từ key trước, theo thứ tự key
+            boundary = db.execute(
+                text(
+                    f"SELECT {', '.join(key_sql)} FROM {table_sql} WHERE ({where}){lower_sql} "
+                    f"ORDER BY {', '.join(key_sql)} LIMIT 1 OFFSET :chunk_offset"
+                ),
+                {**chunk_params, "chunk_offset": chunk_size - 1}
+            ).fetchone()
+
+            upper_sql = ""
+            if boundary is not None:
+                upper_sql = f" AND ({_keyset_predicate(key_sql, prefix='u', upper=True)})"
+                chunk_params.update({f"u{i}": value for i, value in enumerate(boundary)})
+
+            result = db.execute(text(f"{write_sql} WHERE ({where}){lower_sql}{upper_sql}"), chunk_params)
+            db.commit()
+            chunks += 1
+            rows_affected += max(getattr(result, "rowcount", 0), 0)
+
+            if boundary is None:
+                # Chunk cuối: không còn đủ chunk_size row phía sau
+                last_key = None
+                logger.info(f"batched_write on {table_name} finished: {chunks} chunks, {rows_affected} rows")
+                return _progress("success", message=f"{operation.upper()} finished in {chunks} chunks. {rows_affected} rows affected.")
+
+            last_key = list(boundary)
+            logger.info(f"batched_write on {table_name}: chunk {chunks} committed ({rows_affected} rows so far)")
+            if pause_ms:
+                time.sleep(pause_ms / 1000)
+
+        return _progress(
+            "partial",
+            message=f"Stopped after {chunks} chunks ({rows_affected} rows affected). Pass resume_token to continue."
+        )
+    except Exception as e:
+        db.rollback()
+        logger.error(f"batched_write on {table_name} failed after {chunks} chunks: {e}")
+        return _progress(
+            "error",
+            error=str(e),
+            message=f"Failed after {chunks} committed chunks ({rows_affected} rows affected): {e}. "
+                    f"Pass resume_token to continue from the last committed chunk."
+        )
+    finally:
+        db.close()
+
+
+@traced("db.get_database_info")
 def get_database_info() -> dict:
     """
     Lấy thông tin tổng quan về database hiện tại.
     """
     from sqlalchemy import text
     
-    db = SessionLocal()
+    db = new_session()
     try:
         # Thông tin database
         db_info = {}
@@ -215,7 +1071,7 @@ def get_database_info() -> dict:
         
         # Lấy số lượng bảng
         from sqlalchemy import inspect
-        inspector = inspect(engine)
+        inspector = inspect(internal_engine)
         tables = inspector.get_table_names()
         db_info["table_count"] = len(tables)
         db_info["tables"] = tables
@@ -223,18 +1079,18 @@ def get_database_info() -> dict:
         # Thông tin version (tùy database type)
         try:
             if DATABASE_TYPE == "sqlite":
-                result = db.execute(text("SELECT sqlite_version()"))
+                result = db.execute(text("SELECT sqlite_version()"), execution_options=INTERNAL_EXECUTION)
                 version = result.scalar()
                 db_info["version"] = f"SQLite {version}"
             elif DATABASE_TYPE == "postgresql":
-                result = db.execute(text("SELECT version()"))
+                result = db.execute(text("SELECT version()"), execution_options=INTERNAL_EXECUTION)
                 version = result.scalar()
                 if version:
                     db_info["version"] = " ".join(version.split(" ")[0:2])
                 else:
                     db_info["version"] = "PostgreSQL Unknown"
             elif DATABASE_TYPE == "mysql":
-                result = db.execute(text("SELECT VERSION()"))
+                result = db.execute(text("SELECT VERSION()"), execution_options=INTERNAL_EXECUTION)
                 version = result.scalar()
                 db_info["version"] = f"MySQL {version}"
         except:
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+# File: app/health.py
+"""
+Health, readiness và diagnostics cho load balancer/orchestrator.
+
+- health: process còn sống, không chạm tới database
+- ready: lần ping database gần nhất thành công và còn mới, pool chưa bão
+  hòa, hàng đợi admission chưa đầy
+- diagnostics: mức dùng pool và các câu lệnh đang chạy
+
+Ping chạy trong task nền mỗi MCP_HEALTH_CHECK_INTERVAL giây, nên endpoint
+chỉ đọc kết quả đã cache và không bao giờ chờ một database chậm.
+"""
+
+import asyncio
+import itertools
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import event, text
+
+from app.config import HEALTH_CHECK_INTERVAL, HEALTH_CHECK_TIMEOUT, READY_MAX_POOL_UTILIZATION
+from app.db import engine, internal_engine
+from app.limits import ADMISSION_CONTROLLER
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Độ dài tối đa của câu SQL hiển thị trong diagnostics
+_STATEMENT_PREVIEW_CHARS = 200
+
+
+class InFlightTracker:
+    """Theo dõi các câu lệnh đang chạy qua event của engine."""
+
+    def __init__(self):
+        self._statements: dict[int, tuple[float, str]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def attach(self, target) -> None:
+        event.listen(target, "before_cursor_execute", self._before_execute)
+        event.listen(target, "after_cursor_execute", self._after_execute)
+        event.listen(target, "handle_error", self._on_error)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        statement_id = next(self._ids)
+        conn.info.setdefault("mcp_inflight", []).append(statement_id)
+        with self._lock:
+            self._statements[statement_id] = (time.monotonic(), statement)
+
+    def _finish(self, conn) -> None:
+        pending = conn.info.get("mcp_inflight")
+        if not pending:
+            return
+        statement_id = pending.pop()
+        with self._lock:
+            self._statements.pop(statement_id, None)
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self._finish(conn)
+
+    def _on_error(self, exception_context):
+        if exception_context.connection is not None:
+            self._finish(exception_context.connection)
+
+    def snapshot(self) -> list[dict]:
+        """Các câu lệnh đang chạy, lâu nhất trước."""
+        now = time.monotonic()
+        with self._lock:
+            statements = sorted(self._statements.values())
+        return [
+            {
+                "running_seconds": round(now - started, 3),
+                "statement": " ".join(statement.split())[:_STATEMENT_PREVIEW_CHARS],
+            }
+            for started, statement in statements
+        ]
+
+
+def pool_stats() -> dict:
+    """Mức dùng connection pool của worker hiện tại."""
+    pool = engine.pool
+    size = pool.size() if hasattr(pool, "size") else None
+    checked_out = pool.checkedout() if hasattr(pool, "checkedout") else 0
+    overflow = pool.overflow() if hasattr(pool, "overflow") else 0
+    max_overflow = getattr(pool, "_max_overflow", 0)
+    capacity = size + max(max_overflow, 0) if size is not None else None
+    return {
+        "class": type(pool).__name__,
+        "size": size,
+        "max_overflow": max_overflow,
+        "checked_out": checked_out,
+        "checked_in": pool.checkedin() if hasattr(pool, "checkedin") else None,
+        "overflow": overflow,
+        "utilization": round(checked_out / capacity, 3) if capacity else None,
+    }
+
+
+class HealthMonitor:
+    """Ping database ở nền và giữ kết quả gần nhất cho endpoint ready."""
+
+    def __init__(self, interval: float, timeout: float, max_pool_utilization: float):
+        self.interval = interval
+        self.timeout = timeout
+        self.max_pool_utilization = max_pool_utilization
+        self.started_at = time.time()
+        self.last_ok: Optional[bool] = None
+        self.last_checked: Optional[float] = None
+        self.last_latency_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._pinging = False
+
+    @staticmethod
+    def _ping() -> None:
+        with internal_engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+    async def check(self) -> None:
+        """Ping một lần; bỏ qua nếu lần ping trước vẫn đang treo."""
+        if self._pinging:
+            return
+        self._pinging = True
+        started = time.monotonic()
+        task = asyncio.ensure_future(asyncio.to_thread(self._ping))
+        try:
+            # shield: khi timeout, thread ping vẫn chạy nhưng không chặn vòng lặp
+            await asyncio.wait_for(asyncio.shield(task), self.timeout)
+            self.last_ok, self.last_error = True, None
+        except asyncio.TimeoutError:
+            self.last_ok, self.last_error = False, f"Database ping timed out after {self.timeout:g}s"
+        except Exception as e:
+            self.last_ok, self.last_error = False, str(e)
+        finally:
+            self.last_latency_ms = round((time.monotonic() - started) * 1000, 3)
+            self.last_checked = time.time()
+            if task.done():
+                self._pinging = False
+            else:
+                task.add_done_callback(self._ping_finished)
+        if not self.last_ok:
+            logger.warning(f"Database health check failed: {self.last_error}")
+
+    def _ping_finished(self, task: asyncio.Future) -> None:
+        self._pinging = False
+        if not task.cancelled():
+            task.exception()
+
+    async def run_periodically(self) -> None:
+        """Task nền cập nhật kết quả ping."""
+        while True:
+            await self.check()
+            await asyncio.sleep(self.interval)
+
+    def health(self) -> dict:
+        return {"status": "ok", "uptime_seconds": round(time.time() - self.started_at, 3)}
+
+    def readiness(self) -> tuple[bool, dict]:
+        """Trả về (ready, chi tiết) chỉ từ trạng thái đã cache."""
+        reasons = []
+        age = None if self.last_checked is None else time.time() - self.last_checked
+        if self.last_checked is None:
+            reasons.append("database not checked yet")
+        elif not self.last_ok:
+            reasons.append(f"database unreachable: {self.last_error}")
+        elif age > self.interval * 3 + self.timeout:
+            reasons.append(f"last database check is stale ({age:.1f}s old)")
+
+        pool = pool_stats()
+        if pool["utilization"] is not None and pool["utilization"] >= self.max_pool_utilization:
+            reasons.append(f"connection pool saturated ({pool['checked_out']} checked out)")
+
+        admission = ADMISSION_CONTROLLER.stats()
+        if admission["queued"] >= admission["queue_size"]:
+            reasons.append("admission queue is full")
+
+        ready = not reasons
+        return ready, {
+            "status": "ready" if ready else "not_ready",
+            "reasons": reasons,
+            "database": {
+                "ok": self.last_ok,
+                "latency_ms": self.last_latency_ms,
+                "checked_seconds_ago": None if age is None else round(age, 3),
+            },
+            "pool_utilization": pool["utilization"],
+        }
+
+    def diagnostics(self) -> dict:
+        return {
+            "pool": pool_stats(),
+            "in_flight": IN_FLIGHT.snapshot(),
+            "admission": ADMISSION_CONTROLLER.stats(),
+            "database": {
+                "ok": self.last_ok,
+                "latency_ms": self.last_latency_ms,
+                "last_error": self.last_error,
+                "last_checked": self.last_checked,
+            },
+        }
+
+
+IN_FLIGHT = InFlightTracker()
+IN_FLIGHT.attach(engine)
+
+HEALTH_MONITOR = HealthMonitor(HEALTH_CHECK_INTERVAL, HEALTH_CHECK_TIMEOUT, READY_MAX_POOL_UTILIZATION)
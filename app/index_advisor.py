@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+# File: app/index_advisor.py
+"""
+Gợi ý index từ workload thực tế đi qua server.
+
+Nguồn workload là các fingerprint trong app.query_stats (cộng thêm các câu
+SQL truyền trực tiếp). Với mỗi câu lệnh:
+1. Tách bảng/alias và các cột dùng trong WHERE, JOIN ... ON, ORDER BY
+   (phân tích bằng regex, đủ cho SQL do agent sinh ra, không cần parser).
+2. Dựng index ứng viên: cột so sánh bằng trước, một cột so sánh khoảng
+   (hoặc ORDER BY) sau cùng; bỏ ứng viên đã được index sẵn có bao phủ.
+3. EXPLAIN (nếu được) để biết bảng đang bị quét toàn bộ hay đã dùng index.
+4. Trên PostgreSQL có extension hypopg: tạo index giả định và so sánh cost
+   của plan trước/sau.
+
+Điểm lợi ích ước lượng = tổng thời gian của các câu lệnh hưởng lợi, nhân
+với hệ số theo kết quả EXPLAIN hoặc tỉ lệ giảm cost từ hypopg.
+"""
+
+import json
+import re
+from typing import Optional
+
+from sqlalchemy import inspect, text
+
+from app.db import engine, internal_engine, quote_identifier
+from app.logger import get_logger
+from app.query_stats import STATEMENT_STATS, fingerprint, merged_top
+from app.tracing import traced
+
+logger = get_logger(__name__)
+
+MAX_INDEX_COLUMNS = 3
+
+# Hệ số điểm theo EXPLAIN: bảng bị quét toàn bộ, không rõ, đã dùng index
+_SCAN_WEIGHT = {"scan": 1.0, None: 0.5, "index": 0.2}
+
+_STATEMENT_START = re.compile(r"^\s*(SELECT|UPDATE|DELETE|WITH)\b", re.I)
+_TABLE_REFERENCE = re.compile(
+    r"\b(?:FROM|JOIN|UPDATE)\s+([A-Za-z_][\w$]*(?:\.[A-Za-z_][\w$]*)?)(?:\s+(?:AS\s+)?([A-Za-z_]\w*))?",
+    re.I
+)
+_CLAUSE = re.compile(
+    r"\b(WHERE|ON|JOIN|GROUP\s+BY|ORDER\s+BY|LIMIT|OFFSET|HAVING|UNION|SET|RETURNING|FROM|SELECT|"
+    r"LEFT|RIGHT|INNER|OUTER|FULL|CROSS)\b",
+    re.I
+)
+_COLUMN = r"(?:([A-Za-z_]\w*)\.)?([A-Za-z_]\w*)"
+_PREDICATE = re.compile(
+    _COLUMN + r"\s*(=|<>|!=|<=|>=|<|>|\bNOT\s+IN\b|\bIN\b|\bNOT\s+LIKE\b|\bLIKE\b|\bBETWEEN\b|\bIS\b)\s*(?:" + _COLUMN + r")?",
+    re.I
+)
+_NOT_ALIASES = {
+    "where", "on", "join", "left", "right", "inner", "outer", "full", "cross", "group", "order",
+    "limit", "offset", "having", "union", "set", "returning", "using", "natural", "as",
+}
+_NOT_COLUMNS = {"null", "not", "and", "or", "true", "false", "select", "exists", "case", "when"}
+
+
+def _parse_statement(sql: str) -> dict:
+    """Bảng (theo alias), cột so sánh bằng/khoảng và cột ORDER BY của câu lệnh."""
+    aliases: dict[str, str] = {}
+    for match in _TABLE_REFERENCE.finditer(sql):
+        table = match.group(1).split(".")[-1]
+        aliases[table.lower()] = table
+        alias = match.group(2)
+        if alias and alias.lower() not in _NOT_ALIASES:
+            aliases[alias.lower()] = table
+
+    equality: list[tuple[Optional[str], str]] = []
+    ranges: list[tuple[Optional[str], str]] = []
+    order_by: list[tuple[Optional[str], str]] = []
+    parts = _CLAUSE.split(sql)
+    # re.split với group giữ lại keyword: [trước, kw1, đoạn1, kw2, đoạn2, ...]
+    for keyword, segment in zip(parts[1::2], parts[2::2]):
+        keyword = " ".join(keyword.upper().split())
+        if keyword in ("WHERE", "ON", "HAVING"):
+            for match in _PREDICATE.finditer(segment):
+                left = (match.group(1), match.group(2))
+                if left[1].lower() in _NOT_COLUMNS:
+                    continue
+                operator = " ".join(match.group(3).upper().split())
+                if operator in ("=", "IN", "IS"):
+                    equality.append(left)
+                    # Điều kiện join a.x = b.y: cả hai phía đều là ứng viên
+                    if match.group(5) and match.group(5).lower() not in _NOT_COLUMNS:
+                        equality.append((match.group(4), match.group(5)))
+                elif operator in ("<", ">", "<=", ">=", "BETWEEN", "LIKE"):
+                    ranges.append(left)
+        elif keyword == "ORDER BY":
+            for item in segment.split(","):
+                match = re.match(r"\s*" + _COLUMN, item)
+                if match:
+                    order_by.append((match.group(1), match.group(2)))
+    return {"aliases": aliases, "equality": equality, "ranges": ranges, "order_by": order_by}
+
+
+def _resolve_column(qualifier: Optional[str], column: str, parsed: dict, columns_by_table: dict) -> Optional[str]:
+    """Tìm bảng chứa cột; cột không gắn alias chỉ nhận khi đúng một bảng có nó."""
+    tables = set(parsed["aliases"].values())
+    if qualifier:
+        table = parsed["aliases"].get(qualifier.lower())
+        return table if table and column in columns_by_table.get(table, ()) else None
+    owners = [table for table in tables if column in columns_by_table.get(table, ())]
+    return owners[0] if len(owners) == 1 else None
+
+
+def _candidates(parsed: dict, columns_by_table: dict) -> dict[str, tuple[str, ...]]:
+    """Index ứng viên cho từng bảng của câu lệnh."""
+    per_table: dict[str, dict[str, list[str]]] = {}
+    for kind in ("equality", "ranges", "order_by"):
+        for qualifier, column in parsed[kind]:
+            table = _resolve_column(qualifier, column, parsed, columns_by_table)
+            if table is None:
+                continue
+            columns = per_table.setdefault(table, {"equality": [], "ranges": [], "order_by": []})[kind]
+            if column not in columns:
+                columns.append(column)
+
+    candidates = {}
+    for table, kinds in per_table.items():
+        columns = list(kinds["equality"])
+        # Chỉ một cột khoảng có ích sau các cột bằng; không có thì thử cột ORDER BY
+        tail = [column for column in kinds["ranges"] + kinds["order_by"] if column not in columns]
+        if tail:
+            columns.append(tail[0])
+        if columns:
+            candidates[table] = tuple(columns[:MAX_INDEX_COLUMNS])
+    return candidates
+
+
+def _existing_indexes(inspector, table: str) -> list[list[str]]:
+    indexes = [index["column_names"] for index in inspector.get_indexes(table)]
+    pk = inspector.get_pk_constraint(table)
+    if pk and pk.get("constrained_columns"):
+        indexes.append(pk["constrained_columns"])
+    indexes += [constraint["column_names"] for constraint in inspector.get_unique_constraints(table)]
+    return [index for index in indexes if index and all(index)]
+
+
+def _is_covered(candidate: tuple[str, ...], indexes: list[list[str]]) -> bool:
+    """Index sẵn có bắt đầu bằng đúng các cột của ứng viên (không kể thứ tự cột bằng)."""
+    return any(
+        len(index) >= len(candidate) and set(index[:len(candidate)]) == set(candidate)
+        for index in indexes
+    )
+
+
+def _explainable(sql: str) -> tuple[str, int]:
+    """Câu lệnh từ fingerprint (? thay cho literal), kèm số tham số."""
+    sql = sql.replace("(...)", "(?)")
+    return sql, sql.count("?")
+
+
+def _walk_pg_plan(plan: dict, scans: set, indexed: set) -> None:
+    relation = plan.get("Relation Name")
+    if relation:
+        (scans if plan.get("Node Type") == "Seq Scan" else indexed).add(relation)
+    for child in plan.get("Plans", []):
+        _walk_pg_plan(child, scans, indexed)
+
+
+def _explain(connection, sql: str) -> Optional[dict]:
+    """
+    EXPLAIN câu lệnh: trả về bảng bị quét toàn bộ, bảng dùng index và cost
+    (PostgreSQL). None nếu dialect/phiên bản không hỗ trợ EXPLAIN có tham số.
+    """
+    sql, param_count = _explainable(sql)
+    dialect = engine.dialect.name
+    scans: set = set()
+    indexed: set = set()
+    cost = None
+    try:
+        if dialect == "sqlite":
+            rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", (None,) * param_count).fetchall()
+            for row in rows:
+                detail = row[-1]
+                match = re.match(r"(SCAN|SEARCH)\s+(?:TABLE\s+)?(\w+)", detail)
+                if match:
+                    (scans if match.group(1) == "SCAN" and "INDEX" not in detail else indexed).add(match.group(2))
+        elif dialect == "postgresql":
+            if connection.dialect.server_version_info < (16,) and param_count:
+                return None
+            numbered = iter(range(1, param_count + 1))
+            sql = re.sub(r"\?", lambda _: f"${next(numbered)}", sql)
+            options = "GENERIC_PLAN, FORMAT JSON" if param_count else "FORMAT JSON"
+            plan = connection.exec_driver_sql(f"EXPLAIN ({options}) {sql}").scalar()
+            plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+            _walk_pg_plan(plan, scans, indexed)
+            cost = plan.get("Total Cost")
+        elif dialect == "mysql":
+            plan = connection.exec_driver_sql(f"EXPLAIN FORMAT=JSON {sql.replace('?', 'NULL')}").scalar()
+            for match in re.finditer(r'"table_name":\s*"(\w+)",\s*"access_type":\s*"(\w+)"', plan):
+                (scans if match.group(2) == "ALL" else indexed).add(match.group(1))
+        else:
+            return None
+    except Exception as e:
+        logger.debug(f"EXPLAIN failed for '{sql[:100]}': {e}")
+        connection.rollback()
+        return None
+    return {"scans": scans, "indexed": indexed, "cost": cost}
+
+
+def _hypopg_available(connection) -> bool:
+    if engine.dialect.name != "postgresql":
+        return False
+    return bool(connection.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'hypopg'")).scalar())
+
+
+def _hypothetical_improvement(connection, ddl: str, statements: list[dict]) -> Optional[float]:
+    """Tỉ lệ giảm cost (0-1) của các câu lệnh khi có index giả định, theo hypopg."""
+    before = [_explain(connection, statement["sql"]) for statement in statements]
+    connection.execute(text("SELECT * FROM hypopg_create_index(:ddl)"), {"ddl": ddl})
+    try:
+        after = [_explain(connection, statement["sql"]) for statement in statements]
+    finally:
+        connection.execute(text("SELECT hypopg_reset()"))
+
+    weighted_before = weighted_after = 0.0
+    for statement, plan_before, plan_after in zip(statements, before, after):
+        if plan_before and plan_after and plan_before["cost"] and plan_after["cost"] is not None:
+            weighted_before += plan_before["cost"] * statement["calls"]
+            weighted_after += plan_after["cost"] * statement["calls"]
+    if not weighted_before:
+        return None
+    return max(0.0, 1 - weighted_after / weighted_before)
+
+
+@traced("index_advisor.suggest_indexes")
+def suggest_indexes(
+    queries: Optional[list[str]] = None,
+    limit: int = 10,
+    min_calls: int = 1,
+    use_hypopg: bool = True
+) -> dict:
+    """
+    Đề xuất index cho workload đã quan sát (và các câu truyền vào), xếp
+    theo lợi ích ước lượng giảm dần.
+    """
+    workload = [
+        {"sql": entry["query"], "calls": entry["calls"], "total_ms": entry["total_ms"]}
+        for entry in merged_top(order_by="total_ms", limit=STATEMENT_STATS.max_entries)["statements"]
+        if entry["calls"] >= min_calls
+    ]
+    workload += [{"sql": fingerprint(query), "calls": 1, "total_ms": 0.0} for query in queries or []]
+    workload = [statement for statement in workload if _STATEMENT_START.match(statement["sql"])]
+
+    inspector = inspect(internal_engine)
+    user_tables = set(inspector.get_table_names())
+    columns_by_table: dict[str, set] = {}
+    existing: dict[str, list[list[str]]] = {}
+    suggestions: dict[tuple[str, tuple[str, ...]], dict] = {}
+
+    with internal_engine.connect() as connection:
+        for statement in workload:
+            parsed = _parse_statement(statement["sql"])
+            tables = [table for table in set(parsed["aliases"].values()) if table in user_tables]
+            if not tables:
+                continue
+            for table in tables:
+                if table not in columns_by_table:
+                    columns_by_table[table] = {column["name"] for column in inspector.get_columns(table)}
+                    existing[table] = _existing_indexes(inspector, table)
+
+            candidates = _candidates(parsed, columns_by_table)
+            if not candidates:
+                continue
+            plan = _explain(connection, statement["sql"])
+            for table, columns in candidates.items():
+                if _is_covered(columns, existing[table]):
+                    continue
+                access = None
+                if plan is not None:
+                    access = "scan" if table in plan["scans"] else "index" if table in plan["indexed"] else None
+                suggestion = suggestions.setdefault((table, columns), {
+                    "table_name": table,
+                    "columns": list(columns),
+                    "ddl": (
+                        f"CREATE INDEX {quote_identifier('ix_' + table + '_' + '_'.join(columns))} "
+                        f"ON {quote_identifier(table)} ({', '.join(quote_identifier(column) for column in columns)})"
+                    ),
+                    "score": 0.0,
+                    "calls": 0,
+                    "total_ms": 0.0,
+                    "full_scans": 0,
+                    "statements": [],
+                })
+                suggestion["score"] += max(statement["total_ms"], statement["calls"]) * _SCAN_WEIGHT[access]
+                suggestion["calls"] += statement["calls"]
+                suggestion["total_ms"] += statement["total_ms"]
+                suggestion["full_scans"] += int(access == "scan")
+                suggestion["statements"].append(statement)
+
+        hypopg = use_hypopg and _hypopg_available(connection)
+        ranked = sorted(suggestions.values(), key=lambda item: item["score"], reverse=True)[:max(1, int(limit))]
+        for suggestion in ranked:
+            if hypopg:
+                improvement = _hypothetical_improvement(connection, suggestion["ddl"], suggestion["statements"])
+                suggestion["hypothetical_cost_reduction"] = None if improvement is None else round(improvement, 3)
+                if improvement is not None:
+                    suggestion["score"] = max(suggestion["total_ms"], suggestion["calls"]) * improvement
+            suggestion["score"] = round(suggestion["score"], 3)
+            suggestion["total_ms"] = round(suggestion["total_ms"], 3)
+            suggestion["statements"] = [statement["sql"] for statement in suggestion["statements"][:5]]
+
+    ranked.sort(key=lambda item: item["score"], reverse=True)
+    return {
+        "analyzed_statements": len(workload),
+        "hypopg": hypopg,
+        "suggestions": ranked,
+        "message": f"{len(ranked)} candidate indexes from {len(workload)} statements."
+    }
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+# File: app/jobs.py
+"""
+Query job chạy nền cho truy vấn phân tích chạy lâu hơn timeout HTTP của client.
+
+submit trả về job_id ngay; truy vấn chạy trong thread pool riêng
+(MCP_MAX_JOB_WORKERS thread) nên không tranh slot với tool call interactive.
+Kết quả được stream xuống file NDJSON trong MCP_JOB_DIR (mỗi dòng một row
+dạng mảng) rồi đọc lại theo trang, nên bộ nhớ không phụ thuộc số row.
+
+Trạng thái job nằm trong status.json cạnh file kết quả, nên khi chạy nhiều
+worker thì worker nào cũng đọc được status và kết quả; lệnh hủy gửi tới
+worker khác được truyền qua file đánh dấu "cancel".
+"""
+
+import json
+import os
+import re
+import secrets
+import shutil
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Optional
+
+from sqlalchemy import text
+
+from app.config import JOB_DIR, JOB_RESULT_TTL, MAX_JOB_WORKERS, MAX_QUEUED_JOBS
+from app.db import convert_value, engine
+from app.logger import get_logger
+from app.shared_state import register_worker_stats
+from app.tracing import traced
+
+logger = get_logger(__name__)
+
+FINAL_STATUSES = ("succeeded", "failed", "cancelled")
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+# Ghi offset byte của mỗi _INDEX_STRIDE row để đọc trang bất kỳ mà không quét từ đầu
+_INDEX_STRIDE = 1000
+# Khoảng thời gian tối thiểu giữa hai lần ghi tiến độ vào status.json
+_PROGRESS_INTERVAL = 1.0
+_JOB_ID = re.compile(r"^[0-9a-f]{24}$")
+
+
+class JobNotFoundError(Exception):
+    """job_id không tồn tại hoặc kết quả đã hết hạn."""
+
+
+class JobQueueFullError(Exception):
+    """Đã có quá nhiều job đang chạy hoặc chờ."""
+
+
+class _JobCancelled(Exception):
+    pass
+
+
+class _LocalJob:
+    """Phần trạng thái chỉ có ở worker đang chạy job."""
+
+    def __init__(self):
+        self.cancel_event = threading.Event()
+        self.dbapi_connection: Any = None
+        self.future: Optional[Future] = None
+
+
+def _interrupt(dbapi_connection: Any) -> None:
+    """Dừng câu lệnh đang chạy trên connection (sqlite3 interrupt, psycopg2 cancel)."""
+    for method in ("interrupt", "cancel"):
+        func = getattr(dbapi_connection, method, None)
+        if callable(func):
+            func()
+            return
+
+
+class QueryJobManager:
+    """Nhận, chạy, theo dõi và hủy các query job."""
+
+    def __init__(self, job_dir: str, max_workers: int, max_queued: int, result_ttl: float):
+        self.job_dir = job_dir
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._jobs: dict[str, _LocalJob] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, job_id: str, name: str = "") -> str:
+        if not _JOB_ID.match(job_id or ""):
+            raise JobNotFoundError(f"Job '{job_id}' not found")
+        return os.path.join(self.job_dir, job_id, name)
+
+    def _read_status(self, job_id: str) -> dict:
+        try:
+            with open(self._path(job_id, "status.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise JobNotFoundError(f"Job '{job_id}' not found or its results expired") from None
+
+    def _write_status(self, job_id: str, status: dict) -> None:
+        # Ghi file tạm rồi đổi tên để worker khác không đọc phải file dở dang
+        path = self._path(job_id, "status.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(status, f, ensure_ascii=False, default=str)
+        os.replace(f"{path}.tmp", path)
+
+    def _cancel_requested(self, job_id: str, local: _LocalJob) -> bool:
+        return local.cancel_event.is_set() or os.path.exists(self._path(job_id, "cancel"))
+
+    def _finish(self, job_id: str, status: dict, state: str, error: Optional[str] = None) -> None:
+        status.update(status=state, error=error, finished_at=time.time())
+        self._write_status(job_id, status)
+        logger.info(f"Query job {job_id} {state} ({status['rows_fetched']} rows)")
+
+    def _run(self, job_id: str, query: str, params: dict, local: _LocalJob) -> None:
+        status = self._read_status(job_id)
+        if self._cancel_requested(job_id, local):
+            self._finish(job_id, status, "cancelled")
+            return
+
+        status.update(status="running", started_at=time.time())
+        self._write_status(job_id, status)
+        offsets: list[int] = []
+        part_path = self._path(job_id, "results.ndjson.part")
+        try:
+            with engine.connect() as connection:
+                local.dbapi_connection = connection.connection.dbapi_connection
+                try:
+                    result = connection.execution_options(
+                        stream_results=True, max_row_buffer=_INDEX_STRIDE
+                    ).execute(text(query), params)
+                    status["columns"] = list(result.keys())
+                    last_progress = time.monotonic()
+                    with open(part_path, "wb") as f:
+                        for partition in result.partitions(_INDEX_STRIDE):
+                            if self._cancel_requested(job_id, local):
+                                raise _JobCancelled()
+                            for row in partition:
+                                if status["rows_fetched"] % _INDEX_STRIDE == 0:
+                                    offsets.append(f.tell())
+                                f.write(json.dumps(
+                                    [convert_value(value) for value in row], ensure_ascii=False, default=str
+                                ).encode("utf-8") + b"\n")
+                                status["rows_fetched"] += 1
+                            if time.monotonic() - last_progress >= _PROGRESS_INTERVAL:
+                                self._write_status(job_id, status)
+                                last_progress = time.monotonic()
+                finally:
+                    local.dbapi_connection = None
+                    connection.rollback()
+
+            with open(self._path(job_id, "index.json"), "w", encoding="utf-8") as f:
+                json.dump({"stride": _INDEX_STRIDE, "offsets": offsets}, f)
+            os.replace(part_path, self._path(job_id, "results.ndjson"))
+            self._finish(job_id, status, "succeeded")
+        except Exception as e:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            if isinstance(e, _JobCancelled) or self._cancel_requested(job_id, local):
+                self._finish(job_id, status, "cancelled")
+            else:
+                logger.error(f"Query job {job_id} failed: {e}")
+                self._finish(job_id, status, "failed", str(e))
+
+    def _pending(self) -> int:
+        return sum(1 for local in self._jobs.values() if local.future is not None and not local.future.done())
+
+    @traced("jobs.submit")
+    def submit(self, query: str, params: Optional[dict] = None) -> dict:
+        """Đưa truy vấn vào hàng đợi và trả về job_id ngay."""
+        self.expire_finished()
+        with self._lock:
+            if self._pending() >= self.max_workers + self.max_queued:
+                raise JobQueueFullError(
+                    f"Too many query jobs running or queued (max {self.max_workers + self.max_queued}); retry later"
+                )
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="mcp-job")
+
+            job_id = secrets.token_hex(12)
+            os.makedirs(self._path(job_id), exist_ok=True)
+            self._write_status(job_id, {
+                "job_id": job_id,
+                "status": "queued",
+                "query": query,
+                "submitted_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "rows_fetched": 0,
+                "columns": None,
+                "error": None,
+            })
+            local = _LocalJob()
+            self._jobs[job_id] = local
+            local.future = self._executor.submit(self._run, job_id, query, params or {}, local)
+
+        logger.info(f"Submitted query job {job_id}")
+        return {
+            "status": "queued",
+            "job_id": job_id,
+            "message": f"Query job {job_id} submitted. Poll query_status, then fetch results in pages."
+        }
+
+    def status(self, job_id: str) -> dict:
+        """Trạng thái và tiến độ (số row đã lấy, thời gian chạy) của job."""
+        status = self._read_status(job_id)
+        started = status.get("started_at")
+        if started is not None:
+            status["elapsed_seconds"] = round((status.get("finished_at") or time.time()) - started, 3)
+        status["message"] = f"Job {job_id} is {status['status']}; {status['rows_fetched']} rows fetched so far."
+        if status["status"] == "failed":
+            status["message"] = f"Job {job_id} failed: {status['error']}"
+        return status
+
+    def fetch(self, job_id: str, offset: int = 0, limit: int = DEFAULT_PAGE_SIZE) -> dict:
+        """Đọc một trang kết quả của job đã xong."""
+        status = self._read_status(job_id)
+        if status["status"] != "succeeded":
+            raise ValueError(f"Job {job_id} is {status['status']}; results are available once it has succeeded")
+
+        offset = max(0, int(offset))
+        limit = min(max(1, int(limit)), MAX_PAGE_SIZE)
+        total = status["rows_fetched"]
+        rows = []
+        if offset < total:
+            with open(self._path(job_id, "index.json"), encoding="utf-8") as f:
+                index = json.load(f)
+            with open(self._path(job_id, "results.ndjson"), "rb") as f:
+                f.seek(index["offsets"][offset // index["stride"]])
+                for _ in range(offset % index["stride"]):
+                    f.readline()
+                for _ in range(min(limit, total - offset)):
+                    rows.append(dict(zip(status["columns"], json.loads(f.readline()))))
+
+        next_offset = offset + len(rows)
+        return {
+            "status": "success",
+            "job_id": job_id,
+            "columns": status["columns"],
+            "total_rows": total,
+            "offset": offset,
+            "row_count": len(rows),
+            "next_offset": next_offset if next_offset < total else None,
+            "rows": rows,
+            "message": f"Rows {offset}-{next_offset} of {total} from job {job_id}."
+        }
+
+    def cancel(self, job_id: str) -> dict:
+        """Hủy job đang chờ hoặc đang chạy (kể cả job do worker khác chạy)."""
+        status = self._read_status(job_id)
+        if status["status"] in FINAL_STATUSES:
+            return {
+                "status": status["status"],
+                "job_id": job_id,
+                "message": f"Job {job_id} already {status['status']}."
+            }
+
+        open(self._path(job_id, "cancel"), "w").close()
+        local = self._jobs.get(job_id)
+        if local is not None:
+            local.cancel_event.set()
+            if local.future is not None and local.future.cancel():
+                self._finish(job_id, status, "cancelled")
+            elif local.dbapi_connection is not None:
+                try:
+                    _interrupt(local.dbapi_connection)
+                except Exception as e:
+                    logger.warning(f"Could not interrupt query job {job_id}: {e}")
+        return {
+            "status": "cancelling",
+            "job_id": job_id,
+            "message": f"Cancellation requested for job {job_id}; poll query_status to confirm."
+        }
+
+    def expire_finished(self) -> list[str]:
+        """Xóa kết quả của các job đã xong quá result_ttl giây."""
+        with self._lock:
+            for job_id in [key for key, local in self._jobs.items() if local.future is not None and local.future.done()]:
+                del self._jobs[job_id]
+        if not os.path.isdir(self.job_dir):
+            return []
+
+        expired = []
+        cutoff = time.time() - self.result_ttl
+        for job_id in os.listdir(self.job_dir):
+            try:
+                status = self._read_status(job_id)
+            except (JobNotFoundError, ValueError):
+                continue
+            if status["status"] in FINAL_STATUSES and status["finished_at"] < cutoff:
+                shutil.rmtree(self._path(job_id), ignore_errors=True)
+                expired.append(job_id)
+        return expired
+
+    def shutdown(self) -> None:
+        """Hủy mọi job của worker này khi tắt server."""
+        for job_id in list(self._jobs):
+            try:
+                self.cancel(job_id)
+            except JobNotFoundError:
+                pass
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        running = sum(1 for local in self._jobs.values() if local.future is not None and local.future.running())
+        return {
+            "running": running,
+            "queued": self._pending() - running,
+            "max_workers": self.max_workers,
+            "max_queued": self.max_queued,
+        }
+
+
+JOB_MANAGER = QueryJobManager(JOB_DIR, MAX_JOB_WORKERS, MAX_QUEUED_JOBS, JOB_RESULT_TTL)
+register_worker_stats("jobs", JOB_MANAGER.stats)
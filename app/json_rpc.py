@@ -10,6 +10,7 @@ import json
 from fastapi.responses import JSONResponse
 from typing import Any, Optional, Union
 from pydantic import BaseModel, Field
+from app.tracing import start_span
 
 
 class JsonRpcRequest(BaseModel):
@@ -57,6 +58,11 @@ ERROR_CODES = {
     "METHOD_NOT_FOUND": -32601,
     "INVALID_PARAMS": -32602,
     "INTERNAL_ERROR": -32603,
+    # Mã lỗi riêng của server (khoảng -32000 đến -32099)
+    "SERVER_OVERLOADED": -32000,
+    "SESSION_LIMIT_REACHED": -32001,
+    "RATE_LIMITED": -32002,
+    "WORKER_MISMATCH": -32003,
 }
 
 
@@ -80,3 +86,13 @@ def create_success_response(
 ) -> JsonRpcResponse:
     """Tạo response thành công theo chuẩn JSON-RPC 2.0"""
     return JsonRpcResponse(result=result, id=request_id)
+
+
+def render_response(
+    response: Union[JsonRpcResponse, JsonRpcErrorResponse]
+) -> UnicodeJSONResponse:
+    """Encode response JSON-RPC thành HTTP response (đo trong span riêng)"""
+    with start_span("mcp.encode_response") as span:
+        rendered = UnicodeJSONResponse(content=response.model_dump())
+        span.set_attribute("http.response.body.size", len(rendered.body))
+        return rendered
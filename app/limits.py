@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# File: app/limits.py
+"""
+Admission control cho tool call.
+
+- Mỗi API key có token bucket (rate/burst) và giới hạn số tool call chạy
+  đồng thời; vượt giới hạn bị từ chối ngay.
+- Toàn server có MCP_MAX_CONCURRENT_QUERIES slot. Khi hết slot, request
+  xếp hàng theo độ ưu tiên (interactive trước bulk); hàng đợi đầy hoặc chờ
+  quá MCP_ADMISSION_TIMEOUT giây thì trả lỗi quá tải ngay, thay vì chờ
+  timeout của connection pool.
+
+Token bucket nằm trong app.shared_state nên rate limit áp dụng chung cho mọi
+worker khi dùng backend sqlite; số request đồng thời và slot tính theo từng
+worker. Trạng thái còn lại chỉ được truy cập từ event loop nên không cần lock.
+"""
+
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from app.auth import ApiClient
+from app.config import ADMISSION_QUEUE_SIZE, ADMISSION_TIMEOUT, MAX_CONCURRENT_QUERIES
+from app.logger import get_logger
+from app.shared_state import SHARED_STATE, MemoryBackend, register_worker_stats
+
+logger = get_logger(__name__)
+
+# Số nhỏ hơn được phục vụ trước
+PRIORITIES = {
+    "interactive": 0,
+    "bulk": 1,
+}
+
+
+class AdmissionError(Exception):
+    """Request bị từ chối trước khi chạy; retry_after là số giây nên chờ."""
+
+    error_code = "SERVER_OVERLOADED"
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = round(retry_after, 3)
+
+
+class RateLimitedError(AdmissionError):
+    """API key vượt rate limit hoặc số request đồng thời."""
+
+    error_code = "RATE_LIMITED"
+
+
+class OverloadedError(AdmissionError):
+    """Server hết slot và hàng đợi đầy hoặc chờ quá lâu."""
+
+    error_code = "SERVER_OVERLOADED"
+
+
+class AdmissionController:
+    """Giới hạn theo API key và hàng đợi ưu tiên cho slot toàn server."""
+
+    def __init__(self, max_concurrent: int, queue_size: int, timeout: float, state: Optional[object] = None):
+        self.max_concurrent = max_concurrent
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._state = state if state is not None else MemoryBackend()
+        self._active = 0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._client_active: dict[str, int] = {}
+        self._rejected = 0
+
+    async def _check_client(self, client: ApiClient) -> None:
+        name = client["name"]
+        key = f"rate:{name}"
+        if isinstance(self._state, MemoryBackend):
+            wait = self._state.take_token(key, client["rate"], client["burst"])
+        else:
+            # Backend dùng chung (SQLite) có thể chờ lock giữa các worker: không chặn event loop
+            wait = await asyncio.to_thread(self._state.take_token, key, client["rate"], client["burst"])
+        if wait:
+            raise RateLimitedError(f"Rate limit exceeded for client '{name}'", wait)
+        if self._client_active.get(name, 0) >= client["max_concurrent"]:
+            raise RateLimitedError(
+                f"Too many concurrent tool calls for client '{name}' (max {client['max_concurrent']})", 0.1
+            )
+
+    async def _acquire_slot(self, priority: int) -> None:
+        waiting = sum(1 for *_, future in self._waiters if not future.done())
+        if self._active < self.max_concurrent and waiting == 0:
+            self._active += 1
+            return
+        if waiting >= self.queue_size:
+            raise OverloadedError("Server is overloaded, admission queue is full", self.timeout)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        try:
+            # Slot được chuyển thẳng từ request vừa xong sang future này
+            await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            # Python >= 3.12: slot có thể được chuyển tới ngay trước khi timeout
+            # hủy task; không trả lại thì slot bị mất vĩnh viễn
+            if future.done() and not future.cancelled():
+                self._release_slot()
+            raise OverloadedError(
+                f"Server is overloaded, no free slot within {self.timeout:g}s", self.timeout
+            ) from None
+        except asyncio.CancelledError:
+            # Đã nhận slot nhưng request bị hủy: trả slot lại cho người khác
+            if future.done() and not future.cancelled():
+                self._release_slot()
+            raise
+
+    def _release_slot(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def admit(self, client: ApiClient, priority: str = "interactive") -> AsyncIterator[None]:
+        """Giữ một slot trong suốt tool call; raise AdmissionError nếu bị từ chối."""
+        name = client["name"]
+        try:
+            await self._check_client(client)
+            self._client_active[name] = self._client_active.get(name, 0) + 1
+            try:
+                await self._acquire_slot(PRIORITIES.get(priority, PRIORITIES["interactive"]))
+            except BaseException:
+                self._client_active[name] -= 1
+                raise
+        except AdmissionError as e:
+            self._rejected += 1
+            logger.warning(f"Rejected tool call from '{name}': {e}")
+            raise
+
+        try:
+            yield
+        finally:
+            self._client_active[name] -= 1
+            self._release_slot()
+
+    def stats(self) -> dict:
+        return {
+            "active": self._active,
+            "max_concurrent": self.max_concurrent,
+            "queued": sum(1 for *_, future in self._waiters if not future.done()),
+            "queue_size": self.queue_size,
+            "rejected": self._rejected,
+            "clients": {name: count for name, count in self._client_active.items() if count},
+        }
+
+
+ADMISSION_CONTROLLER = AdmissionController(
+    MAX_CONCURRENT_QUERIES, ADMISSION_QUEUE_SIZE, ADMISSION_TIMEOUT, state=SHARED_STATE
+)
+
+register_worker_stats("admission", ADMISSION_CONTROLLER.stats)
@@ -10,6 +10,14 @@ from app.logger import get_logger, setup_unified_logging, UNIFIED_LOGGING_CONFIG
 from app.db import get_db,init_db
 from app.api import router as api_router
 from app.mcp import router as mcp_router
+from app.config import COMPRESSION, COMPRESSION_MIN_SIZE, GRACEFUL_SHUTDOWN_TIMEOUT, HOST, PORT, RELOAD, WORKERS
+from app.compression import CompressionMiddleware
+from app.health import HEALTH_MONITOR
+from app.jobs import JOB_MANAGER
+from app.resources import CHANGE_MONITOR
+from app.sessions import SESSION_REGISTRY, expire_idle_periodically
+from app.shared_state import publish_worker_stats_periodically
+from app.transactions import TRANSACTION_REGISTRY
 
 # Setup unified logging before creating logger
 setup_unified_logging()
@@ -27,10 +35,25 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"Failed to initialize application: {e}")
     
+    session_reaper = asyncio.create_task(
+        expire_idle_periodically(SESSION_REGISTRY, TRANSACTION_REGISTRY)
+    )
+    stats_publisher = asyncio.create_task(publish_worker_stats_periodically())
+    health_checker = asyncio.create_task(HEALTH_MONITOR.run_periodically())
+    change_monitor = asyncio.create_task(CHANGE_MONITOR.run_periodically())
+    
     yield
     
     # App Shutdown
     try:
+        session_reaper.cancel()
+        stats_publisher.cancel()
+        health_checker.cancel()
+        change_monitor.cancel()
+        await asyncio.to_thread(CHANGE_MONITOR.close)
+        await asyncio.to_thread(JOB_MANAGER.shutdown)
+        await asyncio.to_thread(TRANSACTION_REGISTRY.close_all)
+        await asyncio.to_thread(SESSION_REGISTRY.close_all)
         logger.info("Application shutting down")
     except Exception as e:
         logger.error(f"Failed to shut down application: {e}")
@@ -38,6 +61,9 @@ async def lifespan(app: FastAPI):
 
 app = FastAPI(lifespan=lifespan)
 
+if COMPRESSION:
+    app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
 app.include_router(
     api_router,  # Import the API router from the app.api module
     prefix="/api",  # Set a prefix for all routes in this router
@@ -53,14 +79,24 @@ app.include_router(
 def main() -> None:
     """
     Hàm main khởi động server với cấu hình logging thống nhất.
+
+    Với MCP_WORKERS > 1, uvicorn chạy nhiều process worker; gửi SIGHUP cho
+    process chính để khởi động lại lần lượt các worker (ví dụ sau khi đổi
+    cấu hình) mà không làm rớt request đang chạy.
     """
     import uvicorn
     
+    # Nhiều worker hoặc reload cần app dạng import string
+    target = "app.main:app" if WORKERS > 1 or RELOAD else app
+    
     # Sử dụng unified logging config cho uvicorn
     uvicorn.run(
-        app, 
-        host="0.0.0.0", 
-        port=8000,
+        target, 
+        host=HOST, 
+        port=PORT,
+        workers=WORKERS,
+        reload=RELOAD,
+        timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_TIMEOUT,
         log_config=UNIFIED_LOGGING_CONFIG,  # Sử dụng unified config
         access_log=True  # Bật access log
     )
@@ -1,13 +1,30 @@
 # -*- coding: utf-8 -*-
 # File: app/mcp.py
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, HTTPException
 from typing import Callable, Dict, Any, Optional, Union
 import json
-from app.json_rpc import JsonRpcRequest, JsonRpcResponse, JsonRpcErrorResponse, create_success_response, create_error_response
+import asyncio
+from fastapi.responses import Response, StreamingResponse
+from app.json_rpc import JsonRpcRequest, JsonRpcResponse, JsonRpcErrorResponse, create_success_response, create_error_response, render_response
 from app.logger import get_logger
-from app.db import execute_query, execute_command, execute_transaction, get_table_info, get_database_info
-from app.auth import verify_mcp_api_key
+from app.db import execute_query, execute_command, execute_transaction, get_table_info, get_database_info, get_schema_summary, sample_table, profile_table, scan_table, batched_write
+from app.transfer import export_query, import_file, import_status
+from app.auth import ApiClient, verify_mcp_api_key
+from app.limits import ADMISSION_CONTROLLER, AdmissionError
+from app.tracing import request_context, start_span
+from app.config import COALESCE_READS, SESSION_REUSE
+from app.sessions import SESSION_REGISTRY, SessionLimitError, current_connection
+from app.coalesce import SINGLE_FLIGHT, coalesce_key, is_deterministic_sql
+from app.validation import InvalidParamsError, compile_validator
+from app.transactions import TRANSACTION_REGISTRY, begin_transaction, execute_in_transaction, commit_transaction, rollback_transaction
+from app.jobs import JOB_MANAGER, DEFAULT_PAGE_SIZE
+from app.query_stats import SORT_KEYS, STATEMENT_STATS, merged_top
+from app.index_advisor import suggest_indexes
+from app.snapshots import SNAPSHOT_STORE, DEFAULT_RESULT_ROWS as DEFAULT_SNAPSHOT_ROWS
+from app.resources import SUBSCRIPTIONS, ResourceNotFoundError, list_resources, read_resource
+from app.shared_state import WorkerMismatchError, check_handle_owner, claim_handle
+from app.values import VALUE_STORE, DEFAULT_CHUNK_SIZE
 
 
 logger = get_logger(__name__)
@@ -22,20 +39,49 @@ class ToolMeta(TypedDict):
     func: Callable
     description: str
     input_schema: dict
+    priority: str
+    coalesce: Union[bool, Callable[[dict], bool]]
+    validate: Callable[[Any], None]
 
 # Registry cho các tool MCP
 TOOL_HANDLERS: Dict[str, ToolMeta] = {}
 
-def register_tool(tool_name: str, description: str = "", input_schema: Optional[dict] = None, func: Optional[Callable] = None):
+# Tùy chọn rút gọn TEXT/BLOB lớn (xem app.db.rows_to_dicts), dùng chung cho các tool trả row
+VALUE_PREVIEW_PROPERTIES = {
+    "preview_chars": {
+        "type": "integer",
+        "minimum": 0,
+        "description": "Truncate text values longer than this many characters; 0 returns them whole (optional, server default otherwise)"
+    },
+    "full_columns": {
+        "type": "array",
+        "items": {"type": "string"},
+        "description": "Columns returned whole, without truncation (optional)"
+    },
+    "value_handles": {
+        "type": "boolean",
+        "description": "Attach a handle to truncated values so the full value can be read with fetch_value (optional)",
+        "default": False
+    }
+}
+
+def register_tool(tool_name: str, description: str = "", input_schema: Optional[dict] = None, func: Optional[Callable] = None, priority: str = "interactive", coalesce: Union[bool, Callable[[dict], bool]] = False):
     """
     Có thể dùng như decorator hoặc hàm thường.
     Dùng: @register_tool("name", description=..., input_schema=...)
+    priority: "interactive" hoặc "bulk" (bulk xếp sau khi server bận)
+    coalesce: tool chỉ đọc, các lời gọi trùng arguments đang chạy đồng thời được gộp;
+        có thể là hàm nhận arguments và trả về True nếu lời gọi được phép gộp
     """
     def decorator(f: Callable):
         TOOL_HANDLERS[tool_name] = {
             "func": f,
             "description": description,
-            "input_schema": input_schema or {}
+            "input_schema": input_schema or {},
+            "priority": priority,
+            "coalesce": coalesce,
+            # Biên dịch schema một lần, dùng lại cho mọi lời gọi
+            "validate": compile_validator(input_schema or {})
         }
         return f
     if func:
@@ -57,7 +103,7 @@ async def handle_initialize(params: Optional[Union[dict, list]] = None) -> Dict[
                 "listChanged": False
             },
             "resources": {
-                "subscribe": False,
+                "subscribe": True,
                 "listChanged": False
             },
             "logging": {}
@@ -93,6 +139,38 @@ async def handle_tools_list(params: Optional[Union[dict, list]] = None) -> Dict[
         })
     return {"tools": tools}
 
+async def handle_resources_list(params: Optional[Union[dict, list]] = None) -> Dict[str, Any]:
+    """
+    List resources (schema and one per table) - MCP standard method
+    """
+    return await asyncio.to_thread(list_resources)
+
+async def handle_resources_read(params: Optional[Union[dict, list]] = None) -> Dict[str, Any]:
+    """
+    Read the current content of a resource - MCP standard method
+    """
+    uri = params.get("uri", "") if isinstance(params, dict) else ""
+    return await asyncio.to_thread(read_resource, uri)
+
+async def handle_resources_subscribe(params: Optional[Union[dict, list]], mcp_session_id: str) -> Dict[str, Any]:
+    """
+    Subscribe the MCP session to change notifications of a resource, delivered on GET /mcp/ (SSE)
+    """
+    uri = params.get("uri", "") if isinstance(params, dict) else ""
+    # Subscription và luồng SSE nằm trong worker này: ghi nhận để worker khác báo lỗi rõ ràng
+    await asyncio.to_thread(SUBSCRIPTIONS.check_owner, mcp_session_id)
+    if SUBSCRIPTIONS.subscribe(mcp_session_id, uri):
+        await asyncio.to_thread(claim_handle, "subscription", mcp_session_id)
+    return {}
+
+async def handle_resources_unsubscribe(params: Optional[Union[dict, list]], mcp_session_id: Optional[str]) -> Dict[str, Any]:
+    """
+    Stop change notifications of a resource for the MCP session
+    """
+    if mcp_session_id and isinstance(params, dict):
+        SUBSCRIPTIONS.unsubscribe(mcp_session_id, params.get("uri", ""))
+    return {}
+
 @register_tool(
     "echo",
     description="Echoes back the provided message.",
@@ -164,7 +242,7 @@ async def tool_execute_command(arguments: dict) -> dict:
         }
     
     try:
-        result = execute_command(query, params)
+        result = await asyncio.to_thread(execute_command, query, params)
         return {
             "content": [
                 {
@@ -229,7 +307,7 @@ async def tool_execute_transaction(arguments: dict) -> dict:
         }
     
     try:
-        result = execute_transaction(queries)
+        result = await asyncio.to_thread(execute_transaction, queries)
         return {
             "content": [
                 {
@@ -254,22 +332,35 @@ async def tool_execute_transaction(arguments: dict) -> dict:
 
 @register_tool(
     "get_table_info",
-    description="Get information about database tables. If table_name is provided, get detailed column info.",
+    description="Get information about database tables. If table_name is provided, get detailed column info. Set full_schema to describe all (or the listed) tables in a single call.",
     input_schema={
         "type": "object",
         "properties": {
             "table_name": {
                 "type": "string",
                 "description": "Name of specific table to inspect (optional)"
+            },
+            "full_schema": {
+                "type": "boolean",
+                "description": "Return columns, primary keys and foreign keys for all tables at once (optional)",
+                "default": False
+            },
+            "table_names": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Restrict full_schema output to these tables (optional)"
             }
         }
-    }
+    },
+    coalesce=True
 )
 async def tool_get_table_info(arguments: dict) -> dict:
     table_name = arguments.get("table_name")
+    table_names = arguments.get("table_names")
+    full_schema = arguments.get("full_schema", False)
     
     try:
-        result = get_table_info(table_name)
+        result = await asyncio.to_thread(get_table_info, table_name, table_names, full_schema)
         
         if "error" in result:
             return {
@@ -281,7 +372,9 @@ async def tool_get_table_info(arguments: dict) -> dict:
                 ]
             }
         
-        if table_name:
+        if full_schema:
+            message = f"Schema for {result.get('table_count', 0)} tables retrieved successfully."
+        elif table_name:
             message = f"Table '{table_name}' information retrieved successfully."
         else:
             message = f"Found {result.get('table_count', 0)} tables in database."
@@ -308,17 +401,78 @@ async def tool_get_table_info(arguments: dict) -> dict:
             ]
         }
 
+@register_tool(
+    "get_schema_summary",
+    description="Get a compact DDL-like schema summary (one line per table). Supports table name filtering and paging for large databases.",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "pattern": {
+                "type": "string",
+                "description": "Glob pattern for table names, e.g. 'order*' (optional)"
+            },
+            "offset": {
+                "type": "integer",
+                "description": "Number of matching tables to skip (optional)",
+                "default": 0
+            },
+            "limit": {
+                "type": "integer",
+                "description": "Maximum number of tables to return (optional)",
+                "default": 100
+            }
+        }
+    },
+    coalesce=True
+)
+async def tool_get_schema_summary(arguments: dict) -> dict:
+    pattern = arguments.get("pattern")
+    offset = arguments.get("offset", 0)
+    limit = arguments.get("limit", 100)
+
+    try:
+        result = await asyncio.to_thread(get_schema_summary, pattern, offset, limit)
+        shown = result["total_tables"] if result["next_offset"] is None else result["next_offset"]
+        if not result["schema"]:
+            message = f"No tables on this page ({result['total_tables']} matching tables)."
+        else:
+            message = f"Tables {result['offset'] + 1}-{shown} of {result['total_tables']}."
+        if result["next_offset"] is not None:
+            message += f" Use offset={result['next_offset']} for the next page."
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": message
+                },
+                {
+                    "type": "text",
+                    "text": result["schema"]
+                }
+            ]
+        }
+    except Exception as e:
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Error getting schema summary: {str(e)}"
+                }
+            ]
+        }
+
 @register_tool(
     "get_database_info",
     description="Get general information about the current database (type, version, tables, etc.).",
     input_schema={
         "type": "object",
         "properties": {}
-    }
+    },
+    coalesce=True
 )
 async def tool_get_database_info(arguments: dict) -> dict:
     try:
-        result = get_database_info()
+        result = await asyncio.to_thread(get_database_info)
         return {
             "content": [
                 {
@@ -343,7 +497,7 @@ async def tool_get_database_info(arguments: dict) -> dict:
 
 @register_tool(
     "execute_query",
-    description="Execute SQL SELECT query and return results.",
+    description="Execute SQL SELECT query and return results. Concurrent identical calls share one execution and its result, unless the query uses a volatile function such as random(), nextval() or now().",
     input_schema={
         "type": "object",
         "properties": {
@@ -355,10 +509,12 @@ async def tool_get_database_info(arguments: dict) -> dict:
                 "type": "object",
                 "description": "Query parameters (optional)",
                 "default": {}
-            }
+            },
+            **VALUE_PREVIEW_PROPERTIES
         },
         "required": ["query"]
-    }
+    },
+    coalesce=lambda arguments: is_deterministic_sql(arguments.get("query", ""))
 )
 async def tool_execute_query(arguments: dict) -> dict:
     query = arguments.get("query", "")
@@ -375,7 +531,16 @@ async def tool_execute_query(arguments: dict) -> dict:
         }
     
     try:
-        results = execute_query(query, params)
+        results = await asyncio.to_thread(
+            execute_query,
+            query,
+            params,
+            arguments.get("preview_chars"),
+            arguments.get("full_columns"),
+            arguments.get("value_handles", False)
+        )
+        with start_span("mcp.encode_results", {"db.rows": len(results)}):
+            encoded = json.dumps(results, indent=2, ensure_ascii=False)
         return {
             "content": [
                 {
@@ -384,7 +549,7 @@ async def tool_execute_query(arguments: dict) -> dict:
                 },
                 {
                     "type": "text",
-                    "text": json.dumps(results, indent=2, ensure_ascii=False)
+                    "text": encoded
                 }
             ]
         }
@@ -398,61 +563,1259 @@ async def tool_execute_query(arguments: dict) -> dict:
             ]
         }
 
-async def handle_tools_call(params: Optional[Union[dict, list]] = None) -> Dict[str, Any]:
-    """
-    Call a tool - MCP standard method
-    """
-    logger.info("Handling 'tools/call' method")
-    if not params or not isinstance(params, dict):
-        return {"error": "Invalid parameters for tools/call"}
-
-    tool_name = params.get("name")
-    arguments = params.get("arguments", {})
+@register_tool(
+    "sample_table",
+    description="Return a bounded random sample of rows from a table (TABLESAMPLE on PostgreSQL, cheap random sampling elsewhere). Prefer this over SELECT * ... LIMIT to preview data.",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "table_name": {
+                "type": "string",
+                "description": "Table to sample"
+            },
+            "columns": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Columns to return (optional, default all columns)"
+            },
+            "limit": {
+                "type": "integer",
+                "description": "Maximum number of rows to return (optional, max 1000)",
+                "default": 100
+            },
+            "percent": {
+                "type": "number",
+                "description": "Sampling percentage, greater than 0 and at most 100 (optional, estimated from table statistics by default)"
+            },
+            **VALUE_PREVIEW_PROPERTIES
+        },
+        "required": ["table_name"]
+    }
+)
+async def tool_sample_table(arguments: dict) -> dict:
+    table_name = arguments.get("table_name", "")
+    columns = arguments.get("columns")
+    limit = arguments.get("limit", 100)
+    percent = arguments.get("percent")
 
-    if not tool_name:
-        return {"error": "Tool name is required"}
+    try:
+        result = await asyncio.to_thread(
+            sample_table,
+            table_name,
+            columns,
+            limit,
+            percent,
+            arguments.get("preview_chars"),
+            arguments.get("full_columns"),
+            arguments.get("value_handles", False)
+        )
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Sampled {result['row_count']} rows from '{table_name}' using {result['method']}."
+                },
+                {
+                    "type": "text",
+                    "text": json.dumps(result["rows"], indent=2, ensure_ascii=False)
+                }
+            ]
+        }
+    except Exception as e:
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Error sampling table: {str(e)}"
+                }
+            ]
+        }
 
-    meta = TOOL_HANDLERS.get(tool_name)
-    if not meta:
-        return {"error": f"Unknown tool: {tool_name}"}
-    return await meta["func"](arguments)
+@register_tool(
+    "profile_table",
+    description="Compute column statistics (null fraction, distinct count, min/max, top values) inside the database and return a small summary. Uses pg_stats on PostgreSQL when available; columns missing from pg_stats are computed with aggregates (listed in aggregate_columns). Long text values are truncated to previews.",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "table_name": {
+                "type": "string",
+                "description": "Table to profile"
+            },
+            "columns": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Columns to profile (optional, default all columns)"
+            },
+            "top_n": {
+                "type": "integer",
+                "description": "Number of most frequent values per column (optional, 0 to skip)",
+                "default": 5
+            },
+            "use_catalog_stats": {
+                "type": "boolean",
+                "description": "Use planner statistics instead of scanning when available (optional)",
+                "default": True
+            }
+        },
+        "required": ["table_name"]
+    },
+    coalesce=True
+)
+async def tool_profile_table(arguments: dict) -> dict:
+    table_name = arguments.get("table_name", "")
+    columns = arguments.get("columns")
+    top_n = arguments.get("top_n", 5)
+    use_catalog_stats = arguments.get("use_catalog_stats", True)
 
-@router.post("/")
-async def handle_request(request: JsonRpcRequest) -> Union[JsonRpcResponse, JsonRpcErrorResponse]:
-    """
-    Handle MCP JSON-RPC requests
-    """
     try:
-        method = request.method
-        params = request.params
-        
-        logger.info(f"Handling MCP request: {method}")
-        
-        # Direct method routing instead of registry
-        if method == "initialize":
-            result = await handle_initialize(params)
-        elif method == "notifications/initialized":
-            result = await handle_notifications_initialized(params)
-        elif method == "tools/list":
-            result = await handle_tools_list(params)
-        elif method == "tools/call":
-            result = await handle_tools_call(params)
-        else:
-            return create_error_response(
-                "METHOD_NOT_FOUND",
-                f"Method not found: {method}",
-                request.id,
-                None
-            )
-        
-        return create_success_response(result, request.id)
-        
+        result = await asyncio.to_thread(profile_table, table_name, columns, top_n, use_catalog_stats)
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Profiled {len(result['columns'])} columns of '{table_name}' from {result['source']}."
+                },
+                {
+                    "type": "text",
+                    "text": json.dumps(result, indent=2, ensure_ascii=False, default=str)
+                }
+            ]
+        }
     except Exception as e:
-        logger.error(f"Error handling MCP request {request.method}: {e}")
-        return create_error_response(
-            "INTERNAL_ERROR",
-            f"Internal error: {str(e)}",
-            request.id,
-            None
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Error profiling table: {str(e)}"
+                }
+            ]
+        }
+
+@register_tool(
+    "scan_table",
+    description="Walk a large table page by page in key order using keyset pagination (constant cost per page, unlike OFFSET). Pass next_token from the previous page as 'after' to continue.",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "table_name": {
+                "type": "string",
+                "description": "Table to scan"
+            },
+            "columns": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Columns to return (optional, default all columns; key columns are always included)"
+            },
+            "after": {
+                "type": "string",
+                "description": "Continuation token (next_token) returned by the previous page (optional)"
+            },
+            "limit": {
+                "type": "integer",
+                "description": "Rows per page (optional, max 10000)",
+                "default": 1000
+            },
+            "key": {
+                "type": "string",
+                "description": "Name of a NOT NULL unique constraint or index to order by (optional, default primary key)"
+            },
+            **VALUE_PREVIEW_PROPERTIES
+        },
+        "required": ["table_name"]
+    },
+    coalesce=True
+)
+async def tool_scan_table(arguments: dict) -> dict:
+    table_name = arguments.get("table_name", "")
+    columns = arguments.get("columns")
+    after = arguments.get("after")
+    limit = arguments.get("limit", 1000)
+    key = arguments.get("key")
+
+    try:
+        result = await asyncio.to_thread(
+            scan_table,
+            table_name,
+            columns,
+            after,
+            limit,
+            key,
+            arguments.get("preview_chars"),
+            arguments.get("full_columns"),
+            arguments.get("value_handles", False)
         )
+        more = f" Continue with after={result['next_token']}." if result["has_more"] else " End of table."
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Scanned {result['row_count']} rows from '{table_name}' by {result['key']}.{more}"
+                },
+                {
+                    "type": "text",
+                    "text": json.dumps(result, indent=2, ensure_ascii=False)
+                }
+            ]
+        }
+    except Exception as e:
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Error scanning table: {str(e)}"
+                }
+            ]
+        }
+
+@register_tool(
+    "export_query",
+    description="Stream the results of a SELECT query into a local CSV, NDJSON or Parquet file inside the server data directory. Returns the file path, row count and size instead of the rows.",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "query": {
+                "type": "string",
+                "description": "SQL SELECT query to export"
+            },
+            "path": {
+                "type": "string",
+                "description": "Output file path, relative to the server data directory"
+            },
+            "format": {
+                "type": "string",
+                "enum": ["csv", "ndjson", "parquet"],
+                "description": "Output format (optional, inferred from the file extension)"
+            },
+            "params": {
+                "type": "object",
+                "description": "Query parameters (optional)",
+                "default": {}
+            },
+            "batch_size": {
+                "type": "integer",
+                "description": "Rows fetched and written per batch (optional)",
+                "default": 10000
+            }
+        },
+        "required": ["query", "path"]
+    },
+    priority="bulk"
+)
+async def tool_export_query(arguments: dict) -> dict:
+    query = arguments.get("query", "")
+    path = arguments.get("path", "")
+    file_format = arguments.get("format")
+    params = arguments.get("params", {})
+    batch_size = arguments.get("batch_size", 10000)
+
+    if not query.strip().upper().startswith("SELECT"):
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": "Error: Only SELECT queries are allowed"
+                }
+            ]
+        }
+
+    try:
+        result = await asyncio.to_thread(export_query, query, path, file_format, params, batch_size)
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": result["message"]
+                },
+                {
+                    "type": "text",
+                    "text": json.dumps(result, indent=2, ensure_ascii=False)
+                }
+            ]
+        }
+    except Exception as e:
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Error exporting query: {str(e)}"
+                }
+            ]
+        }
+
+@register_tool(
+    "import_file",
+    description="Load a local CSV or NDJSON file (inside the server data directory) into a table in batches, committing after each batch. Failed imports can be resumed from the last committed batch; poll progress with import_status.",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "path": {
+                "type": "string",
+                "description": "Input file path, relative to the server data directory"
+            },
+            "table_name": {
+                "type": "string",
+                "description": "Target table"
+            },
+            "format": {
+                "type": "string",
+                "enum": ["csv", "ndjson"],
+                "description": "Input format (optional, inferred from the file extension)"
+            },
+            "create_table": {
+                "type": "boolean",
+                "description": "Create the table if it does not exist, inferring column types from the first batch (optional)",
+                "default": False
+            },
+            "column_types": {
+                "type": "object",
+                "description": "Explicit SQL types for new columns, e.g. {\"id\": \"INTEGER\"} (optional)"
+            },
+            "batch_size": {
+                "type": "integer",
+                "description": "Rows per committed batch (optional)",
+                "default": 1000
+            },
+            "resume": {
+                "type": "boolean",
+                "description": "Continue from the last committed batch of a previous failed import (optional)",
+                "default": False
+            }
+        },
+        "required": ["path", "table_name"]
+    },
+    priority="bulk"
+)
+async def tool_import_file(arguments: dict) -> dict:
+    path = arguments.get("path", "")
+    table_name = arguments.get("table_name", "")
+    file_format = arguments.get("format")
+    create_table = arguments.get("create_table", False)
+    column_types = arguments.get("column_types")
+    batch_size = arguments.get("batch_size", 1000)
+    resume = arguments.get("resume", False)
+
+    try:
+        result = await asyncio.to_thread(import_file, path, table_name, file_format, column_types, create_table, batch_size, resume)
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": result["message"]
+                },
+                {
+                    "type": "text",
+                    "text": json.dumps(result, indent=2, ensure_ascii=False)
+                }
+            ]
+        }
+    except Exception as e:
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Error importing file: {str(e)}"
+                }
+            ]
+        }
+
+@register_tool(
+    "import_status",
+    description="Return the progress of an import_file run from its checkpoint: committed batches, rows imported and bytes of the file read so far (with total_bytes). Status is none when no import is running or pending resume.",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "path": {
+                "type": "string",
+                "description": "Input file path passed to import_file"
+            }
+        },
+        "required": ["path"]
+    }
+)
+async def tool_import_status(arguments: dict) -> dict:
+    try:
+        return _message_tool_result(await asyncio.to_thread(import_status, arguments.get("path", "")))
+    except Exception as e:
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Error getting import status: {str(e)}"
+                }
+            ]
+        }
+
+async def _call_in_transaction(transaction_id: str, func: Callable, *args) -> dict:
+    """Run func while holding the transaction's pinned connection (one call at a time)"""
+    async with TRANSACTION_REGISTRY.use(transaction_id, create=False):
+        return await asyncio.to_thread(func, transaction_id, *args)
+
+def _message_tool_result(result: dict) -> dict:
+    return {
+        "content": [
+            {
+                "type": "text",
+                "text": result["message"]
+            },
+            {
+                "type": "text",
+                "text": json.dumps(result, indent=2, ensure_ascii=False)
+            }
+        ]
+    }
+
+@register_tool(
+    "batched_write",
+    description="Run a large UPDATE or DELETE in primary-key range chunks, committing after each chunk to avoid long locks. Returns progress and a resume_token when stopped early or on error.",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "table_name": {
+                "type": "string",
+                "description": "Table to modify"
+            },
+            "operation": {
+                "type": "string",
+                "enum": ["update", "delete"],
+                "description": "Write operation"
+            },
+            "where": {
+                "type": "string",
+                "description": "SQL condition selecting the rows, e.g. \"created_at < :cutoff\" (use '1=1' for all rows)"
+            },
+            "values": {
+                "type": "object",
+                "description": "Column values to set for update, e.g. {\"status\": \"archived\"}"
+            },
+            "params": {
+                "type": "object",
+                "description": "Parameters referenced by the where condition (optional)",
+                "default": {}
+            },
+            "chunk_size": {
+                "type": "integer",
+                "description": "Rows per committed chunk (optional)",
+                "default": 1000
+            },
+            "pause_ms": {
+                "type": "integer",
+                "description": "Pause between chunks in milliseconds (optional)",
+                "default": 0
+            },
+            "max_chunks": {
+                "type": "integer",
+                "description": "Stop after this many chunks and return a resume_token (optional)"
+            },
+            "resume_token": {
+                "type": "string",
+                "description": "Continue after the last committed chunk of a previous call (optional)"
+            }
+        },
+        "required": ["table_name", "operation", "where"]
+    },
+    priority="bulk"
+)
+async def tool_batched_write(arguments: dict) -> dict:
+    try:
+        result = await asyncio.to_thread(
+            batched_write,
+            arguments.get("table_name", ""),
+            arguments.get("operation", ""),
+            arguments.get("where", ""),
+            arguments.get("values"),
+            arguments.get("params", {}),
+            arguments.get("chunk_size", 1000),
+            arguments.get("pause_ms", 0),
+            arguments.get("max_chunks"),
+            arguments.get("resume_token")
+        )
+        return _message_tool_result(result)
+    except Exception as e:
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Error running batched write: {str(e)}"
+                }
+            ]
+        }
+
+@register_tool(
+    "begin_transaction",
+    description="Start an interactive transaction and return its transaction_id. Use execute_in_transaction, then commit_transaction or rollback_transaction. Idle transactions are rolled back automatically.",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "lock_timeout_ms": {
+                "type": "integer",
+                "description": "Maximum time to wait for locks inside the transaction (optional)"
+            }
+        }
+    }
+)
+async def tool_begin_transaction(arguments: dict) -> dict:
+    try:
+        return _message_tool_result(await asyncio.to_thread(begin_transaction, arguments.get("lock_timeout_ms")))
+    except Exception as e:
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Error starting transaction: {str(e)}"
+                }
+            ]
+        }
+
+@register_tool(
+    "execute_in_transaction",
+    description="Execute a SQL statement (read or write) inside an open transaction. Optionally create a savepoint first.",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "transaction_id": {
+                "type": "string",
+                "description": "Transaction returned by begin_transaction"
+            },
+            "query": {
+                "type": "string",
+                "description": "SQL statement to execute"
+            },
+            "params": {
+                "type": "object",
+                "description": "Query parameters (optional)",
+                "default": {}
+            },
+            "savepoint": {
+                "type": "string",
+                "description": "Create a savepoint with this name before executing (optional)"
+            },
+            **VALUE_PREVIEW_PROPERTIES
+        },
+        "required": ["transaction_id", "query"]
+    }
+)
+async def tool_execute_in_transaction(arguments: dict) -> dict:
+    transaction_id = arguments.get("transaction_id", "")
+    query = arguments.get("query", "")
+    params = arguments.get("params", {})
+    savepoint = arguments.get("savepoint")
+
+    if not query.strip():
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": "Error: Query cannot be empty"
+                }
+            ]
+        }
+
+    try:
+        result = await _call_in_transaction(
+            transaction_id,
+            execute_in_transaction,
+            query,
+            params,
+            savepoint,
+            arguments.get("preview_chars"),
+            arguments.get("full_columns"),
+            arguments.get("value_handles", False)
+        )
+        return _message_tool_result(result)
+    except Exception as e:
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Error executing in transaction: {str(e)}"
+                }
+            ]
+        }
+
+@register_tool(
+    "commit_transaction",
+    description="Commit an open transaction.",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "transaction_id": {
+                "type": "string",
+                "description": "Transaction returned by begin_transaction"
+            }
+        },
+        "required": ["transaction_id"]
+    }
+)
+async def tool_commit_transaction(arguments: dict) -> dict:
+    transaction_id = arguments.get("transaction_id", "")
+
+    try:
+        return _message_tool_result(await _call_in_transaction(transaction_id, commit_transaction))
+    except Exception as e:
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Error committing transaction: {str(e)}"
+                }
+            ]
+        }
+
+@register_tool(
+    "rollback_transaction",
+    description="Roll back an open transaction, or only back to a savepoint (the transaction then stays open).",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "transaction_id": {
+                "type": "string",
+                "description": "Transaction returned by begin_transaction"
+            },
+            "savepoint": {
+                "type": "string",
+                "description": "Roll back to this savepoint instead of the whole transaction (optional)"
+            }
+        },
+        "required": ["transaction_id"]
+    }
+)
+async def tool_rollback_transaction(arguments: dict) -> dict:
+    transaction_id = arguments.get("transaction_id", "")
+    savepoint = arguments.get("savepoint")
+
+    try:
+        return _message_tool_result(await _call_in_transaction(transaction_id, rollback_transaction, savepoint))
+    except Exception as e:
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Error rolling back transaction: {str(e)}"
+                }
+            ]
+        }
+
+@register_tool(
+    "submit_query",
+    description="Submit a long-running SQL SELECT query as a background job and return its job_id immediately. Poll query_status, then page through results with fetch_query_results.",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "query": {
+                "type": "string",
+                "description": "SQL SELECT query to run"
+            },
+            "params": {
+                "type": "object",
+                "description": "Query parameters (optional)",
+                "default": {}
+            }
+        },
+        "required": ["query"]
+    }
+)
+async def tool_submit_query(arguments: dict) -> dict:
+    query = arguments.get("query", "")
+    params = arguments.get("params", {})
+
+    if not query.strip().upper().startswith("SELECT"):
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": "Error: Only SELECT queries are allowed"
+                }
+            ]
+        }
+
+    try:
+        return _message_tool_result(await asyncio.to_thread(JOB_MANAGER.submit, query, params))
+    except Exception as e:
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Error submitting query: {str(e)}"
+                }
+            ]
+        }
+
+@register_tool(
+    "query_status",
+    description="Return the status (queued, running, succeeded, failed, cancelled) and progress of a query job.",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "job_id": {
+                "type": "string",
+                "description": "Job returned by submit_query"
+            }
+        },
+        "required": ["job_id"]
+    }
+)
+async def tool_query_status(arguments: dict) -> dict:
+    try:
+        return _message_tool_result(await asyncio.to_thread(JOB_MANAGER.status, arguments.get("job_id", "")))
+    except Exception as e:
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Error getting query status: {str(e)}"
+                }
+            ]
+        }
+
+@register_tool(
+    "fetch_query_results",
+    description="Fetch one page of rows from a succeeded query job. Use next_offset to get the following page.",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "job_id": {
+                "type": "string",
+                "description": "Job returned by submit_query"
+            },
+            "offset": {
+                "type": "integer",
+                "description": "Index of the first row to return (optional)",
+                "default": 0
+            },
+            "limit": {
+                "type": "integer",
+                "description": "Maximum number of rows to return (optional, max 5000)",
+                "default": DEFAULT_PAGE_SIZE
+            }
+        },
+        "required": ["job_id"]
+    }
+)
+async def tool_fetch_query_results(arguments: dict) -> dict:
+    job_id = arguments.get("job_id", "")
+    offset = arguments.get("offset", 0)
+    limit = arguments.get("limit", DEFAULT_PAGE_SIZE)
+
+    try:
+        return _message_tool_result(await asyncio.to_thread(JOB_MANAGER.fetch, job_id, offset, limit))
+    except Exception as e:
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Error fetching query results: {str(e)}"
+                }
+            ]
+        }
+
+@register_tool(
+    "cancel_query",
+    description="Cancel a queued or running query job.",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "job_id": {
+                "type": "string",
+                "description": "Job returned by submit_query"
+            }
+        },
+        "required": ["job_id"]
+    }
+)
+async def tool_cancel_query(arguments: dict) -> dict:
+    try:
+        return _message_tool_result(await asyncio.to_thread(JOB_MANAGER.cancel, arguments.get("job_id", "")))
+    except Exception as e:
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Error cancelling query: {str(e)}"
+                }
+            ]
+        }
+
+@register_tool(
+    "query_stats",
+    description="Show per-fingerprint statistics of statements executed through this server (calls, total/mean/p95 time, rows, errors), like pg_stat_statements, merged across all workers. The server's own catalog, health-check and statistics queries are not counted. Use it to find the queries worth optimizing.",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "order_by": {
+                "type": "string",
+                "enum": list(SORT_KEYS),
+                "description": "Sort key, descending (optional)",
+                "default": "total_ms"
+            },
+            "limit": {
+                "type": "integer",
+                "description": "Number of fingerprints to return (optional)",
+                "default": 20
+            },
+            "reset": {
+                "type": "boolean",
+                "description": "Clear the statistics of the worker handling this call after returning them (optional)",
+                "default": False
+            }
+        }
+    }
+)
+async def tool_query_stats(arguments: dict) -> dict:
+    order_by = arguments.get("order_by", "total_ms")
+    limit = arguments.get("limit", 20)
+
+    try:
+        result = await asyncio.to_thread(merged_top, order_by, limit)
+        if arguments.get("reset", False):
+            STATEMENT_STATS.reset()
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Top {len(result['statements'])} of {result['fingerprints']} statement fingerprints by {order_by} "
+                            f"({result['workers']} worker{'s' if result['workers'] != 1 else ''})."
+                },
+                {
+                    "type": "text",
+                    "text": json.dumps(result, indent=2, ensure_ascii=False)
+                }
+            ]
+        }
+    except Exception as e:
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Error getting query stats: {str(e)}"
+                }
+            ]
+        }
+
+@register_tool(
+    "suggest_indexes",
+    description="Propose candidate indexes from the observed workload (query_stats) and optional extra queries: columns used in WHERE/JOIN/ORDER BY that no existing index covers, checked with EXPLAIN and ranked by estimated benefit. On PostgreSQL with the hypopg extension, candidates are validated with hypothetical indexes. Nothing is created.",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "queries": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Extra SQL statements to analyze besides the recorded workload (optional)"
+            },
+            "limit": {
+                "type": "integer",
+                "minimum": 1,
+                "description": "Maximum number of suggestions (optional)",
+                "default": 10
+            },
+            "min_calls": {
+                "type": "integer",
+                "minimum": 1,
+                "description": "Ignore recorded statements called fewer times than this (optional)",
+                "default": 1
+            },
+            "use_hypopg": {
+                "type": "boolean",
+                "description": "Validate candidates with hypothetical indexes when hypopg is installed (optional)",
+                "default": True
+            }
+        }
+    },
+    priority="bulk"
+)
+async def tool_suggest_indexes(arguments: dict) -> dict:
+    try:
+        result = await asyncio.to_thread(
+            suggest_indexes,
+            arguments.get("queries"),
+            arguments.get("limit", 10),
+            arguments.get("min_calls", 1),
+            arguments.get("use_hypopg", True)
+        )
+        return _message_tool_result(result)
+    except Exception as e:
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Error suggesting indexes: {str(e)}"
+                }
+            ]
+        }
+
+@register_tool(
+    "snapshot_query",
+    description="Run a query once against the database and store its result in a local SQLite snapshot. Follow-up filtering, grouping and joins then run on the snapshot with query_snapshot instead of the primary database. Pass snapshot_id to add another table to an existing snapshot.",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "query": {
+                "type": "string",
+                "description": "SELECT query whose result is materialized"
+            },
+            "params": {
+                "type": "object",
+                "description": "Named parameters for the query (optional)"
+            },
+            "table_name": {
+                "type": "string",
+                "description": "Name of the table holding the result inside the snapshot (optional)",
+                "default": "result"
+            },
+            "snapshot_id": {
+                "type": "string",
+                "description": "Existing snapshot to add the table to (optional; a new snapshot is created otherwise)"
+            },
+            "index_columns": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Columns to index in the snapshot table for faster follow-up queries (optional)"
+            }
+        },
+        "required": ["query"]
+    },
+    priority="bulk"
+)
+async def tool_snapshot_query(arguments: dict) -> dict:
+    if not arguments.get("query", "").strip().upper().startswith("SELECT"):
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": "Error: Only SELECT queries are allowed"
+                }
+            ]
+        }
+
+    try:
+        result = await asyncio.to_thread(
+            SNAPSHOT_STORE.create,
+            arguments.get("query", ""),
+            arguments.get("params", {}),
+            arguments.get("table_name", "result"),
+            arguments.get("snapshot_id"),
+            arguments.get("index_columns")
+        )
+        return _message_tool_result(result)
+    except Exception as e:
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Error creating snapshot: {str(e)}"
+                }
+            ]
+        }
+
+@register_tool(
+    "query_snapshot",
+    description="Run a read-only SQL query (SQLite dialect) against a snapshot created by snapshot_query. Tables are the ones listed in the snapshot_query response.",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "snapshot_id": {
+                "type": "string",
+                "description": "Snapshot returned by snapshot_query"
+            },
+            "query": {
+                "type": "string",
+                "description": "SELECT query in SQLite syntax"
+            },
+            "params": {
+                "type": "object",
+                "description": "Named parameters for the query, referenced as :name (optional)"
+            },
+            "limit": {
+                "type": "integer",
+                "minimum": 1,
+                "description": "Maximum rows to return (optional)",
+                "default": DEFAULT_SNAPSHOT_ROWS
+            },
+            **VALUE_PREVIEW_PROPERTIES
+        },
+        "required": ["snapshot_id", "query"]
+    }
+)
+async def tool_query_snapshot(arguments: dict) -> dict:
+    try:
+        result = await asyncio.to_thread(
+            SNAPSHOT_STORE.query,
+            arguments.get("snapshot_id", ""),
+            arguments.get("query", ""),
+            arguments.get("params"),
+            arguments.get("limit", DEFAULT_SNAPSHOT_ROWS),
+            arguments.get("preview_chars"),
+            arguments.get("full_columns"),
+            arguments.get("value_handles", False)
+        )
+        return _message_tool_result(result)
+    except Exception as e:
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Error querying snapshot: {str(e)}"
+                }
+            ]
+        }
+
+@register_tool(
+    "drop_snapshot",
+    description="Delete a snapshot created by snapshot_query. Snapshots unused for a while are also removed automatically.",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "snapshot_id": {
+                "type": "string",
+                "description": "Snapshot returned by snapshot_query"
+            }
+        },
+        "required": ["snapshot_id"]
+    }
+)
+async def tool_drop_snapshot(arguments: dict) -> dict:
+    try:
+        return _message_tool_result(await asyncio.to_thread(SNAPSHOT_STORE.drop, arguments.get("snapshot_id", "")))
+    except Exception as e:
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Error dropping snapshot: {str(e)}"
+                }
+            ]
+        }
+
+@register_tool(
+    "fetch_value",
+    description="Read a truncated TEXT/BLOB value in chunks using the handle returned by execute_query with value_handles=true. Offsets are characters for text and bytes for binary (returned base64-encoded).",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "handle": {
+                "type": "string",
+                "description": "Handle of the truncated value"
+            },
+            "offset": {
+                "type": "integer",
+                "minimum": 0,
+                "description": "Start position (optional)",
+                "default": 0
+            },
+            "length": {
+                "type": "integer",
+                "minimum": 1,
+                "description": "Chunk size (optional)",
+                "default": DEFAULT_CHUNK_SIZE
+            }
+        },
+        "required": ["handle"]
+    }
+)
+async def tool_fetch_value(arguments: dict) -> dict:
+    try:
+        result = await asyncio.to_thread(
+            VALUE_STORE.fetch,
+            arguments.get("handle", ""),
+            arguments.get("offset", 0),
+            arguments.get("length", DEFAULT_CHUNK_SIZE)
+        )
+        return _message_tool_result(result)
+    except Exception as e:
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Error fetching value: {str(e)}"
+                }
+            ]
+        }
+
+async def handle_tools_call(params: Optional[Union[dict, list]] = None) -> Dict[str, Any]:
+    """
+    Call a tool - MCP standard method
+    """
+    logger.info("Handling 'tools/call' method")
+    if not params or not isinstance(params, dict):
+        return {"error": "Invalid parameters for tools/call"}
+
+    tool_name = params.get("name")
+    arguments = params.get("arguments", {})
+
+    if not tool_name:
+        return {"error": "Tool name is required"}
+
+    meta = TOOL_HANDLERS.get(tool_name)
+    if not meta:
+        return {"error": f"Unknown tool: {tool_name}"}
+    with start_span("mcp.tools_call", {"mcp.tool": tool_name}) as span:
+        # Không gộp khi request chạy trên connection được ghim (temp table, SET ... riêng của session)
+        coalesce = meta["coalesce"](arguments) if callable(meta["coalesce"]) else meta["coalesce"]
+        if coalesce and COALESCE_READS and current_connection() is None:
+            result, shared = await SINGLE_FLIGHT.do(
+                coalesce_key(tool_name, arguments), lambda: meta["func"](arguments)
+            )
+            span.set_attribute("mcp.coalesced", shared)
+            return result
+        return await meta["func"](arguments)
+
+async def dispatch_request(request: JsonRpcRequest, mcp_session_id: Optional[str] = None) -> Union[JsonRpcResponse, JsonRpcErrorResponse]:
+    """
+    Route a JSON-RPC request to its method handler and build the response model
+    """
+    try:
+        method = request.method
+        params = request.params
+        
+        logger.info(f"Handling MCP request: {method}")
+        
+        # Direct method routing instead of registry
+        if method == "initialize":
+            result = await handle_initialize(params)
+        elif method == "notifications/initialized":
+            result = await handle_notifications_initialized(params)
+        elif method == "tools/list":
+            result = await handle_tools_list(params)
+        elif method == "tools/call":
+            result = await handle_tools_call(params)
+        elif method == "resources/list":
+            result = await handle_resources_list(params)
+        elif method == "resources/read":
+            result = await handle_resources_read(params)
+        elif method == "resources/subscribe":
+            # Notification được gửi theo session nên client phải có Mcp-Session-Id
+            if not mcp_session_id:
+                return create_error_response(
+                    "INVALID_REQUEST",
+                    "resources/subscribe requires an Mcp-Session-Id header",
+                    request.id,
+                    None
+                )
+            result = await handle_resources_subscribe(params, mcp_session_id)
+        elif method == "resources/unsubscribe":
+            result = await handle_resources_unsubscribe(params, mcp_session_id)
+        else:
+            return create_error_response(
+                "METHOD_NOT_FOUND",
+                f"Method not found: {method}",
+                request.id,
+                None
+            )
+        
+        return create_success_response(result, request.id)
+        
+    except ResourceNotFoundError as e:
+        return create_error_response("INVALID_PARAMS", str(e), request.id, None)
+    except WorkerMismatchError as e:
+        return create_error_response("WORKER_MISMATCH", str(e), request.id, None)
+    except Exception as e:
+        logger.error(f"Error handling MCP request {request.method}: {e}")
+        return create_error_response(
+            "INTERNAL_ERROR",
+            f"Internal error: {str(e)}",
+            request.id,
+            None
+        )
+
+# Method chạy câu lệnh trên database nên phải qua admission control
+_ADMITTED_METHODS = ("tools/call", "resources/list", "resources/read")
+
+def _tool_priority(method: str, params: Optional[Union[dict, list]]) -> str:
+    """Priority of the tool targeted by a tools/call request (resource reads are interactive)"""
+    if method == "tools/call" and isinstance(params, dict):
+        meta = TOOL_HANDLERS.get(params.get("name"))
+        if meta:
+            return meta["priority"]
+    return "interactive"
+
+def _validate_tool_call(params: Optional[Union[dict, list]]) -> None:
+    """
+    Check tool arguments against the tool's input_schema before admission,
+    session pinning or any database work. Unknown tools are left to handle_tools_call.
+    """
+    if isinstance(params, dict):
+        meta = TOOL_HANDLERS.get(params.get("name"))
+        if meta:
+            meta["validate"](params.get("arguments", {}))
+
+async def _dispatch_with_session(request: JsonRpcRequest, mcp_session_id: Optional[str]) -> Union[JsonRpcResponse, JsonRpcErrorResponse]:
+    """
+    Dispatch a request, running tool calls of the same MCP session on its pinned connection
+    """
+    if SESSION_REUSE and mcp_session_id and request.method == "tools/call":
+        try:
+            async with SESSION_REGISTRY.use(mcp_session_id):
+                return await dispatch_request(request, mcp_session_id)
+        except SessionLimitError as e:
+            return create_error_response("SESSION_LIMIT_REACHED", str(e), request.id, None)
+        except WorkerMismatchError as e:
+            return create_error_response("WORKER_MISMATCH", str(e), request.id, None)
+    return await dispatch_request(request, mcp_session_id)
+
+@router.post("/", response_model=Union[JsonRpcResponse, JsonRpcErrorResponse])
+async def handle_request(
+    request: JsonRpcRequest,
+    mcp_session_id: Optional[str] = Header(None, alias="Mcp-Session-Id"),
+    client: ApiClient = Depends(verify_mcp_api_key)
+) -> Response:
+    """
+    Handle MCP JSON-RPC requests
+    """
+    with request_context(request.id), start_span("mcp.handle_request", {"rpc.method": request.method}):
+        # Subscription resource cần Mcp-Session-Id nên luôn cấp id khi initialize;
+        # connection chỉ được ghim theo id khi bật MCP_SESSION_REUSE
+        if request.method == "initialize" and not mcp_session_id:
+            mcp_session_id = SESSION_REGISTRY.new_key()
+
+        if request.method in _ADMITTED_METHODS:
+            # Arguments sai bị từ chối trước khi chiếm slot hay connection nào
+            # Request chạm database đi qua admission control; bị từ chối thì trả lỗi ngay
+            try:
+                if request.method == "tools/call":
+                    _validate_tool_call(request.params)
+                async with ADMISSION_CONTROLLER.admit(client, _tool_priority(request.method, request.params)):
+                    response = await _dispatch_with_session(request, mcp_session_id)
+            except InvalidParamsError as e:
+                response = create_error_response("INVALID_PARAMS", str(e), request.id, {"errors": e.errors})
+            except AdmissionError as e:
+                response = create_error_response(e.error_code, str(e), request.id, {"retry_after": e.retry_after})
+        else:
+            response = await _dispatch_with_session(request, mcp_session_id)
+
+        rendered = render_response(response)
+        if mcp_session_id:
+            rendered.headers["Mcp-Session-Id"] = mcp_session_id
+        return rendered
+
+@router.get("/")
+async def notification_stream(mcp_session_id: Optional[str] = Header(None, alias="Mcp-Session-Id")) -> StreamingResponse:
+    """
+    Server-sent events stream delivering resource change notifications of an MCP session
+    """
+    if not mcp_session_id:
+        raise HTTPException(status_code=400, detail="Mcp-Session-Id header is required")
+    try:
+        await asyncio.to_thread(SUBSCRIPTIONS.check_owner, mcp_session_id)
+    except WorkerMismatchError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return StreamingResponse(
+        SUBSCRIPTIONS.stream(mcp_session_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "Mcp-Session-Id": mcp_session_id}
+    )
+
+@router.delete("/")
+async def terminate_session(mcp_session_id: Optional[str] = Header(None, alias="Mcp-Session-Id")) -> dict:
+    """
+    Terminate an MCP session and return its pinned connection to the pool
+    """
+    if mcp_session_id:
+        SUBSCRIPTIONS.remove_session(mcp_session_id)
+    released = bool(mcp_session_id) and await asyncio.to_thread(SESSION_REGISTRY.release, mcp_session_id)
+    if mcp_session_id and not released:
+        try:
+            await asyncio.to_thread(check_handle_owner, SESSION_REGISTRY.name, mcp_session_id)
+        except WorkerMismatchError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "terminated" if released else "not_found"}
 
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+# File: app/query_stats.py
+"""
+Thống kê câu lệnh theo fingerprint, tương tự pg_stat_statements nhưng cho
+traffic đi qua server này (mọi câu lệnh chạy trên engine của app.db).
+
+Fingerprint là câu SQL đã bỏ literal (chuỗi, số, tham số bind) và chuẩn hóa
+khoảng trắng, nên các lần gọi chỉ khác giá trị được gộp chung. Mỗi
+fingerprint giữ số lần gọi, tổng/trung bình/p95 thời gian, số row, số lỗi.
+Số fingerprint có giới hạn; khi đầy, fingerprint lâu không gặp nhất bị bỏ.
+
+Câu lệnh của chính server (reflect catalog, health check, bộ đếm thay đổi,
+đọc thống kê...) chạy với execution option mcp_internal (xem
+app.db.internal_engine) và không được tính.
+
+Mỗi worker giữ số liệu riêng và publish qua trạng thái dùng chung;
+merged_top() gộp số liệu của mọi worker còn sống. p95 khi gộp nhiều worker
+tính trên các mẫu gần nhất mà mỗi worker publish nên là xấp xỉ.
+"""
+
+import functools
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+from sqlalchemy import event
+
+from app.config import QUERY_STATS, QUERY_STATS_MAX_ENTRIES
+from app.db import INTERNAL_OPTION, engine
+from app.shared_state import collect_namespace, register_worker_stats, worker_id
+
+# Số mẫu thời gian gần nhất giữ lại để tính p95 cho mỗi fingerprint
+_LATENCY_SAMPLES = 200
+_EXAMPLE_CHARS = 500
+# Số mẫu thời gian mỗi fingerprint được publish cho worker khác (giữ snapshot nhỏ)
+_PUBLISHED_SAMPLES = 50
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_BIND_PARAMS = re.compile(r"(?<!:):[A-Za-z_]\w*|%\([^)]+\)s|%s|\$\d+|\?")
+_IN_LISTS = re.compile(r"\b(IN)\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.I)
+_WHITESPACE = re.compile(r"\s+")
+
+SORT_KEYS = ("total_ms", "mean_ms", "p95_ms", "calls", "errors", "rows")
+
+
+def _is_internal(execution_context) -> bool:
+    return execution_context is not None and bool(execution_context.execution_options.get(INTERNAL_OPTION))
+
+
+@functools.lru_cache(maxsize=4096)
+def fingerprint(statement: str) -> str:
+    """Chuẩn hóa câu SQL: bỏ comment, thay literal/tham số bằng ?, gộp IN (...)."""
+    normalized = _COMMENTS.sub(" ", statement)
+    normalized = _STRINGS.sub("?", normalized)
+    normalized = _BIND_PARAMS.sub("?", normalized)
+    normalized = _NUMBERS.sub("?", normalized)
+    normalized = _IN_LISTS.sub(r"\1 (...)", normalized)
+    return _WHITESPACE.sub(" ", normalized).strip()
+
+
+class _Entry:
+    __slots__ = ("query", "example", "calls", "errors", "rows", "total_ms", "min_ms", "max_ms", "samples", "last_seen")
+
+    def __init__(self, query: str, example: str):
+        self.query = query
+        self.example = example[:_EXAMPLE_CHARS]
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.min_ms: Optional[float] = None
+        self.max_ms = 0.0
+        self.samples: deque = deque(maxlen=_LATENCY_SAMPLES)
+        self.last_seen = 0.0
+
+    def to_dict(self) -> dict:
+        return _summarize(
+            self.query, self.example, self.calls, self.errors, self.rows,
+            self.total_ms, self.min_ms, self.max_ms, self.samples, self.last_seen
+        )
+
+    def snapshot(self) -> dict:
+        """Dạng JSON được publish cho worker khác, kèm các mẫu thời gian gần nhất."""
+        return {
+            "query": self.query,
+            "example": self.example,
+            "calls": self.calls,
+            "errors": self.errors,
+            "rows": self.rows,
+            "total_ms": self.total_ms,
+            "min_ms": self.min_ms,
+            "max_ms": self.max_ms,
+            "samples": list(self.samples)[-_PUBLISHED_SAMPLES:],
+            "last_seen": self.last_seen,
+        }
+
+
+def _summarize(query, example, calls, errors, rows, total_ms, min_ms, max_ms, samples, last_seen) -> dict:
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))] if samples else None
+    return {
+        "query": query,
+        "example": example,
+        "calls": calls,
+        "errors": errors,
+        "rows": rows,
+        "total_ms": round(total_ms, 3),
+        "mean_ms": round(total_ms / calls, 3) if calls else None,
+        "min_ms": round(min_ms, 3) if min_ms is not None else None,
+        "max_ms": round(max_ms, 3),
+        "p95_ms": round(p95, 3) if p95 is not None else None,
+        "last_seen": last_seen,
+    }
+
+
+def _check_order_by(order_by: str) -> None:
+    if order_by not in SORT_KEYS:
+        raise ValueError(f"order_by must be one of {', '.join(SORT_KEYS)}")
+
+
+class QueryStats:
+    """Bảng thống kê có giới hạn, cập nhật từ event của SQLAlchemy engine."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+        self._evicted = 0
+        self._since = time.time()
+
+    def attach(self, target) -> None:
+        event.listen(target, "before_cursor_execute", self._before_execute)
+        event.listen(target, "after_cursor_execute", self._after_execute)
+        event.listen(target, "handle_error", self._on_error)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not _is_internal(context):
+            conn.info.setdefault("mcp_query_start", []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("mcp_query_start")
+        if started and not _is_internal(context):
+            self.record(statement, (time.perf_counter() - started.pop()) * 1000, getattr(cursor, "rowcount", -1))
+
+    def _on_error(self, exception_context):
+        conn = exception_context.connection
+        started = conn.info.get("mcp_query_start") if conn is not None else None
+        if started and exception_context.statement and not _is_internal(exception_context.execution_context):
+            self.record(exception_context.statement, (time.perf_counter() - started.pop()) * 1000, error=True)
+
+    def record(self, statement: str, duration_ms: float, rows: int = -1, error: bool = False) -> None:
+        key = fingerprint(statement)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(key, statement)
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._evicted += 1
+            else:
+                self._entries.move_to_end(key)
+            entry.calls += 1
+            entry.errors += error
+            # rowcount = -1 khi driver không biết (ví dụ SELECT trên SQLite)
+            entry.rows += max(rows, 0)
+            entry.total_ms += duration_ms
+            entry.min_ms = duration_ms if entry.min_ms is None else min(entry.min_ms, duration_ms)
+            entry.max_ms = max(entry.max_ms, duration_ms)
+            entry.samples.append(duration_ms)
+            entry.last_seen = time.time()
+
+    def top(self, order_by: str = "total_ms", limit: int = 20) -> dict:
+        """Top fingerprint của worker này theo order_by, giảm dần."""
+        _check_order_by(order_by)
+        with self._lock:
+            entries = [entry.to_dict() for entry in self._entries.values()]
+            evicted = self._evicted
+        entries.sort(key=lambda entry: entry[order_by] or 0, reverse=True)
+        return {
+            "since": self._since,
+            "fingerprints": len(entries),
+            "max_entries": self.max_entries,
+            "evicted": evicted,
+            "order_by": order_by,
+            "statements": entries[:max(1, int(limit))],
+        }
+
+    def snapshot(self) -> dict:
+        """Số liệu của worker này để publish qua trạng thái dùng chung."""
+        with self._lock:
+            entries = [entry.snapshot() for entry in self._entries.values()]
+            evicted = self._evicted
+        return {"since": self._since, "max_entries": self.max_entries, "evicted": evicted, "entries": entries}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._evicted = 0
+            self._since = time.time()
+
+
+def merge_snapshots(snapshots: dict[str, dict], order_by: str = "total_ms", limit: int = 20) -> dict:
+    """Gộp snapshot của nhiều worker theo fingerprint, trả về top theo order_by."""
+    _check_order_by(order_by)
+    merged: dict[str, dict] = {}
+    for snapshot in snapshots.values():
+        for entry in snapshot["entries"]:
+            total = merged.get(entry["query"])
+            if total is None:
+                merged[entry["query"]] = dict(entry, samples=list(entry["samples"]))
+                continue
+            for key in ("calls", "errors", "rows", "total_ms"):
+                total[key] += entry[key]
+            if entry["min_ms"] is not None:
+                total["min_ms"] = entry["min_ms"] if total["min_ms"] is None else min(total["min_ms"], entry["min_ms"])
+            total["max_ms"] = max(total["max_ms"], entry["max_ms"])
+            total["samples"] += entry["samples"]
+            total["last_seen"] = max(total["last_seen"], entry["last_seen"])
+
+    entries = [
+        _summarize(
+            entry["query"], entry["example"], entry["calls"], entry["errors"], entry["rows"],
+            entry["total_ms"], entry["min_ms"], entry["max_ms"], entry["samples"], entry["last_seen"]
+        )
+        for entry in merged.values()
+    ]
+    entries.sort(key=lambda entry: entry[order_by] or 0, reverse=True)
+    return {
+        "since": min((snapshot["since"] for snapshot in snapshots.values()), default=time.time()),
+        "workers": len(snapshots),
+        "fingerprints": len(entries),
+        "max_entries": max((snapshot["max_entries"] for snapshot in snapshots.values()), default=0),
+        "evicted": sum(snapshot["evicted"] for snapshot in snapshots.values()),
+        "order_by": order_by,
+        "statements": entries[:max(1, int(limit))],
+    }
+
+
+STATEMENT_STATS = QueryStats(QUERY_STATS_MAX_ENTRIES)
+# Snapshot lớn hơn các số liệu khác nên không nằm trong /api/workers
+register_worker_stats("query_stats", STATEMENT_STATS.snapshot, listed=False)
+
+
+def merged_top(order_by: str = "total_ms", limit: int = 20) -> dict:
+    """Top fingerprint của mọi worker còn sống; chỉ một worker thì dùng số liệu đầy đủ."""
+    snapshots = collect_namespace("query_stats")
+    if set(snapshots) <= {worker_id()}:
+        return dict(STATEMENT_STATS.top(order_by, limit), workers=1)
+    return merge_snapshots(snapshots, order_by, limit)
+
+if QUERY_STATS:
+    STATEMENT_STATS.attach(engine)
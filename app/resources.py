@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+# File: app/resources.py
+"""
+MCP resources cho schema và từng bảng, kèm subscription báo thay đổi.
+
+Resource:
+- db://schema: schema rút gọn của toàn database (text).
+- db://tables/{table}: cột, khóa chính, khóa ngoại của một bảng (JSON).
+
+Client gọi resources/subscribe (cần header Mcp-Session-Id) rồi mở GET /mcp/
+để nhận notifications/resources/updated qua SSE, thay vì chạy lại
+execute_query để dò thay đổi. ChangeMonitor phát hiện thay đổi bằng cách
+so sánh bộ đếm rẻ theo từng bảng sau mỗi MCP_RESOURCE_POLL_INTERVAL giây:
+- PostgreSQL: n_tup_ins/upd/del trong pg_stat_user_tables; nếu bảng có
+  trigger gọi pg_notify(MCP_NOTIFY_CHANNEL, tên bảng) thì LISTEN báo ngay
+  không chờ thống kê được flush.
+- MySQL: UPDATE_TIME, TABLE_ROWS trong information_schema.TABLES.
+- SQLite: PRAGMA data_version trên một connection giữ riêng, tăng khi
+  connection khác (kể cả tiến trình khác) commit; không biết bảng nào
+  thay đổi nên mọi bảng đang subscribe đều được báo.
+- Mọi dialect: số câu INSERT/UPDATE/DELETE chạy qua engine của server.
+
+Subscription và luồng SSE nằm trong worker nhận request, giống connection
+được ghim của MCP session: với MCP_WORKERS > 1, subscribe và GET /mcp/
+tới worker khác worker giữ subscription nhận WorkerMismatchError. Khi luồng
+SSE của session đóng, subscription của session bị gỡ.
+"""
+
+import asyncio
+import json
+import re
+import threading
+from collections import defaultdict
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import event, inspect, text
+
+from app.config import NOTIFY_CHANNEL, RESOURCE_POLL_INTERVAL
+from app.db import engine, get_schema_summary, get_table_info, internal_engine, quote_identifier
+from app.logger import get_logger
+from app.shared_state import check_handle_owner, register_worker_stats, release_handle
+
+logger = get_logger(__name__)
+
+SCHEMA_URI = "db://schema"
+TABLE_URI_PREFIX = "db://tables/"
+
+# Gửi comment SSE định kỳ để proxy không đóng kết nối rảnh
+_KEEPALIVE_SECONDS = 15
+# Số notification chờ gửi tối đa mỗi session; notification trùng uri được gộp
+_MAX_PENDING = 100
+
+_WRITE_STATEMENT = re.compile(
+    r"^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM|TRUNCATE(?:\s+TABLE)?)"
+    r"\s+((?:[`\"\[]?[\w$]+[`\"\]]?\.)?[`\"\[]?[\w$]+[`\"\]]?)",
+    re.I
+)
+
+
+class ResourceNotFoundError(Exception):
+    """uri không trỏ tới resource nào."""
+
+
+def table_uri(table_name: str) -> str:
+    return f"{TABLE_URI_PREFIX}{table_name}"
+
+
+def _table_from_uri(uri: str) -> Optional[str]:
+    return uri[len(TABLE_URI_PREFIX):] if uri.startswith(TABLE_URI_PREFIX) else None
+
+
+def list_resources() -> dict:
+    """Resource có sẵn: schema và mỗi bảng một resource."""
+    resources = [{
+        "uri": SCHEMA_URI,
+        "name": "schema",
+        "description": "Compact schema of all tables",
+        "mimeType": "text/plain"
+    }]
+    for table in sorted(inspect(internal_engine).get_table_names()):
+        resources.append({
+            "uri": table_uri(table),
+            "name": table,
+            "description": f"Columns and keys of table {table}",
+            "mimeType": "application/json"
+        })
+    return {"resources": resources}
+
+
+def read_resource(uri: str) -> dict:
+    """Nội dung hiện tại của resource."""
+    if uri == SCHEMA_URI:
+        summary = get_schema_summary(limit=100000)
+        return {"contents": [{"uri": uri, "mimeType": "text/plain", "text": summary["schema"]}]}
+
+    table = _table_from_uri(uri or "")
+    if table is not None:
+        info = get_table_info(table)
+        if "error" not in info:
+            return {"contents": [{
+                "uri": uri,
+                "mimeType": "application/json",
+                "text": json.dumps(info, indent=2, ensure_ascii=False, default=str)
+            }]}
+    raise ResourceNotFoundError(f"Resource not found: {uri}")
+
+
+class WriteCounters:
+    """Đếm câu lệnh ghi theo bảng, cập nhật từ event của SQLAlchemy engine."""
+
+    def __init__(self):
+        self._counts: dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def attach(self, target) -> None:
+        event.listen(target, "after_cursor_execute", self._after_execute)
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        match = _WRITE_STATEMENT.match(statement)
+        if match:
+            table = match.group(1).split(".")[-1].strip('`"[]')
+            with self._lock:
+                self._counts[table.lower()] += 1
+
+    def get(self, table: str) -> int:
+        with self._lock:
+            return self._counts.get(table.lower(), 0)
+
+
+WRITE_COUNTERS = WriteCounters()
+WRITE_COUNTERS.attach(engine)
+
+
+class SubscriptionManager:
+    """Subscription theo MCP session và hàng đợi notification cho luồng SSE."""
+
+    def __init__(self):
+        self._subscriptions: dict[str, set[str]] = {}
+        self._pending: dict[str, dict[str, None]] = {}
+        self._wakeups: dict[str, asyncio.Event] = {}
+
+    def subscribe(self, session_id: str, uri: str) -> bool:
+        """Thêm subscription; trả về True nếu đây là subscription đầu tiên của session."""
+        if uri != SCHEMA_URI and _table_from_uri(uri) is None:
+            raise ResourceNotFoundError(f"Resource not found: {uri}")
+        new_session = session_id not in self._subscriptions
+        self._subscriptions.setdefault(session_id, set()).add(uri)
+        logger.info(f"Session {session_id} subscribed to {uri}")
+        return new_session
+
+    def unsubscribe(self, session_id: str, uri: str) -> None:
+        self._subscriptions.get(session_id, set()).discard(uri)
+
+    def remove_session(self, session_id: str) -> None:
+        self._drop_session(session_id)
+        wakeup = self._wakeups.pop(session_id, None)
+        if wakeup is not None:
+            wakeup.set()
+
+    def _drop_session(self, session_id: str) -> None:
+        if self._subscriptions.pop(session_id, None) is not None:
+            try:
+                # Không chặn event loop (kể cả khi luồng SSE đang bị cancel)
+                asyncio.get_running_loop().run_in_executor(None, release_handle, "subscription", session_id)
+            except RuntimeError:
+                release_handle("subscription", session_id)
+        self._pending.pop(session_id, None)
+
+    def check_owner(self, session_id: str) -> None:
+        """Báo lỗi nếu subscription của session nằm ở worker khác (gọi ngoài event loop)."""
+        if session_id not in self._subscriptions:
+            check_handle_owner("subscription", session_id)
+
+    def subscribed_uris(self) -> set[str]:
+        return set().union(*self._subscriptions.values()) if self._subscriptions else set()
+
+    def publish(self, uri: str) -> int:
+        """Xếp notification cho mọi session đã subscribe uri; trả về số session."""
+        notified = 0
+        for session_id, uris in self._subscriptions.items():
+            if uri not in uris:
+                continue
+            pending = self._pending.setdefault(session_id, {})
+            if len(pending) >= _MAX_PENDING and uri not in pending:
+                # Quá nhiều notification chưa gửi: bỏ cái cũ nhất
+                pending.pop(next(iter(pending)))
+            pending[uri] = None
+            wakeup = self._wakeups.get(session_id)
+            if wakeup is not None:
+                wakeup.set()
+            notified += 1
+        return notified
+
+    async def stream(self, session_id: str) -> AsyncIterator[bytes]:
+        """Luồng SSE gửi notifications/resources/updated cho session."""
+        wakeup = self._wakeups[session_id] = asyncio.Event()
+        try:
+            yield b": connected\n\n"
+            # remove_session gỡ wakeup của session để kết thúc luồng
+            while self._wakeups.get(session_id) is wakeup:
+                try:
+                    await asyncio.wait_for(wakeup.wait(), _KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                wakeup.clear()
+                if self._wakeups.get(session_id) is not wakeup:
+                    break
+                pending = self._pending.pop(session_id, {})
+                for uri in pending:
+                    message = {"jsonrpc": "2.0", "method": "notifications/resources/updated", "params": {"uri": uri}}
+                    yield f"event: message\ndata: {json.dumps(message, ensure_ascii=False)}\n\n".encode("utf-8")
+        finally:
+            # Client ngắt luồng: không còn nơi nhận notification nên gỡ luôn
+            # subscription; luồng mới mở lại của cùng session thì giữ nguyên
+            if self._wakeups.get(session_id) is wakeup:
+                del self._wakeups[session_id]
+                self._drop_session(session_id)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._subscriptions),
+            "subscriptions": sum(len(uris) for uris in self._subscriptions.values()),
+            "streams": len(self._wakeups),
+        }
+
+
+class ChangeMonitor:
+    """Dò thay đổi của các resource đang được subscribe và publish notification."""
+
+    def __init__(self, subscriptions: SubscriptionManager, interval: float, notify_channel: str):
+        self.subscriptions = subscriptions
+        self.interval = interval
+        self.notify_channel = notify_channel
+        self._last: dict[str, tuple] = {}
+        self._listener = None
+        self._version_connection = None
+        self._notified: set[str] = set()
+
+    def _listen(self) -> None:
+        """LISTEN trên connection riêng (PostgreSQL); lỗi thì chỉ dùng polling."""
+        if engine.dialect.name != "postgresql" or not self.notify_channel or self._listener is not None:
+            return
+        try:
+            listener = engine.raw_connection()
+            listener.dbapi_connection.autocommit = True
+            with listener.dbapi_connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {quote_identifier(self.notify_channel)}")
+            self._listener = listener
+        except Exception as e:
+            logger.warning(f"LISTEN {self.notify_channel} failed, falling back to polling only: {e}")
+
+    def _drain_notifications(self) -> None:
+        if self._listener is None:
+            return
+        connection = self._listener.dbapi_connection
+        try:
+            connection.poll()
+            while connection.notifies:
+                self._notified.add(connection.notifies.pop(0).payload)
+        except Exception as e:
+            logger.warning(f"Lost LISTEN connection: {e}")
+            self._listener.invalidate()
+            self._listener = None
+
+    def _data_version(self) -> int:
+        """PRAGMA data_version (SQLite) trên connection riêng, giữ qua các lượt dò."""
+        if self._version_connection is None:
+            self._version_connection = engine.raw_connection()
+        try:
+            cursor = self._version_connection.cursor()
+            try:
+                cursor.execute("PRAGMA data_version")
+                return cursor.fetchone()[0]
+            finally:
+                cursor.close()
+        except Exception:
+            self._version_connection.invalidate()
+            self._version_connection = None
+            raise
+
+    def _table_counters(self, tables: list[str]) -> dict[str, tuple]:
+        """Bộ đếm theo bảng; bảng không đọc được thì không có trong kết quả."""
+        dialect = engine.dialect.name
+        counters: dict[str, tuple] = {table: (WRITE_COUNTERS.get(table),) for table in tables}
+        try:
+            if dialect == "sqlite":
+                version = self._data_version()
+                for table in tables:
+                    counters[table] += (version,)
+            elif dialect in ("postgresql", "mysql"):
+                with internal_engine.connect() as connection:
+                    try:
+                        self._catalog_counters(connection, tables, counters)
+                    finally:
+                        connection.rollback()
+        except Exception as e:
+            logger.warning(f"Reading change counters of {', '.join(tables)} failed: {e}")
+            return {}
+        return counters
+
+    @staticmethod
+    def _catalog_counters(connection, tables: list[str], counters: dict[str, tuple]) -> None:
+        if engine.dialect.name == "postgresql":
+            rows = connection.execute(text(
+                "SELECT relname, n_tup_ins, n_tup_upd, n_tup_del FROM pg_stat_user_tables "
+                "WHERE schemaname = ANY (current_schemas(false)) AND relname = ANY (:tables)"
+            ), {"tables": tables})
+            for name, inserted, updated, deleted in rows:
+                counters[name] += (inserted, updated, deleted)
+        else:
+            rows = connection.execute(text(
+                "SELECT TABLE_NAME, UPDATE_TIME, TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE()"
+            ))
+            for name, update_time, table_rows in rows:
+                if name in counters:
+                    counters[name] += (update_time, table_rows)
+
+    def poll(self, uris: set[str]) -> list[str]:
+        """Một lượt dò các uri: trả về các uri đã thay đổi kể từ lượt trước."""
+        if not uris:
+            self._last.clear()
+            return []
+        self._listen()
+        self._drain_notifications()
+
+        inspector = inspect(internal_engine)
+        existing = set(inspector.get_table_names())
+        tables = [table for table in (_table_from_uri(uri) for uri in uris) if table in existing]
+        current: dict[str, tuple] = {}
+        if SCHEMA_URI in uris:
+            current[SCHEMA_URI] = tuple(
+                (table, tuple(column["name"] for column in columns))
+                for (_, table), columns in sorted(inspector.get_multi_columns().items())
+            )
+        unreadable = set()
+        if tables:
+            counters = self._table_counters(tables)
+            for table in tables:
+                uri = table_uri(table)
+                if table in counters:
+                    current[uri] = counters[table]
+                elif uri in self._last:
+                    # Không đọc được bộ đếm: giữ trạng thái cũ, dò lại ở lượt sau
+                    current[uri] = self._last[uri]
+                else:
+                    unreadable.add(uri)
+        for uri in uris - unreadable:
+            # Bảng bị xóa cũng là một thay đổi
+            current.setdefault(uri, ())
+
+        changed = [uri for uri in uris if uri in self._last and self._last[uri] != current[uri]]
+        changed += [table_uri(table) for table in self._notified if table_uri(table) in uris and table_uri(table) not in changed]
+        self._notified.clear()
+        self._last = current
+        return changed
+
+    async def check(self) -> None:
+        try:
+            # Lấy danh sách uri trên event loop, nơi subscription được sửa
+            changed = await asyncio.to_thread(self.poll, self.subscriptions.subscribed_uris())
+        except Exception as e:
+            logger.warning(f"Resource change check failed: {e}")
+            return
+        for uri in changed:
+            notified = self.subscriptions.publish(uri)
+            logger.info(f"Resource {uri} changed; notified {notified} sessions")
+
+    async def run_periodically(self) -> None:
+        """Task nền dò thay đổi."""
+        while True:
+            await self.check()
+            await asyncio.sleep(self.interval)
+
+    def close(self) -> None:
+        if self._listener is not None:
+            # Connection đã bật autocommit và đang LISTEN: bỏ hẳn thay vì trả về pool
+            self._listener.invalidate()
+            self._listener = None
+        if self._version_connection is not None:
+            self._version_connection.close()
+            self._version_connection = None
+
+
+SUBSCRIPTIONS = SubscriptionManager()
+CHANGE_MONITOR = ChangeMonitor(SUBSCRIPTIONS, RESOURCE_POLL_INTERVAL, NOTIFY_CHANNEL)
+register_worker_stats("subscriptions", SUBSCRIPTIONS.stats)
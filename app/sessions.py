@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# File: app/sessions.py
+"""
+Giữ kết nối database theo MCP session (header Mcp-Session-Id).
+
+Khi bật MCP_SESSION_REUSE, mọi tool call cùng một session dùng chung một
+connection được "ghim" lại, nên temp table, SET ... và trạng thái session
+còn nguyên giữa các lần gọi, đồng thời không tốn chi phí checkout từ pool.
+Connection bị trả lại pool khi session rảnh quá MCP_SESSION_IDLE_TIMEOUT
+giây; số connection được ghim tối đa là MCP_MAX_PINNED_SESSIONS.
+
+Connection được ghim nằm trong worker process đã tạo nó. Với MCP_WORKERS > 1,
+worker sở hữu được ghi vào trạng thái dùng chung để request tới worker khác
+nhận WorkerMismatchError thay vì âm thầm dùng connection mới.
+"""
+
+import asyncio
+import contextvars
+import secrets
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+from app.config import MAX_PINNED_SESSIONS, SESSION_IDLE_TIMEOUT
+from app.logger import get_logger
+from app.shared_state import check_handle_owner, claim_handle, register_worker_stats, release_handle
+
+logger = get_logger(__name__)
+
+_bound_connection: contextvars.ContextVar[Optional[Any]] = contextvars.ContextVar(
+    "mcp_bound_connection", default=None
+)
+
+
+class SessionLimitError(Exception):
+    """Đã đạt số connection được ghim tối đa."""
+
+
+class PinnedConnection:
+    """Một connection được giữ riêng cho một key (session hoặc transaction)."""
+
+    def __init__(self, key: str, connection: Any):
+        self.key = key
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        # Mỗi connection chỉ phục vụ một request tại một thời điểm
+        self.lock = asyncio.Lock()
+        self.in_use = 0
+
+    def touch(self) -> None:
+        self.last_used = time.monotonic()
+
+    def idle_seconds(self) -> float:
+        return time.monotonic() - self.last_used
+
+
+class PinnedConnectionRegistry:
+    """
+    Registry các connection được ghim theo key, có giới hạn số lượng và
+    tự đóng khi rảnh quá lâu. on_expire được gọi trước khi đóng connection
+    (ví dụ để rollback transaction dở dang).
+    """
+
+    def __init__(
+        self,
+        max_pinned: int,
+        idle_timeout: float,
+        on_expire: Optional[Callable[[PinnedConnection], None]] = None,
+        name: str = "session"
+    ):
+        self.max_pinned = max_pinned
+        self.idle_timeout = idle_timeout
+        self.on_expire = on_expire
+        self.name = name
+        self._entries: dict[str, PinnedConnection] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def new_key(self) -> str:
+        return secrets.token_hex(16)
+
+    def get(self, key: str) -> Optional[PinnedConnection]:
+        return self._entries.get(key)
+
+    def acquire(self, key: str, create: bool = True) -> Optional[PinnedConnection]:
+        """
+        Lấy connection đã ghim cho key, tạo mới nếu chưa có. Raise
+        WorkerMismatchError nếu key đang được worker khác giữ.
+        """
+        from app.db import engine
+
+        self.expire_idle()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.touch()
+                return entry
+        check_handle_owner(self.name, key)
+        if not create:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.touch()
+                return entry
+            if len(self._entries) >= self.max_pinned:
+                raise SessionLimitError(
+                    f"Too many pinned {self.name} connections (max {self.max_pinned}); "
+                    f"close an existing {self.name} or retry later"
+                )
+            entry = PinnedConnection(key, engine.connect())
+            self._entries[key] = entry
+            claim_handle(self.name, key)
+            logger.info(f"Pinned connection for {self.name} {key} ({len(self._entries)}/{self.max_pinned})")
+            return entry
+
+    def release(self, key: str, expired: bool = False) -> bool:
+        """Đóng connection của key và trả về pool."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        release_handle(self.name, key)
+        try:
+            if expired and self.on_expire is not None:
+                self.on_expire(entry)
+        except Exception as e:
+            logger.error(f"Error expiring {self.name} {key}: {e}")
+        finally:
+            entry.connection.close()
+        logger.info(f"Released connection for {self.name} {key}")
+        return True
+
+    def expire_idle(self) -> list[str]:
+        """Đóng các connection rảnh quá idle_timeout (bỏ qua cái đang dùng)."""
+        with self._lock:
+            expired = [
+                key for key, entry in self._entries.items()
+                if entry.in_use == 0 and entry.idle_seconds() > self.idle_timeout
+            ]
+        for key in expired:
+            self.release(key, expired=True)
+        return expired
+
+    def close_all(self) -> None:
+        for key in list(self._entries):
+            self.release(key, expired=True)
+
+    def stats(self) -> dict:
+        return {
+            "pinned": len(self._entries),
+            "max_pinned": self.max_pinned,
+            "idle_timeout": self.idle_timeout,
+        }
+
+    @asynccontextmanager
+    async def use(self, key: str, create: bool = True) -> AsyncIterator[Optional[PinnedConnection]]:
+        """
+        Giữ lock của connection trong suốt request và bind nó vào context
+        để app.db.new_session() dùng lại.
+        """
+        # Checkout connection và đọc trạng thái dùng chung đều có thể chặn
+        entry = await asyncio.to_thread(self.acquire, key, create)
+        if entry is None:
+            yield None
+            return
+        entry.in_use += 1
+        try:
+            async with entry.lock:
+                with bind_connection(entry.connection):
+                    yield entry
+        finally:
+            entry.in_use -= 1
+            entry.touch()
+
+
+@contextmanager
+def bind_connection(connection: Any) -> Iterator[None]:
+    """Cho các hàm trong app.db dùng connection này thay vì lấy từ pool."""
+    token = _bound_connection.set(connection)
+    try:
+        yield
+    finally:
+        _bound_connection.reset(token)
+
+
+def current_connection() -> Optional[Any]:
+    """Connection đang được bind cho request hiện tại (nếu có)."""
+    return _bound_connection.get()
+
+
+SESSION_REGISTRY = PinnedConnectionRegistry(MAX_PINNED_SESSIONS, SESSION_IDLE_TIMEOUT)
+register_worker_stats("sessions", SESSION_REGISTRY.stats)
+
+
+async def expire_idle_periodically(*registries: PinnedConnectionRegistry, interval: float = 10.0) -> None:
+    """Task nền trả lại các connection rảnh, kể cả khi không có request mới."""
+    while True:
+        await asyncio.sleep(interval)
+        for registry in registries:
+            await asyncio.to_thread(registry.expire_idle)
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+# File: app/shared_state.py
+"""
+Trạng thái dùng chung giữa các worker process.
+
+- memory: trạng thái nằm trong process (mặc định khi chỉ có một worker)
+- sqlite: một file SQLite cục bộ (MCP_SHARED_STATE_PATH) mà mọi worker trên
+  cùng host cùng đọc/ghi; mặc định khi MCP_WORKERS > 1
+
+Các loại trạng thái được chia sẻ:
+- token bucket cho rate limit, để giới hạn áp dụng cho cả host chứ không
+  phải từng worker
+- snapshot số liệu của từng worker (publish/collect), để endpoint
+  diagnostics trả về số liệu gộp của mọi worker
+- worker sở hữu các handle chỉ sống trong một process (session được ghim,
+  transaction, subscription): connection/luồng SSE không chuyển được sang
+  process khác, nên request tới nhầm worker nhận lỗi nói rõ handle thuộc
+  worker nào thay vì "not found"
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional
+
+from app.config import SHARED_STATE_BACKEND, SHARED_STATE_PATH
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Snapshot cũ hơn khoảng này coi như worker đã chết
+STALE_AFTER_SECONDS = 60.0
+
+
+class WorkerMismatchError(Exception):
+    """Handle thuộc về một worker process khác worker đang xử lý request."""
+
+
+class TokenBucket:
+    """Token bucket: nạp rate token/giây, chứa tối đa capacity token."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def try_acquire(self) -> float:
+        """Lấy một token. Trả về 0 nếu thành công, ngược lại số giây cần chờ."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (1 - self.tokens) / self.rate
+
+
+class MemoryBackend:
+    """Trạng thái trong process, không chia sẻ giữa các worker."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._buckets: dict[str, TokenBucket] = {}
+        self._snapshots: dict[str, dict[str, tuple[float, dict]]] = {}
+        self._owners: dict[tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+
+    def take_token(self, key: str, rate: float, capacity: int) -> float:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(rate, capacity)
+            return bucket.try_acquire()
+
+    def publish(self, namespace: str, worker_id: str, data: dict) -> None:
+        with self._lock:
+            self._snapshots.setdefault(namespace, {})[worker_id] = (time.time(), data)
+
+    def collect(self, namespace: str) -> dict[str, dict]:
+        cutoff = time.time() - STALE_AFTER_SECONDS
+        with self._lock:
+            return {
+                worker_id: data
+                for worker_id, (updated, data) in self._snapshots.get(namespace, {}).items()
+                if updated >= cutoff
+            }
+
+    def set_owner(self, kind: str, key: str, worker: str) -> None:
+        with self._lock:
+            self._owners[(kind, key)] = worker
+
+    def get_owner(self, kind: str, key: str) -> Optional[str]:
+        with self._lock:
+            return self._owners.get((kind, key))
+
+    def clear_owner(self, kind: str, key: str) -> None:
+        with self._lock:
+            self._owners.pop((kind, key), None)
+
+
+class SqliteBackend:
+    """
+    Trạng thái trong một file SQLite dùng chung. Token bucket được cập nhật
+    trong transaction BEGIN IMMEDIATE nên an toàn khi nhiều process cùng ghi.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS token_buckets "
+            "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS worker_snapshots "
+            "(namespace TEXT NOT NULL, worker_id TEXT NOT NULL, updated REAL NOT NULL, "
+            "data TEXT NOT NULL, PRIMARY KEY (namespace, worker_id))"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS handle_owners "
+            "(kind TEXT NOT NULL, key TEXT NOT NULL, worker_id TEXT NOT NULL, PRIMARY KEY (kind, key))"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3.Connection không dùng chung giữa các thread được
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def take_token(self, key: str, rate: float, capacity: int) -> float:
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT tokens, updated FROM token_buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens = float(capacity) if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = float("inf") if rate <= 0 else (1 - tokens) / rate
+            connection.execute(
+                "INSERT INTO token_buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (key, tokens, now)
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return wait
+
+    def publish(self, namespace: str, worker_id: str, data: dict) -> None:
+        self._connection().execute(
+            "INSERT INTO worker_snapshots (namespace, worker_id, updated, data) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(namespace, worker_id) DO UPDATE SET updated = excluded.updated, data = excluded.data",
+            (namespace, worker_id, time.time(), json.dumps(data, default=str))
+        )
+
+    def collect(self, namespace: str) -> dict[str, dict]:
+        rows = self._connection().execute(
+            "SELECT worker_id, data FROM worker_snapshots WHERE namespace = ? AND updated >= ?",
+            (namespace, time.time() - STALE_AFTER_SECONDS)
+        ).fetchall()
+        return {worker_id: json.loads(data) for worker_id, data in rows}
+
+    def set_owner(self, kind: str, key: str, worker: str) -> None:
+        self._connection().execute(
+            "INSERT INTO handle_owners (kind, key, worker_id) VALUES (?, ?, ?) "
+            "ON CONFLICT(kind, key) DO UPDATE SET worker_id = excluded.worker_id",
+            (kind, key, worker)
+        )
+
+    def get_owner(self, kind: str, key: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT worker_id FROM handle_owners WHERE kind = ? AND key = ?", (kind, key)
+        ).fetchone()
+        return row[0] if row else None
+
+    def clear_owner(self, kind: str, key: str) -> None:
+        self._connection().execute("DELETE FROM handle_owners WHERE kind = ? AND key = ?", (kind, key))
+
+
+def create_backend(name: Optional[str] = None, path: Optional[str] = None):
+    """Tạo backend theo cấu hình MCP_SHARED_STATE."""
+    name = name or SHARED_STATE_BACKEND
+    if name == "sqlite":
+        return SqliteBackend(path or SHARED_STATE_PATH)
+    if name != "memory":
+        raise ValueError(f"Unknown shared state backend: {name}")
+    return MemoryBackend()
+
+
+def worker_id() -> str:
+    """Định danh worker hiện tại (pid)."""
+    return str(os.getpid())
+
+
+SHARED_STATE = create_backend()
+
+# Các hàm trả về số liệu của worker hiện tại, theo namespace
+WORKER_STATS: dict[str, Callable[[], dict]] = {}
+# Namespace không trả về trong collect_worker_stats (số liệu lớn, đọc qua endpoint riêng)
+_UNLISTED: set[str] = set()
+
+
+def register_worker_stats(namespace: str, func: Callable[[], dict], listed: bool = True) -> None:
+    """Đăng ký một nguồn số liệu để publish định kỳ cho các worker khác."""
+    WORKER_STATS[namespace] = func
+    if not listed:
+        _UNLISTED.add(namespace)
+
+
+def publish_worker_stats() -> None:
+    """Ghi snapshot số liệu của worker hiện tại vào trạng thái dùng chung."""
+    for namespace, func in WORKER_STATS.items():
+        try:
+            SHARED_STATE.publish(namespace, worker_id(), func())
+        except Exception as e:
+            logger.error(f"Failed to publish worker stats '{namespace}': {e}")
+
+
+def collect_worker_stats() -> dict[str, dict[str, dict]]:
+    """Số liệu của mọi worker còn sống, theo namespace rồi theo worker id."""
+    publish_worker_stats()
+    return {namespace: SHARED_STATE.collect(namespace) for namespace in WORKER_STATS if namespace not in _UNLISTED}
+
+
+def collect_namespace(namespace: str) -> dict[str, dict]:
+    """Số liệu một namespace của mọi worker còn sống, có bản mới nhất của worker này."""
+    SHARED_STATE.publish(namespace, worker_id(), WORKER_STATS[namespace]())
+    return SHARED_STATE.collect(namespace)
+
+
+async def publish_worker_stats_periodically(interval: float = 10.0) -> None:
+    """Task nền publish số liệu của worker này."""
+    while True:
+        await asyncio.to_thread(publish_worker_stats)
+        await asyncio.sleep(interval)
+
+
+def alive_workers() -> set[str]:
+    """Worker đã publish số liệu gần đây (kể cả worker hiện tại)."""
+    alive = {worker_id()}
+    for namespace in set(WORKER_STATS) - _UNLISTED:
+        alive.update(SHARED_STATE.collect(namespace))
+    return alive
+
+
+def claim_handle(kind: str, key: str) -> None:
+    """Ghi nhận worker hiện tại là nơi giữ handle."""
+    SHARED_STATE.set_owner(kind, key, worker_id())
+
+
+def release_handle(kind: str, key: str) -> None:
+    SHARED_STATE.clear_owner(kind, key)
+
+
+def check_handle_owner(kind: str, key: str) -> None:
+    """
+    Gọi khi handle không có trong worker này: báo lỗi nếu worker khác còn
+    sống đang giữ nó. Handle của worker đã chết được coi như không còn.
+    """
+    owner = SHARED_STATE.get_owner(kind, key)
+    if owner is None or owner == worker_id():
+        return
+    if owner not in alive_workers():
+        SHARED_STATE.clear_owner(kind, key)
+        return
+    raise WorkerMismatchError(
+        f"{kind.capitalize()} '{key}' belongs to worker {owner}, but this request reached worker {worker_id()}. "
+        f"State of a {kind} lives in one worker process: run with MCP_WORKERS=1 or route each client to one worker"
+    )
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+# File: app/snapshots.py
+"""
+Snapshot cục bộ của kết quả truy vấn để phân tích lặp lại.
+
+snapshot_query chạy truy vấn trên database chính một lần và stream kết quả
+vào một file SQLite trong MCP_SNAPSHOT_DIR; query_snapshot chạy các câu
+SELECT tiếp theo (lọc, group, join giữa các bảng trong cùng snapshot) trên
+file đó, không tốn tài nguyên của database chính.
+
+- Một snapshot có thể chứa nhiều bảng: gọi snapshot_query với snapshot_id
+  có sẵn để thêm bảng.
+- query_snapshot mở file ở chế độ read-only, chặn ATTACH và dừng câu lệnh
+  chạy quá MCP_SNAPSHOT_QUERY_TIMEOUT giây.
+- Snapshot không được dùng quá MCP_SNAPSHOT_TTL giây bị xóa. Vì nằm trên
+  file nên mọi worker đều dùng được snapshot do worker khác tạo.
+"""
+
+import json
+import os
+import re
+import secrets
+import sqlite3
+import time
+from typing import Any, Optional
+
+from sqlalchemy import text
+
+from app.config import SNAPSHOT_DIR, SNAPSHOT_MAX_ROWS, SNAPSHOT_QUERY_TIMEOUT, SNAPSHOT_TTL
+from app.db import check_forbidden_operations, convert_value, engine, rows_to_dicts
+from app.logger import get_logger
+from app.tracing import traced
+
+logger = get_logger(__name__)
+
+DEFAULT_RESULT_ROWS = 1000
+MAX_RESULT_ROWS = 10000
+
+_FETCH_BATCH = 1000
+_SNAPSHOT_ID = re.compile(r"^[0-9a-f]{24}$")
+_TABLE_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]{0,62}$")
+_META_TABLE = "_snapshot_tables"
+# Số lệnh VM SQLite giữa hai lần kiểm tra timeout
+_PROGRESS_STEPS = 10000
+
+
+class SnapshotNotFoundError(Exception):
+    """snapshot_id không tồn tại hoặc đã hết hạn."""
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _sqlite_value(value: Any) -> Any:
+    """Giá trị lưu được vào SQLite; kiểu khác được chuyển thành chuỗi/JSON."""
+    # Binary giữ nguyên dạng BLOB thay vì base64 như convert_value
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value)
+    value = convert_value(value)
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return str(value)
+
+
+def _unique_columns(columns: list[str]) -> list[str]:
+    """Đổi tên cột trùng (vd. id của hai bảng join) thành id, id_2, ..."""
+    seen: dict[str, int] = {}
+    unique = []
+    for column in columns:
+        name = column or "column"
+        count = seen.get(name.lower(), 0) + 1
+        seen[name.lower()] = count
+        unique.append(name if count == 1 else f"{name}_{count}")
+    return unique
+
+
+def _begin_read_only(connection) -> None:
+    """Đặt transaction hiện tại của connection ở chế độ chỉ đọc."""
+    dialect = engine.dialect.name
+    if dialect == "postgresql":
+        connection.execute(text("SET TRANSACTION READ ONLY"))
+    elif dialect == "mysql":
+        # Áp dụng cho transaction kế tiếp, tức transaction chạy câu truy vấn
+        connection.execute(text("SET TRANSACTION READ ONLY"))
+    elif dialect == "sqlite":
+        connection.execute(text("PRAGMA query_only = ON"))
+
+
+def _end_read_only(connection) -> None:
+    """Rollback và khôi phục trạng thái cấp connection trước khi trả về pool."""
+    connection.rollback()
+    if engine.dialect.name == "sqlite":
+        connection.execute(text("PRAGMA query_only = OFF"))
+        connection.rollback()
+
+
+def _remove_snapshot_files(path: str) -> None:
+    for suffix in ("", "-journal"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+class SnapshotStore:
+    """Tạo, truy vấn và dọn các snapshot SQLite trong một thư mục."""
+
+    def __init__(self, snapshot_dir: str, ttl: float, max_rows: int, query_timeout: float):
+        self.snapshot_dir = snapshot_dir
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.query_timeout = query_timeout
+
+    def _path(self, snapshot_id: str) -> str:
+        if not _SNAPSHOT_ID.match(snapshot_id or ""):
+            raise SnapshotNotFoundError(f"Snapshot '{snapshot_id}' not found")
+        return os.path.join(self.snapshot_dir, f"{snapshot_id}.sqlite")
+
+    def _existing_path(self, snapshot_id: str) -> str:
+        path = self._path(snapshot_id)
+        if not os.path.exists(path):
+            raise SnapshotNotFoundError(f"Snapshot '{snapshot_id}' not found or expired (TTL {self.ttl:g}s)")
+        # mtime đánh dấu lần dùng gần nhất, dùng để tính hết hạn
+        os.utime(path)
+        return path
+
+    @staticmethod
+    def _tables(connection: sqlite3.Connection) -> list[dict]:
+        rows = connection.execute(
+            f"SELECT name, query, columns, row_count, truncated, created_at FROM {_META_TABLE} ORDER BY created_at"
+        ).fetchall()
+        return [
+            {
+                "table_name": name,
+                "query": query,
+                "columns": json.loads(columns),
+                "row_count": row_count,
+                "truncated": bool(truncated),
+                "created_at": created_at,
+            }
+            for name, query, columns, row_count, truncated, created_at in rows
+        ]
+
+    def _copy_result(self, target: sqlite3.Connection, table_name: str, query: str, params: dict) -> tuple[list[str], int, bool]:
+        """Stream kết quả truy vấn trên database chính vào bảng của snapshot."""
+        row_count = 0
+        truncated = False
+        with engine.connect() as connection:
+            try:
+                # Câu lệnh chạy trên database chính: chỉ đọc và luôn rollback
+                _begin_read_only(connection)
+                result = connection.execution_options(
+                    stream_results=True, max_row_buffer=_FETCH_BATCH
+                ).execute(text(query), params)
+                if not result.returns_rows:
+                    raise ValueError("snapshot_query only accepts statements that return rows")
+                columns = _unique_columns(list(result.keys()))
+                target.execute(f"DROP TABLE IF EXISTS {_quote(table_name)}")
+                target.execute(f"CREATE TABLE {_quote(table_name)} ({', '.join(_quote(c) for c in columns)})")
+                insert = (
+                    f"INSERT INTO {_quote(table_name)} VALUES ({', '.join('?' for _ in columns)})"
+                )
+                for partition in result.partitions(_FETCH_BATCH):
+                    if row_count + len(partition) > self.max_rows:
+                        partition = partition[:self.max_rows - row_count]
+                        truncated = True
+                    target.executemany(insert, ([_sqlite_value(value) for value in row] for row in partition))
+                    row_count += len(partition)
+                    if truncated:
+                        break
+            finally:
+                _end_read_only(connection)
+        return columns, row_count, truncated
+
+    @traced("snapshots.create")
+    def create(
+        self,
+        query: str,
+        params: Optional[dict] = None,
+        table_name: str = "result",
+        snapshot_id: Optional[str] = None,
+        index_columns: Optional[list[str]] = None
+    ) -> dict:
+        """
+        Chạy truy vấn trên database chính và lưu kết quả thành bảng table_name
+        của snapshot mới, hoặc của snapshot_id có sẵn (thay bảng cùng tên).
+        """
+        check_forbidden_operations(query)
+        if not query.strip().upper().startswith("SELECT"):
+            raise ValueError("Only SELECT queries are allowed")
+        if not _TABLE_NAME.match(table_name or "") or table_name.lower().startswith(("sqlite_", "_snapshot")):
+            raise ValueError(f"Invalid snapshot table name: {table_name}")
+        self.expire()
+
+        if snapshot_id:
+            path = self._existing_path(snapshot_id)
+            build_path = path
+        else:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            snapshot_id = secrets.token_hex(12)
+            path = self._path(snapshot_id)
+            # Snapshot mới được dựng trong file tạm rồi đổi tên khi xong
+            build_path = f"{path}.part"
+
+        started = time.monotonic()
+        target = sqlite3.connect(build_path, isolation_level=None)
+        try:
+            if build_path != path:
+                # File tạm bị xóa nếu lỗi nên không cần rollback journal
+                target.execute("PRAGMA journal_mode = OFF")
+            target.execute("BEGIN IMMEDIATE")
+            target.execute(
+                f"CREATE TABLE IF NOT EXISTS {_META_TABLE} "
+                "(name TEXT PRIMARY KEY, query TEXT, columns TEXT, row_count INTEGER, truncated INTEGER, created_at REAL)"
+            )
+            columns, row_count, truncated = self._copy_result(target, table_name, query, params or {})
+            for column in index_columns or []:
+                if column not in columns:
+                    raise ValueError(f"Cannot index unknown column '{column}' of snapshot table {table_name}")
+                target.execute(
+                    f"CREATE INDEX {_quote('ix_' + table_name + '_' + column)} "
+                    f"ON {_quote(table_name)} ({_quote(column)})"
+                )
+            target.execute(
+                f"INSERT OR REPLACE INTO {_META_TABLE} VALUES (?, ?, ?, ?, ?, ?)",
+                (table_name, query, json.dumps(columns), row_count, int(truncated), time.time())
+            )
+            target.execute("COMMIT")
+            tables = self._tables(target)
+        except Exception:
+            if target.in_transaction:
+                target.execute("ROLLBACK")
+            target.close()
+            if build_path != path and os.path.exists(build_path):
+                os.remove(build_path)
+            raise
+        target.close()
+        if build_path != path:
+            os.replace(build_path, path)
+
+        elapsed = round(time.monotonic() - started, 3)
+        logger.info(f"Snapshot {snapshot_id}: stored {row_count} rows in table {table_name} ({elapsed}s)")
+        message = f"Stored {row_count} rows in snapshot {snapshot_id}, table {table_name}."
+        if truncated:
+            message += f" Result truncated at MCP_SNAPSHOT_MAX_ROWS={self.max_rows}."
+        return {
+            "status": "success",
+            "snapshot_id": snapshot_id,
+            "table_name": table_name,
+            "columns": columns,
+            "row_count": row_count,
+            "truncated": truncated,
+            "elapsed_seconds": elapsed,
+            "tables": tables,
+            "expires_after_idle_seconds": self.ttl,
+            "message": message + " Run follow-up SQL against it with query_snapshot."
+        }
+
+    @traced("snapshots.query")
+    def query(
+        self,
+        snapshot_id: str,
+        query: str,
+        params: Optional[Any] = None,
+        limit: int = DEFAULT_RESULT_ROWS,
+        preview_chars: Optional[int] = None,
+        full_columns: Optional[list[str]] = None,
+        value_handles: bool = False
+    ) -> dict:
+        """Chạy một câu SELECT read-only trên snapshot; TEXT/BLOB lớn được rút gọn như rows_to_dicts."""
+        path = self._existing_path(snapshot_id)
+        limit = min(max(1, int(limit)), MAX_RESULT_ROWS)
+
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            connection.set_authorizer(
+                lambda action, *_: sqlite3.SQLITE_DENY if action in (sqlite3.SQLITE_ATTACH, sqlite3.SQLITE_DETACH)
+                else sqlite3.SQLITE_OK
+            )
+            deadline = time.monotonic() + self.query_timeout
+            connection.set_progress_handler(lambda: int(time.monotonic() > deadline), _PROGRESS_STEPS)
+            started = time.monotonic()
+            try:
+                cursor = connection.execute(query, params if params is not None else ())
+            except sqlite3.OperationalError as e:
+                if str(e) == "interrupted":
+                    raise TimeoutError(f"Snapshot query exceeded {self.query_timeout:g}s") from None
+                raise
+            if cursor.description is None:
+                raise ValueError("query_snapshot only accepts statements that return rows")
+            columns = [description[0] for description in cursor.description]
+            rows = cursor.fetchmany(limit + 1)
+            tables = self._tables(connection)
+        finally:
+            connection.close()
+
+        truncated = len(rows) > limit
+        rows = rows_to_dicts(columns, rows[:limit], preview_chars, full_columns, value_handles)
+        return {
+            "status": "success",
+            "snapshot_id": snapshot_id,
+            "columns": columns,
+            "row_count": len(rows),
+            "truncated": truncated,
+            "elapsed_seconds": round(time.monotonic() - started, 3),
+            "tables": [table["table_name"] for table in tables],
+            "rows": rows,
+            "message": f"Query on snapshot returned {len(rows)} rows" + (f" (limited to {limit})." if truncated else ".")
+        }
+
+    def drop(self, snapshot_id: str) -> dict:
+        """Xóa snapshot."""
+        _remove_snapshot_files(self._existing_path(snapshot_id))
+        return {
+            "status": "success",
+            "snapshot_id": snapshot_id,
+            "message": f"Snapshot {snapshot_id} dropped."
+        }
+
+    def expire(self) -> list[str]:
+        """Xóa các snapshot không được dùng quá ttl giây."""
+        if not os.path.isdir(self.snapshot_dir):
+            return []
+        expired = []
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.snapshot_dir):
+            snapshot_id, extension = os.path.splitext(name)
+            if extension != ".sqlite" or not _SNAPSHOT_ID.match(snapshot_id):
+                continue
+            path = os.path.join(self.snapshot_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    _remove_snapshot_files(path)
+                    expired.append(snapshot_id)
+            except FileNotFoundError:
+                continue
+        return expired
+
+
+SNAPSHOT_STORE = SnapshotStore(SNAPSHOT_DIR, SNAPSHOT_TTL, SNAPSHOT_MAX_ROWS, SNAPSHOT_QUERY_TIMEOUT)
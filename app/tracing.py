@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+# File: app/tracing.py
+"""
+Tracing nhẹ, tương thích OpenTelemetry, cho từng request MCP.
+
+Mặc định tracing tắt (no-op, gần như không tốn chi phí). Có ba chế độ:
+- MCP_TRACING=memory: lưu span vào InMemorySpanExporter (dùng cho test)
+- MCP_TRACING=otel: chuyển span sang opentelemetry-api nếu đã cài
+- không đặt: no-op
+
+Mỗi span mang thuộc tính mcp.request_id lấy từ id của request JSON-RPC.
+"""
+
+import contextvars
+import functools
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "mcp_current_span", default=None
+)
+_request_id: contextvars.ContextVar[Optional[Any]] = contextvars.ContextVar(
+    "mcp_request_id", default=None
+)
+
+
+class Span:
+    """Một span đã/đang đo, cùng field với ReadableSpan của OpenTelemetry."""
+
+    __slots__ = (
+        "name", "trace_id", "span_id", "parent_span_id", "start_time_ns",
+        "end_time_ns", "attributes", "status", "status_description",
+    )
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Optional[dict] = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent.span_id if parent else None
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns: Optional[int] = None
+        self.attributes: dict = dict(attributes or {})
+        self.status = "UNSET"
+        self.status_description: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_exception(self, error: BaseException) -> None:
+        self.status = "ERROR"
+        self.status_description = f"{type(error).__name__}: {error}"
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        if self.end_time_ns is None:
+            return None
+        return (self.end_time_ns - self.start_time_ns) / 1_000_000
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "start_time_ns": self.start_time_ns,
+            "end_time_ns": self.end_time_ns,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "status": self.status,
+            "status_description": self.status_description,
+        }
+
+
+class _NoOpSpan:
+    """Span rỗng dùng khi tracing tắt."""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def record_exception(self, error: BaseException) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoOpSpan()
+
+
+class InMemorySpanExporter:
+    """Giữ các span đã kết thúc trong bộ nhớ, dùng cho test."""
+
+    def __init__(self):
+        self._spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self._spans.append(span)
+
+    def get_finished_spans(self) -> list[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._spans.clear()
+
+
+class _OtelSpanAdapter:
+    """Bọc span của opentelemetry-api để có cùng interface với Span."""
+
+    def __init__(self, span):
+        self._span = span
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self._span.set_attribute(key, value)
+
+    def record_exception(self, error: BaseException) -> None:
+        from opentelemetry.trace import Status, StatusCode
+
+        self._span.record_exception(error)
+        self._span.set_status(Status(StatusCode.ERROR, str(error)))
+
+
+_exporter: Optional[InMemorySpanExporter] = None
+_otel_tracer = None
+
+
+def set_exporter(exporter: Optional[InMemorySpanExporter]) -> None:
+    """Bật tracing với exporter cho trước, hoặc tắt nếu exporter là None."""
+    global _exporter
+    _exporter = exporter
+
+
+def get_exporter() -> Optional[InMemorySpanExporter]:
+    return _exporter
+
+
+def configure_tracing(mode: Optional[str] = None) -> None:
+    """Cấu hình tracing theo MCP_TRACING (memory, otel, hoặc tắt)."""
+    global _otel_tracer
+    mode = (mode if mode is not None else os.getenv("MCP_TRACING", "")).lower()
+    _otel_tracer = None
+    set_exporter(None)
+    if mode == "memory":
+        set_exporter(InMemorySpanExporter())
+    elif mode == "otel":
+        try:
+            from opentelemetry import trace
+        except ImportError as e:
+            raise RuntimeError("MCP_TRACING=otel requires the 'opentelemetry-api' package") from e
+        _otel_tracer = trace.get_tracer("database-mcp")
+
+
+def is_enabled() -> bool:
+    return _exporter is not None or _otel_tracer is not None
+
+
+@contextmanager
+def request_context(request_id: Any) -> Iterator[None]:
+    """Gắn id của request JSON-RPC vào mọi span tạo ra bên trong."""
+    token = _request_id.set(request_id)
+    try:
+        yield
+    finally:
+        _request_id.reset(token)
+
+
+def current_request_id() -> Optional[Any]:
+    return _request_id.get()
+
+
+@contextmanager
+def start_span(name: str, attributes: Optional[dict] = None) -> Iterator[Any]:
+    """
+    Mở một span con của span hiện tại. Khi tracing tắt trả về span no-op.
+    Exception được ghi vào span rồi raise tiếp.
+    """
+    if _otel_tracer is not None:
+        otel_attributes = dict(attributes or {})
+        request_id = _request_id.get()
+        if request_id is not None:
+            otel_attributes["mcp.request_id"] = str(request_id)
+        with _otel_tracer.start_as_current_span(
+            name, attributes=otel_attributes, record_exception=False, set_status_on_exception=False
+        ) as otel_span:
+            adapter = _OtelSpanAdapter(otel_span)
+            try:
+                yield adapter
+            except BaseException as e:
+                adapter.record_exception(e)
+                raise
+        return
+
+    exporter = _exporter
+    if exporter is None:
+        yield _NOOP_SPAN
+        return
+
+    span = Span(name, _current_span.get(), attributes)
+    request_id = _request_id.get()
+    if request_id is not None:
+        span.attributes["mcp.request_id"] = request_id
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end_time_ns = time.time_ns()
+        if span.status == "UNSET":
+            span.status = "OK"
+        exporter.export(span)
+
+
+def traced(name: str) -> Callable:
+    """Decorator bọc toàn bộ lời gọi hàm (sync) trong một span."""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_enabled():
+                return func(*args, **kwargs)
+            with start_span(name, {"code.function": func.__name__}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+configure_tracing()
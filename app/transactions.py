@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+# File: app/transactions.py
+"""
+Transaction tương tác qua nhiều tool call: begin -> execute ... -> commit
+hoặc rollback.
+
+Mỗi transaction giữ một connection được ghim trong TRANSACTION_REGISTRY.
+Transaction rảnh quá MCP_TRANSACTION_IDLE_TIMEOUT giây bị rollback tự động
+để không giữ lock vô thời hạn. Có thể đặt savepoint và rollback về
+savepoint mà không hủy cả transaction.
+"""
+
+import re
+from typing import Optional
+
+from sqlalchemy import text
+
+from app.config import MAX_OPEN_TRANSACTIONS, TRANSACTION_IDLE_TIMEOUT, TRANSACTION_LOCK_TIMEOUT_MS
+from app.db import check_forbidden_operations, engine, rows_to_dicts
+from app.logger import get_logger
+from app.sessions import PinnedConnection, PinnedConnectionRegistry
+from app.shared_state import register_worker_stats
+from app.tracing import traced
+
+logger = get_logger(__name__)
+
+_SAVEPOINT_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]{0,62}$")
+
+# Timeout chờ lock mặc định của driver, khôi phục trước khi trả connection về pool
+_DEFAULT_SQLITE_BUSY_TIMEOUT_MS = 5000
+
+
+class TransactionNotFoundError(Exception):
+    """transaction_id không tồn tại hoặc đã hết hạn."""
+
+
+def _rollback_expired(entry: PinnedConnection) -> None:
+    """Rollback transaction bị bỏ rơi trước khi trả connection về pool."""
+    logger.warning(f"Rolling back idle transaction {entry.key}")
+    entry.connection.rollback()
+    _reset_lock_timeout(entry.connection)
+
+
+TRANSACTION_REGISTRY = PinnedConnectionRegistry(
+    MAX_OPEN_TRANSACTIONS,
+    TRANSACTION_IDLE_TIMEOUT,
+    on_expire=_rollback_expired,
+    name="transaction"
+)
+register_worker_stats("transactions", TRANSACTION_REGISTRY.stats)
+
+
+def _set_lock_timeout(connection, lock_timeout_ms: int) -> None:
+    """Giới hạn thời gian chờ lock để transaction không bị treo."""
+    dialect = engine.dialect.name
+    if dialect == "postgresql":
+        # SET LOCAL chỉ có hiệu lực trong transaction hiện tại
+        connection.execute(text(f"SET LOCAL lock_timeout = {int(lock_timeout_ms)}"))
+    elif dialect == "mysql":
+        seconds = max(1, round(lock_timeout_ms / 1000))
+        connection.execute(text(f"SET SESSION innodb_lock_wait_timeout = {seconds}"))
+    elif dialect == "sqlite":
+        connection.execute(text(f"PRAGMA busy_timeout = {int(lock_timeout_ms)}"))
+
+
+def _reset_lock_timeout(connection) -> None:
+    """Khôi phục timeout cấp session (MySQL/SQLite) trước khi trả connection về pool."""
+    dialect = engine.dialect.name
+    if dialect == "mysql":
+        connection.execute(text("SET SESSION innodb_lock_wait_timeout = DEFAULT"))
+    elif dialect == "sqlite":
+        connection.execute(text(f"PRAGMA busy_timeout = {_DEFAULT_SQLITE_BUSY_TIMEOUT_MS}"))
+
+
+def _validate_savepoint(name: str) -> str:
+    if not _SAVEPOINT_NAME.match(name or ""):
+        raise ValueError(f"Invalid savepoint name: {name}")
+    return name
+
+
+def _get_entry(transaction_id: str) -> PinnedConnection:
+    entry = TRANSACTION_REGISTRY.get(transaction_id)
+    if entry is None:
+        raise TransactionNotFoundError(
+            f"Transaction '{transaction_id}' not found or expired (idle timeout {TRANSACTION_IDLE_TIMEOUT:g}s)"
+        )
+    entry.touch()
+    return entry
+
+
+@traced("transactions.begin_transaction")
+def begin_transaction(lock_timeout_ms: Optional[int] = None) -> dict:
+    """
+    Mở transaction trên một connection được ghim, trả về transaction_id
+    dùng cho các lần gọi tiếp theo.
+    """
+    transaction_id = TRANSACTION_REGISTRY.new_key()
+    entry = TRANSACTION_REGISTRY.acquire(transaction_id)
+    try:
+        entry.connection.begin()
+        _set_lock_timeout(entry.connection, lock_timeout_ms or TRANSACTION_LOCK_TIMEOUT_MS)
+    except Exception:
+        TRANSACTION_REGISTRY.release(transaction_id, expired=True)
+        raise
+
+    return {
+        "status": "success",
+        "transaction_id": transaction_id,
+        "idle_timeout_seconds": TRANSACTION_IDLE_TIMEOUT,
+        "message": f"Transaction {transaction_id} started. It is rolled back automatically "
+                   f"after {TRANSACTION_IDLE_TIMEOUT:g}s without activity."
+    }
+
+
+@traced("transactions.execute_in_transaction")
+def execute_in_transaction(
+    transaction_id: str,
+    query: str,
+    params: Optional[dict] = None,
+    savepoint: Optional[str] = None,
+    preview_chars: Optional[int] = None,
+    full_columns: Optional[list[str]] = None,
+    value_handles: bool = False
+) -> dict:
+    """
+    Chạy một câu lệnh (đọc hoặc ghi) trong transaction đang mở.
+    Nếu có savepoint, tạo savepoint với tên đó trước khi chạy câu lệnh.
+    Giá trị TEXT/BLOB lớn được rút gọn như trong rows_to_dicts.
+    """
+    check_forbidden_operations(query)
+    entry = _get_entry(transaction_id)
+    connection = entry.connection
+
+    if savepoint:
+        connection.execute(text(f"SAVEPOINT {_validate_savepoint(savepoint)}"))
+
+    result = connection.execute(text(query), params or {})
+    if result.returns_rows:
+        rows = rows_to_dicts(list(result.keys()), result.fetchall(), preview_chars, full_columns, value_handles)
+        return {
+            "status": "success",
+            "transaction_id": transaction_id,
+            "row_count": len(rows),
+            "rows": rows,
+            "message": f"Query executed in transaction. Found {len(rows)} rows."
+        }
+
+    rows_affected = getattr(result, "rowcount", 0)
+    return {
+        "status": "success",
+        "transaction_id": transaction_id,
+        "rows_affected": rows_affected,
+        "message": f"Command executed in transaction. {rows_affected} rows affected (not committed)."
+    }
+
+
+@traced("transactions.commit_transaction")
+def commit_transaction(transaction_id: str) -> dict:
+    """Commit transaction và trả connection về pool."""
+    entry = _get_entry(transaction_id)
+    try:
+        entry.connection.commit()
+        _reset_lock_timeout(entry.connection)
+    finally:
+        TRANSACTION_REGISTRY.release(transaction_id)
+    return {
+        "status": "success",
+        "transaction_id": transaction_id,
+        "message": f"Transaction {transaction_id} committed."
+    }
+
+
+@traced("transactions.rollback_transaction")
+def rollback_transaction(transaction_id: str, savepoint: Optional[str] = None) -> dict:
+    """
+    Rollback toàn bộ transaction (và trả connection về pool), hoặc chỉ
+    rollback về savepoint và giữ transaction mở.
+    """
+    entry = _get_entry(transaction_id)
+    if savepoint:
+        entry.connection.execute(text(f"ROLLBACK TO SAVEPOINT {_validate_savepoint(savepoint)}"))
+        return {
+            "status": "success",
+            "transaction_id": transaction_id,
+            "message": f"Rolled back to savepoint {savepoint}; transaction {transaction_id} is still open."
+        }
+
+    try:
+        entry.connection.rollback()
+        _reset_lock_timeout(entry.connection)
+    finally:
+        TRANSACTION_REGISTRY.release(transaction_id)
+    return {
+        "status": "success",
+        "transaction_id": transaction_id,
+        "message": f"Transaction {transaction_id} rolled back."
+    }
@@ -0,0 +1,494 @@
+# -*- coding: utf-8 -*-
+# File: app/transfer.py
+"""
+Export dữ liệu từ database ra file (CSV, NDJSON, Parquet) và import từ file
+(CSV, NDJSON) vào bảng theo từng batch, không đi qua JSON-RPC.
+"""
+
+import csv
+import io
+import json
+import os
+import re
+from typing import Any, Iterator, Optional
+
+from sqlalchemy import text
+
+from app.config import DATA_DIR
+from app.db import convert_value, engine, internal_engine, new_session, quote_identifier
+from app.logger import get_logger
+from app.tracing import traced
+
+logger = get_logger(__name__)
+
+EXPORT_FORMATS = ("csv", "ndjson", "parquet")
+IMPORT_FORMATS = ("csv", "ndjson")
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_IMPORT_BATCH_SIZE = 1000
+# Số row tối đa giữ lại khi chờ cột toàn NULL có kiểu trước khi mở file Parquet
+_PARQUET_MAX_PENDING_ROWS = 100000
+
+# Chỉ chấp nhận tên kiểu SQL đơn giản như INTEGER, VARCHAR(100), NUMERIC(10, 2)
+_COLUMN_TYPE_PATTERN = re.compile(r"^[A-Za-z][A-Za-z0-9_ ]*(\(\s*\d+(\s*,\s*\d+)?\s*\))?$")
+
+
+def resolve_data_path(path: str) -> str:
+    """
+    Chuẩn hóa đường dẫn file và bảo đảm nó nằm trong DATA_DIR.
+    Đường dẫn tương đối được tính từ DATA_DIR.
+    """
+    base = os.path.realpath(DATA_DIR)
+    full_path = os.path.realpath(os.path.join(base, path))
+    if os.path.commonpath([base, full_path]) != base:
+        raise ValueError(f"Path must be inside the data directory: {DATA_DIR}")
+    return full_path
+
+
+class _CsvWriter:
+    """Ghi các batch row ra CSV, header ở dòng đầu."""
+
+    def __init__(self, file_path: str, columns: list[str]):
+        self._file = open(file_path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write_batch(self, columns: list[str], rows: list) -> None:
+        self._writer.writerows(
+            [convert_value(value) for value in row] for row in rows
+        )
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _NdjsonWriter:
+    """Ghi mỗi row thành một dòng JSON."""
+
+    def __init__(self, file_path: str, columns: list[str]):
+        self._file = open(file_path, "w", encoding="utf-8")
+
+    def write_batch(self, columns: list[str], rows: list) -> None:
+        self._file.writelines(
+            json.dumps(
+                {col: convert_value(val) for col, val in zip(columns, row)},
+                ensure_ascii=False,
+                default=str
+            ) + "\n"
+            for row in rows
+        )
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _ParquetWriter:
+    """
+    Ghi mỗi batch thành một row group Parquet (cần pyarrow).
+
+    Schema của file cố định khi mở writer, nên cột toàn NULL trong các batch
+    đầu chưa có kiểu: các batch được giữ lại (tối đa _PARQUET_MAX_PENDING_ROWS
+    row) cho tới khi mọi cột có kiểu. Cột vẫn toàn NULL khi hết giới hạn được
+    ghi dạng string; các batch sau được cast về schema của file.
+    """
+
+    def __init__(self, file_path: str, columns: list[str]):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ValueError("Parquet export requires the 'pyarrow' package") from e
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self._file_path = file_path
+        self._columns = columns
+        self._writer: Any = None
+        self._pending: list = []
+        self._pending_rows = 0
+        self._closed = False
+
+    def _open(self, schema) -> None:
+        schema = self._pa.schema([
+            field.with_type(self._pa.string()) if self._pa.types.is_null(field.type) else field
+            for field in schema
+        ])
+        self._writer = self._pq.ParquetWriter(self._file_path, schema)
+        for table in self._pending:
+            self._writer.write_table(table.cast(schema))
+        self._pending = []
+        self._pending_rows = 0
+
+    def write_batch(self, columns: list[str], rows: list) -> None:
+        data = {
+            col: [row[index] for row in rows]
+            for index, col in enumerate(columns)
+        }
+        table = self._pa.Table.from_pydict(data)
+        if self._writer is not None:
+            self._writer.write_table(table.cast(self._writer.schema))
+            return
+
+        self._pending.append(table)
+        self._pending_rows += table.num_rows
+        # Gộp kiểu của các batch đang giữ: null nhận kiểu của batch khác, int được nâng lên float, ...
+        schema = self._pa.unify_schemas([pending.schema for pending in self._pending], promote_options="permissive")
+        if self._pending_rows >= _PARQUET_MAX_PENDING_ROWS or not any(
+            self._pa.types.is_null(field.type) for field in schema
+        ):
+            self._open(schema)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer is None:
+            if self._pending:
+                self._open(self._pa.unify_schemas(
+                    [pending.schema for pending in self._pending], promote_options="permissive"
+                ))
+            else:
+                # Kết quả rỗng: vẫn ghi file có schema (cột kiểu string)
+                self._open(self._pa.schema([(column, self._pa.string()) for column in self._columns]))
+        self._writer.close()
+
+
+_WRITERS = {
+    "csv": _CsvWriter,
+    "ndjson": _NdjsonWriter,
+    "parquet": _ParquetWriter,
+}
+
+
+@traced("transfer.export_query")
+def export_query(
+    query: str,
+    path: str,
+    file_format: Optional[str] = None,
+    params: Optional[dict] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE
+) -> dict:
+    """
+    Stream kết quả SELECT ra file theo batch cố định (server-side cursor),
+    bộ nhớ dùng không phụ thuộc số row. Trả về path, số row và số byte.
+    """
+    file_path = resolve_data_path(path)
+    file_format = (file_format or os.path.splitext(file_path)[1].lstrip(".")).lower()
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {file_format}. Use one of {', '.join(EXPORT_FORMATS)}")
+    batch_size = max(1, int(batch_size))
+
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    # Ghi ra file tạm rồi đổi tên để không để lại file dở dang khi lỗi
+    temp_path = f"{file_path}.part"
+
+    db = new_session()
+    writer = None
+    try:
+        result = db.execute(
+            text(query),
+            params or {},
+            execution_options={"stream_results": True, "max_row_buffer": batch_size}
+        )
+        columns = list(result.keys())
+        writer = _WRITERS[file_format](temp_path, columns)
+
+        row_count = 0
+        batches = 0
+        for partition in result.partitions(batch_size):
+            writer.write_batch(columns, partition)
+            row_count += len(partition)
+            batches += 1
+            logger.info(f"Exported batch {batches} ({row_count} rows) to {file_path}")
+
+        writer.close()
+        writer = None
+        os.replace(temp_path, file_path)
+
+        return {
+            "status": "success",
+            "path": file_path,
+            "format": file_format,
+            "row_count": row_count,
+            "batches": batches,
+            "bytes": os.path.getsize(file_path),
+            "message": f"Exported {row_count} rows to {file_path}."
+        }
+    except Exception as e:
+        db.rollback()
+        raise e
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        db.close()
+
+
+class _LineReader:
+    """
+    Đọc file theo dòng ở chế độ binary rồi decode UTF-8, đếm số byte đã đọc
+    để báo tiến độ import (file text không cho tell() khi đang lặp).
+    """
+
+    def __init__(self, f):
+        self._f = f
+        self.bytes_read = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        line = self._f.readline()
+        if not line:
+            raise StopIteration
+        self.bytes_read += len(line)
+        return line.decode("utf-8")
+
+
+def _read_rows(lines: Iterator[str], file_format: str) -> Iterator[dict]:
+    """Đọc file từng row một, không nạp toàn bộ file vào bộ nhớ."""
+    if file_format == "csv":
+        for row in csv.DictReader(lines):
+            # CSV không phân biệt chuỗi rỗng và NULL, coi rỗng là NULL
+            yield {key: (value if value != "" else None) for key, value in row.items()}
+    else:
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _iter_batches(rows: Iterator[dict], batch_size: int) -> Iterator[list[dict]]:
+    """Gom row thành các batch có kích thước cố định."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _infer_column_type(values: list) -> str:
+    """Suy kiểu cột từ các giá trị mẫu (chuỗi CSV hoặc giá trị JSON)."""
+    values = [value for value in values if value is not None]
+    if not values:
+        return "TEXT"
+    if all(isinstance(value, bool) for value in values):
+        return "BOOLEAN"
+
+    def is_int(value) -> bool:
+        if isinstance(value, bool):
+            return False
+        if isinstance(value, int):
+            return True
+        return isinstance(value, str) and re.fullmatch(r"[-+]?\d+", value.strip()) is not None
+
+    def is_float(value) -> bool:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return True
+        if not isinstance(value, str):
+            return False
+        try:
+            float(value)
+            return True
+        except ValueError:
+            return False
+
+    if all(is_int(value) for value in values):
+        return "BIGINT"
+    if all(is_float(value) for value in values):
+        return "DOUBLE PRECISION" if engine.dialect.name == "postgresql" else "FLOAT"
+    return "TEXT"
+
+
+def _create_table(db, table_name: str, columns: list[str], column_types: dict) -> None:
+    """Tạo bảng đích với kiểu cột đã suy ra hoặc được chỉ định."""
+    definitions = []
+    for column in columns:
+        column_type = column_types[column]
+        if not _COLUMN_TYPE_PATTERN.match(column_type):
+            raise ValueError(f"Invalid column type for '{column}': {column_type}")
+        definitions.append(f"{quote_identifier(column)} {column_type}")
+    db.execute(text(f"CREATE TABLE {quote_identifier(table_name)} ({', '.join(definitions)})"))
+
+
+def _load_batch(db, table_name: str, columns: list[str], batch: list[dict]) -> None:
+    """
+    Nạp một batch vào bảng bằng cách nhanh nhất của từng database:
+    COPY trên PostgreSQL, executemany (driver gộp thành INSERT nhiều row)
+    trên MySQL/SQLite.
+    """
+    table_sql = quote_identifier(table_name)
+    column_sql = ", ".join(quote_identifier(column) for column in columns)
+
+    if engine.dialect.name == "postgresql":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in batch:
+            # Trong COPY CSV, ô rỗng không có dấu nháy là NULL
+            writer.writerow(["" if row.get(column) is None else row.get(column) for column in columns])
+        buffer.seek(0)
+        cursor = db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {table_sql} ({column_sql}) FROM STDIN WITH (FORMAT csv)", buffer)
+        finally:
+            cursor.close()
+        return
+
+    placeholders = ", ".join(f":c{index}" for index in range(len(columns)))
+    db.execute(
+        text(f"INSERT INTO {table_sql} ({column_sql}) VALUES ({placeholders})"),
+        [
+            {f"c{index}": row.get(column) for index, column in enumerate(columns)}
+            for row in batch
+        ]
+    )
+
+
+def _checkpoint_path(file_path: str) -> str:
+    """File checkpoint ghi số batch đã commit, nằm cạnh file nguồn."""
+    return f"{file_path}.import-checkpoint.json"
+
+
+def import_status(path: str) -> dict:
+    """
+    Tiến độ của import đang chạy hoặc đã dừng vì lỗi (status "checkpoint"),
+    đọc từ file checkpoint:
+    số batch, số row đã commit và số byte của file đã đọc tới đó.
+    """
+    file_path = resolve_data_path(path)
+    checkpoint_file = _checkpoint_path(file_path)
+    if not os.path.exists(checkpoint_file):
+        return {"status": "none", "path": path, "message": f"No import checkpoint for {path}"}
+    with open(checkpoint_file, encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    return {
+        "status": "checkpoint",
+        "path": path,
+        **checkpoint,
+        "message": f"{checkpoint['committed_batches']} batches ({checkpoint.get('rows_imported', 0)} rows) "
+                   f"committed into '{checkpoint['table_name']}'"
+    }
+
+
+@traced("transfer.import_file")
+def import_file(
+    path: str,
+    table_name: str,
+    file_format: Optional[str] = None,
+    column_types: Optional[dict] = None,
+    create_table: bool = False,
+    batch_size: int = DEFAULT_IMPORT_BATCH_SIZE,
+    resume: bool = False
+) -> dict:
+    """
+    Đọc file CSV/NDJSON từng phần và nạp vào bảng theo batch, commit sau mỗi
+    batch. Tiến độ được ghi vào file checkpoint để có thể chạy lại với
+    resume=True sau khi bị lỗi giữa chừng.
+    Cột và kiểu cột của bảng mới lấy từ batch đầu tiên; batch sau có key
+    không phải cột của bảng thì import dừng với lỗi thay vì bỏ qua dữ liệu.
+    """
+    from sqlalchemy import inspect
+
+    file_path = resolve_data_path(path)
+    if not os.path.isfile(file_path):
+        raise ValueError(f"File not found: {path}")
+    file_format = (file_format or os.path.splitext(file_path)[1].lstrip(".")).lower()
+    if file_format not in IMPORT_FORMATS:
+        raise ValueError(f"Unsupported import format: {file_format}. Use one of {', '.join(IMPORT_FORMATS)}")
+    batch_size = max(1, int(batch_size))
+    column_types = dict(column_types or {})
+
+    checkpoint_file = _checkpoint_path(file_path)
+    start_batch = 0
+    previous_rows = 0
+    if resume and os.path.exists(checkpoint_file):
+        with open(checkpoint_file, encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        if checkpoint["table_name"] != table_name or checkpoint["batch_size"] != batch_size:
+            raise ValueError("Checkpoint does not match table_name/batch_size; run without resume")
+        start_batch = checkpoint["committed_batches"]
+        previous_rows = checkpoint.get("rows_imported", 0)
+
+    table_exists = table_name in inspect(internal_engine).get_table_names()
+    if not table_exists and not create_table:
+        raise ValueError(f"Table '{table_name}' not found. Set create_table to create it")
+
+    db = new_session()
+    committed_batches = start_batch
+    rows_imported = 0
+    bytes_read = 0
+    total_bytes = os.path.getsize(file_path)
+    columns: list[str] = []
+    table_columns: set[str] = set()
+    source = open(file_path, "rb")
+    try:
+        lines = _LineReader(source)
+        for index, batch in enumerate(_iter_batches(_read_rows(lines, file_format), batch_size)):
+            if index < start_batch:
+                continue
+            # Row NDJSON có thể thiếu key: lấy hợp các key theo thứ tự xuất hiện
+            keys = list(dict.fromkeys(key for row in batch for key in row))
+            if not table_columns:
+                if not table_exists:
+                    for column in keys:
+                        if column not in column_types:
+                            column_types[column] = _infer_column_type([row.get(column) for row in batch])
+                    _create_table(db, table_name, keys, column_types)
+                    table_exists = True
+                    table_columns = set(keys)
+                else:
+                    table_columns = {column["name"] for column in inspect(internal_engine).get_columns(table_name)}
+            # Kiểm tra cả batch đầu với bảng có sẵn, trước khi insert row nào
+            unknown = [key for key in keys if key not in table_columns]
+            if unknown:
+                raise ValueError(f"Columns not in table '{table_name}': {', '.join(unknown)}")
+            columns += [key for key in keys if key not in columns]
+
+            _load_batch(db, table_name, columns, batch)
+            db.commit()
+
+            committed_batches = index + 1
+            rows_imported += len(batch)
+            # _iter_batches trả batch ngay sau row cuối nên vị trí đọc đúng bằng cuối batch
+            bytes_read = lines.bytes_read
+            with open(checkpoint_file, "w", encoding="utf-8") as f:
+                json.dump({
+                    "table_name": table_name,
+                    "batch_size": batch_size,
+                    "committed_batches": committed_batches,
+                    "rows_imported": previous_rows + rows_imported,
+                    "bytes_read": bytes_read,
+                    "total_bytes": total_bytes
+                }, f)
+            logger.info(f"Imported batch {committed_batches} ({rows_imported} rows) into {table_name}")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Import into {table_name} stopped at batch {committed_batches + 1}: {e}")
+        return {
+            "status": "error",
+            "table_name": table_name,
+            "rows_imported": rows_imported,
+            "bytes_read": bytes_read,
+            "committed_batches": committed_batches,
+            "resume_from_batch": committed_batches,
+            "message": f"Import stopped at batch {committed_batches + 1}: {e}. "
+                       f"{committed_batches} batches are committed; rerun with resume=true to continue."
+        }
+    finally:
+        source.close()
+        db.close()
+
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
+    return {
+        "status": "success",
+        "table_name": table_name,
+        "rows_imported": rows_imported,
+        "bytes_read": bytes_read,
+        "committed_batches": committed_batches,
+        "skipped_batches": start_batch,
+        "column_types": column_types or None,
+        "message": f"Imported {rows_imported} rows into '{table_name}' in {committed_batches - start_batch} batches."
+    }
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+# File: app/validation.py
+"""
+Kiểm tra arguments của tool theo input_schema (JSON Schema) trước khi chạy.
+
+Schema được biên dịch một lần lúc register_tool thành các closure lồng nhau,
+nên mỗi lần gọi chỉ còn vài phép kiểm tra kiểu, không phải duyệt lại dict
+schema. Hỗ trợ tập con JSON Schema mà các tool dùng: type, properties,
+required, additionalProperties, items, enum, const, minimum/maximum,
+minLength/maxLength, minItems/maxItems. Keyword khác (description,
+default, ...) được bỏ qua.
+"""
+
+from typing import Any, Callable
+
+Check = Callable[[Any, str, list], None]
+
+_TYPE_CHECKS: dict[str, Callable[[Any], bool]] = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "boolean": lambda value: isinstance(value, bool),
+    "null": lambda value: value is None,
+    # bool là subclass của int trong Python nhưng không phải number trong JSON
+    "integer": lambda value: (
+        isinstance(value, int) and not isinstance(value, bool)
+    ) or (isinstance(value, float) and value.is_integer()),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+}
+
+
+class _StopChecks(Exception):
+    """Dừng các kiểm tra còn lại của một giá trị sai kiểu."""
+
+
+class InvalidParamsError(Exception):
+    """Arguments không khớp input_schema của tool."""
+
+    def __init__(self, message: str, errors: list[str]):
+        super().__init__(message)
+        self.errors = errors
+
+
+def _compile(schema: dict) -> list[Check]:
+    checks: list[Check] = []
+
+    expected = schema.get("type")
+    if expected is not None:
+        names = [expected] if isinstance(expected, str) else list(expected)
+        type_checks = [_TYPE_CHECKS[name] for name in names if name in _TYPE_CHECKS]
+        label = " or ".join(names)
+
+        def check_type(value, path, errors):
+            if not any(type_check(value) for type_check in type_checks):
+                errors.append(f"{path}: expected {label}, got {type(value).__name__}")
+                # Sai kiểu thì các kiểm tra sau không còn ý nghĩa
+                raise _StopChecks()
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = list(schema["enum"])
+
+        def check_enum(value, path, errors):
+            if value not in allowed:
+                errors.append(f"{path}: must be one of {allowed}")
+        checks.append(check_enum)
+
+    if "const" in schema:
+        const = schema["const"]
+
+        def check_const(value, path, errors):
+            if value != const:
+                errors.append(f"{path}: must be {const!r}")
+        checks.append(check_const)
+
+    if "minimum" in schema or "maximum" in schema:
+        minimum, maximum = schema.get("minimum"), schema.get("maximum")
+
+        def check_range(value, path, errors):
+            if not _TYPE_CHECKS["number"](value):
+                return
+            if minimum is not None and value < minimum:
+                errors.append(f"{path}: must be >= {minimum}")
+            if maximum is not None and value > maximum:
+                errors.append(f"{path}: must be <= {maximum}")
+        checks.append(check_range)
+
+    for min_keyword, max_keyword, kind in (("minLength", "maxLength", str), ("minItems", "maxItems", list)):
+        if min_keyword in schema or max_keyword in schema:
+            checks.append(_length_check(schema.get(min_keyword), schema.get(max_keyword), kind))
+
+    properties = {name: compile_schema(sub) for name, sub in schema.get("properties", {}).items()}
+    integer_properties = {name for name, sub in schema.get("properties", {}).items() if _is_integer_schema(sub)}
+    required = list(schema.get("required", []))
+    additional = schema.get("additionalProperties", True)
+    additional_check = compile_schema(additional) if isinstance(additional, dict) else None
+    if properties or required or additional is not True:
+        def check_object(value, path, errors):
+            if not isinstance(value, dict):
+                return
+            for name in required:
+                if name not in value:
+                    errors.append(f"{path}: missing required property '{name}'")
+            for name, item in value.items():
+                property_check = properties.get(name)
+                if property_check is not None:
+                    property_check(item, f"{path}.{name}", errors)
+                    if name in integer_properties and isinstance(item, float) and item.is_integer():
+                        value[name] = int(item)
+                elif additional is False:
+                    errors.append(f"{path}: unexpected property '{name}'")
+                elif additional_check is not None:
+                    additional_check(item, f"{path}.{name}", errors)
+        checks.append(check_object)
+
+    if isinstance(schema.get("items"), dict):
+        item_check = compile_schema(schema["items"])
+        integer_items = _is_integer_schema(schema["items"])
+
+        def check_items(value, path, errors):
+            if isinstance(value, list):
+                for index, item in enumerate(value):
+                    item_check(item, f"{path}[{index}]", errors)
+                    if integer_items and isinstance(item, float) and item.is_integer():
+                        value[index] = int(item)
+        checks.append(check_items)
+
+    return checks
+
+
+def _is_integer_schema(schema: dict) -> bool:
+    """
+    Schema chỉ nhận integer: JSON cho phép 1.0 là integer, nhưng tool dùng
+    giá trị như int Python nên 1.0 được đổi thành 1 sau khi kiểm tra.
+    """
+    expected = schema.get("type") if isinstance(schema, dict) else None
+    names = [expected] if isinstance(expected, str) else list(expected or [])
+    return "integer" in names and "number" not in names
+
+
+def _length_check(minimum, maximum, kind: type) -> Check:
+    def check(value, path, errors):
+        if not isinstance(value, kind):
+            return
+        if minimum is not None and len(value) < minimum:
+            errors.append(f"{path}: length must be at least {minimum}")
+        if maximum is not None and len(value) > maximum:
+            errors.append(f"{path}: length must be at most {maximum}")
+    return check
+
+
+def compile_schema(schema: dict) -> Check:
+    """Biên dịch schema thành hàm check(value, path, errors) ghi lỗi vào errors."""
+    checks = _compile(schema or {})
+    if not checks:
+        return lambda value, path, errors: None
+
+    def check(value, path, errors):
+        try:
+            for single_check in checks:
+                single_check(value, path, errors)
+        except _StopChecks:
+            pass
+    return check
+
+
+def compile_validator(schema: dict) -> Callable[[Any], None]:
+    """
+    Validator cho arguments của tool: raise InvalidParamsError nếu không hợp
+    lệ. Số nguyên gửi dạng float (1.0) được đổi thành int ngay trong arguments.
+    """
+    check = compile_schema(schema)
+
+    def validate(arguments: Any) -> None:
+        errors: list[str] = []
+        check(arguments, "arguments", errors)
+        if errors:
+            raise InvalidParamsError(f"Invalid arguments: {'; '.join(errors)}", errors)
+    return validate
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# File: app/values.py
+"""
+Xử lý giá trị TEXT/BLOB lớn trong kết quả trả cho client.
+
+- TEXT dài hơn giới hạn preview chỉ trả về đoạn đầu, kèm độ dài thật.
+- Binary (bytes, memoryview) được trả dạng base64, nhưng chỉ đoạn preview
+  được mã hóa: phần còn lại không bị copy hay encode.
+- Khi client yêu cầu, giá trị bị cắt được ghi xuống file trong
+  MCP_VALUE_DIR và trả về handle để đọc đầy đủ theo từng đoạn bằng
+  fetch_value. Handle hết hạn sau MCP_VALUE_TTL giây; vì nằm trên file
+  nên worker nào cũng đọc được.
+"""
+
+import base64
+import os
+import re
+import secrets
+import time
+from typing import Any, Optional
+
+from app.config import VALUE_DIR, VALUE_TTL
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_CHUNK_SIZE = 65536
+MAX_CHUNK_SIZE = 1048576
+
+_HANDLE = re.compile(r"^[0-9a-f]{32}$")
+# Khoảng thời gian tối thiểu giữa hai lần quét thư mục để xóa handle hết hạn
+_EXPIRE_INTERVAL = 60
+# Số ký tự đọc mỗi lần khi bỏ qua phần đầu của giá trị TEXT
+_SKIP_BLOCK = 65536
+
+
+class ValueNotFoundError(Exception):
+    """Handle không tồn tại hoặc đã hết hạn."""
+
+
+class ValueStore:
+    """Lưu giá trị đầy đủ của các ô bị cắt để đọc lại theo đoạn."""
+
+    def __init__(self, value_dir: str, ttl: float):
+        self.value_dir = value_dir
+        self.ttl = ttl
+        self._last_expire = 0.0
+
+    def _find(self, handle: str) -> tuple[str, str]:
+        if _HANDLE.match(handle or ""):
+            for kind, extension in (("text", ".txt"), ("binary", ".bin")):
+                path = os.path.join(self.value_dir, handle + extension)
+                if os.path.exists(path):
+                    return path, kind
+        raise ValueNotFoundError(f"Value handle '{handle}' not found or expired (TTL {self.ttl:g}s)")
+
+    def put(self, value: Any) -> str:
+        """Ghi giá trị (str hoặc bytes-like) xuống file, trả về handle."""
+        if time.monotonic() - self._last_expire >= _EXPIRE_INTERVAL:
+            self.expire()
+        os.makedirs(self.value_dir, exist_ok=True)
+        handle = secrets.token_hex(16)
+        if isinstance(value, str):
+            with open(os.path.join(self.value_dir, handle + ".txt"), "w", encoding="utf-8", newline="") as f:
+                f.write(value)
+        else:
+            with open(os.path.join(self.value_dir, handle + ".bin"), "wb") as f:
+                f.write(value)
+        return handle
+
+    def fetch(self, handle: str, offset: int = 0, length: int = DEFAULT_CHUNK_SIZE) -> dict:
+        """
+        Đọc một đoạn của giá trị: offset/length tính theo ký tự với TEXT,
+        theo byte với binary (trả về dạng base64).
+        """
+        path, kind = self._find(handle)
+        offset = max(0, int(offset))
+        length = min(max(1, int(length)), MAX_CHUNK_SIZE)
+
+        if kind == "binary":
+            size = os.path.getsize(path)
+            with open(path, "rb") as f:
+                f.seek(offset)
+                chunk = f.read(length)
+            next_offset = offset + len(chunk)
+            return {
+                "status": "success",
+                "handle": handle,
+                "kind": kind,
+                "encoding": "base64",
+                "offset": offset,
+                "length": len(chunk),
+                "size": size,
+                "next_offset": next_offset if next_offset < size else None,
+                "data": base64.b64encode(chunk).decode("ascii"),
+                "message": f"Bytes {offset}-{next_offset} of {size}."
+            }
+
+        with open(path, encoding="utf-8", newline="") as f:
+            remaining = offset
+            while remaining > 0 and f.read(min(remaining, _SKIP_BLOCK)):
+                remaining -= min(remaining, _SKIP_BLOCK)
+            chunk = f.read(length)
+            has_more = bool(f.read(1))
+        next_offset = offset + len(chunk)
+        return {
+            "status": "success",
+            "handle": handle,
+            "kind": kind,
+            "offset": offset,
+            "length": len(chunk),
+            "next_offset": next_offset if has_more else None,
+            "data": chunk,
+            "message": f"Characters {offset}-{next_offset}" + (" (more available)." if has_more else " (end of value).")
+        }
+
+    def expire(self) -> list[str]:
+        """Xóa các giá trị đã lưu quá ttl giây."""
+        self._last_expire = time.monotonic()
+        if not os.path.isdir(self.value_dir):
+            return []
+        expired = []
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.value_dir):
+            handle, extension = os.path.splitext(name)
+            if extension not in (".txt", ".bin") or not _HANDLE.match(handle):
+                continue
+            try:
+                if os.path.getmtime(os.path.join(self.value_dir, name)) < cutoff:
+                    os.remove(os.path.join(self.value_dir, name))
+                    expired.append(handle)
+            except FileNotFoundError:
+                continue
+        return expired
+
+
+VALUE_STORE = ValueStore(VALUE_DIR, VALUE_TTL)
+
+
+def preview_value(value: Any, max_chars: int, max_bytes: int, store: Optional[ValueStore] = None) -> Any:
+    """
+    Giá trị trả cho client: TEXT dài và binary được rút gọn thành dict
+    mô tả (độ dài thật, đoạn đầu, handle nếu có store). Giới hạn 0 nghĩa
+    là không cắt.
+    """
+    if isinstance(value, str):
+        if not max_chars or len(value) <= max_chars:
+            return value
+        preview = {"truncated": True, "length": len(value), "preview": value[:max_chars]}
+        if store is not None:
+            preview["handle"] = store.put(value)
+        return preview
+
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        view = memoryview(value)
+        size = view.nbytes
+        truncated = bool(max_bytes) and size > max_bytes
+        # Chỉ mã hóa phần được trả về; slice memoryview không copy dữ liệu
+        data = view[:max_bytes] if truncated else view
+        preview = {
+            "encoding": "base64",
+            "size": size,
+            "truncated": truncated,
+            "data": base64.b64encode(data).decode("ascii"),
+        }
+        if truncated and store is not None:
+            preview["handle"] = store.put(view)
+        return preview
+    return value
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+# File: bench/conftest.py
+"""
+Trỏ app tới SQLite tạm để import app không đụng tới database thật.
+"""
+
+import os
+import tempfile
+
+_BENCH_DB_DIR = tempfile.mkdtemp(prefix="database-mcp-bench-")
+os.environ.setdefault("DATABASE_TYPE", "sqlite")
+os.environ.setdefault(
+    "SQLITE_URL", f"sqlite:///{os.path.join(_BENCH_DB_DIR, 'bench.db')}"
+)
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+# File: bench/mcp_load.py
+"""
+Load test cho endpoint /mcp/ chạy hoàn toàn in-process trên SQLite.
+
+Gửi các request tools/call đồng thời qua ASGI transport (không cần server
+hay database bên ngoài), đo throughput và latency p50/p95/p99 cho từng tool
+và từng kích thước kết quả, rồi lưu kết quả kèm commit hiện tại vào
+bench/results.jsonl để so sánh giữa các commit.
+
+Chạy:
+    python -m bench.mcp_load --requests 200 --concurrency 16
+    python -m bench.mcp_load --compare   # so với lần chạy trước
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.jsonl")
+MAX_ROWS = 10000
+
+# Mỗi scenario: (tên, tool, arguments)
+SCENARIOS = [
+    ("echo", "echo", {"message": "ping"}),
+    ("get_database_info", "get_database_info", {}),
+    ("get_table_info", "get_table_info", {"table_name": "bench_items"}),
+    ("get_schema_summary", "get_schema_summary", {}),
+    ("sample_table[100]", "sample_table", {"table_name": "bench_items", "limit": 100}),
+    ("execute_query[10]", "execute_query", {"query": "SELECT * FROM bench_items LIMIT 10"}),
+    ("execute_query[1000]", "execute_query", {"query": "SELECT * FROM bench_items LIMIT 1000"}),
+    ("execute_query[10000]", "execute_query", {"query": "SELECT * FROM bench_items LIMIT 10000"}),
+]
+
+
+def _configure_environment(db_path: str) -> None:
+    """Trỏ app tới SQLite tạm; phải gọi trước khi import app."""
+    os.environ["DATABASE_TYPE"] = "sqlite"
+    os.environ["SQLITE_URL"] = f"sqlite:///{db_path}"
+    # Đo năng lực của server, không đo rate limit của API key
+    os.environ.setdefault("MCP_RATE_LIMIT", "1000000")
+    os.environ.setdefault("MCP_RATE_BURST", "1000000")
+    os.environ.setdefault("MCP_MAX_CONCURRENT_PER_KEY", "1000")
+    # Mọi request của một kịch bản giống hệt nhau: gộp single-flight sẽ đo việc
+    # chia sẻ kết quả thay vì thông lượng database
+    os.environ.setdefault("MCP_COALESCE_READS", "false")
+
+
+def _seed_database() -> None:
+    """Tạo bảng bench_items với MAX_ROWS row có nhiều kiểu dữ liệu."""
+    from app.db import engine, init_db
+    from sqlalchemy import text
+
+    init_db()
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS bench_items"))
+        conn.execute(text(
+            "CREATE TABLE bench_items (id INTEGER PRIMARY KEY, name VARCHAR(50), "
+            "price NUMERIC(10, 2), created_at TIMESTAMP, note TEXT)"
+        ))
+        conn.execute(
+            text("INSERT INTO bench_items VALUES (:id, :name, :price, :created_at, :note)"),
+            [
+                {
+                    "id": i,
+                    "name": f"item-{i}",
+                    "price": i * 0.25,
+                    "created_at": datetime(2025, 1, 1, 12, 0, 0),
+                    "note": "x" * (i % 64),
+                }
+                for i in range(MAX_ROWS)
+            ]
+        )
+
+
+def _percentile(samples: list[float], percent: float) -> float:
+    """Percentile theo nearest-rank."""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def _run_scenario(client, tool: str, arguments: dict, total: int, concurrency: int) -> dict:
+    """Gửi total request với tối đa concurrency request đồng thời."""
+    from app.config import MCP_API_KEY
+
+    headers = {"MCP_API_KEY": MCP_API_KEY}
+    latencies: list[float] = []
+    errors = 0
+    response_bytes = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_call(request_id: int) -> None:
+        nonlocal errors, response_bytes
+        payload = {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "method": "tools/call",
+            "params": {"name": tool, "arguments": arguments},
+        }
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post("/mcp/", json=payload, headers=headers)
+            latencies.append((time.perf_counter() - started) * 1000)
+        response_bytes += len(response.content)
+        body = response.json()
+        content = (body.get("result") or {}).get("content") or [{}]
+        if response.status_code != 200 or "error" in body or str(content[0].get("text", "")).startswith("Error"):
+            errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_call(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": round(total / elapsed, 2),
+        "p50_ms": round(_percentile(latencies, 50), 3),
+        "p95_ms": round(_percentile(latencies, 95), 3),
+        "p99_ms": round(_percentile(latencies, 99), 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "avg_response_bytes": response_bytes // total,
+    }
+
+
+async def run_benchmark(total: int, concurrency: int, only: list[str]) -> dict:
+    """Chạy các scenario (sau một lượt warm-up) và trả về kết quả theo tên."""
+    import httpx
+    from app.main import app
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, tool, arguments in SCENARIOS:
+            if only and name not in only:
+                continue
+            await _run_scenario(client, tool, arguments, min(total, 10), 1)
+            results[name] = await _run_scenario(client, tool, arguments, total, concurrency)
+            print(
+                f"{name:<24} {results[name]['throughput_rps']:>9.1f} req/s  "
+                f"p50 {results[name]['p50_ms']:>8.2f} ms  "
+                f"p95 {results[name]['p95_ms']:>8.2f} ms  "
+                f"p99 {results[name]['p99_ms']:>8.2f} ms  "
+                f"errors {results[name]['errors']}"
+            )
+    return results
+
+
+def _git_commit() -> str:
+    """Commit hiện tại (kèm dấu * nếu working tree có thay đổi)."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+        return f"{commit}*" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _load_previous(results_file: str) -> dict | None:
+    """Đọc lần chạy gần nhất trong file kết quả."""
+    if not os.path.exists(results_file):
+        return None
+    last = None
+    with open(results_file, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                last = json.loads(line)
+    return last
+
+
+def _print_comparison(previous: dict, current: dict) -> None:
+    """In thay đổi throughput/p95 so với lần chạy trước."""
+    print(f"\nCompared with {previous['commit']} ({previous['timestamp']}):")
+    for name, result in current["scenarios"].items():
+        before = previous["scenarios"].get(name)
+        if not before:
+            continue
+        rps_change = (result["throughput_rps"] / before["throughput_rps"] - 1) * 100
+        p95_change = (result["p95_ms"] / before["p95_ms"] - 1) * 100 if before["p95_ms"] else 0.0
+        print(f"{name:<24} throughput {rps_change:+7.1f}%   p95 {p95_change:+7.1f}%")
+
+
+def main() -> None:
+    """Entry point cho command line."""
+    parser = argparse.ArgumentParser(description="In-process load test for the MCP endpoint")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent requests")
+    parser.add_argument("--scenario", action="append", default=[], help="run only this scenario (repeatable)")
+    parser.add_argument("--results-file", default=RESULTS_FILE, help="JSONL file to append results to")
+    parser.add_argument("--compare", action="store_true", help="compare with the previous stored run")
+    parser.add_argument("--no-save", action="store_true", help="do not append results")
+    parser.add_argument("--with-logging", action="store_true", help="keep application and SQL echo logging enabled")
+    args = parser.parse_args()
+
+    db_dir = tempfile.mkdtemp(prefix="database-mcp-bench-")
+    _configure_environment(os.path.join(db_dir, "bench.db"))
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from app.db import engine
+    if not args.with_logging:
+        # Logging ra console chiếm phần lớn thời gian, không phải thứ cần đo
+        engine.echo = False
+        logging.disable(logging.WARNING)
+
+    _seed_database()
+    scenarios = asyncio.run(run_benchmark(args.requests, args.concurrency, args.scenario))
+
+    run = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "coalesce_reads": os.environ["MCP_COALESCE_READS"],
+        "scenarios": scenarios,
+    }
+    previous = _load_previous(args.results_file)
+    if args.compare and previous:
+        _print_comparison(previous, run)
+    if not args.no_save:
+        with open(args.results_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(run) + "\n")
+        print(f"\nResults appended to {args.results_file}")
+
+
+if __name__ == "__main__":
+    main()
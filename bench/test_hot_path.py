@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# File: bench/test_hot_path.py
+"""
+Micro-benchmark cho từng bước trên đường nóng của execute_query:
+chuyển đổi row -> dict, json.dumps trong tool_execute_query, tạo
+JsonRpcResponse và dispatch qua handle_tools_call.
+
+Chạy (cần pytest-benchmark):
+    python -m pytest bench/test_hot_path.py --benchmark-only
+    MCP_BENCH_LARGE=1 python -m pytest bench/test_hot_path.py --benchmark-only   # thêm 1M row
+    python -m pytest bench/test_hot_path.py --benchmark-only --benchmark-autosave --benchmark-compare
+"""
+
+import asyncio
+import json
+import os
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from app.db import rows_to_dicts
+from app.json_rpc import create_success_response, render_response
+from app.mcp import handle_tools_call, register_tool, TOOL_HANDLERS
+
+ROW_COUNTS = [1_000, 100_000]
+if os.getenv("MCP_BENCH_LARGE"):
+    ROW_COUNTS.append(1_000_000)
+
+# Schema hẹp: 4 cột; schema rộng: 32 cột lặp lại các kiểu phổ biến
+NARROW_COLUMNS = 4
+WIDE_COLUMNS = 32
+_VALUE_FACTORIES = [
+    lambda i: i,
+    lambda i: f"name-{i}",
+    lambda i: Decimal(i) / 4,
+    lambda i: datetime(2025, 1, 1, i % 24, i % 60),
+]
+
+_cache: dict = {}
+
+
+def synthetic_result(rows: int, width: int) -> tuple[list[str], list[tuple]]:
+    """Tạo (columns, rows) giống kết quả fetchall(); cache để tái sử dụng."""
+    key = (rows, width)
+    if key not in _cache:
+        columns = [f"col_{index}" for index in range(width)]
+        data = [
+            tuple(_VALUE_FACTORIES[index % len(_VALUE_FACTORIES)](i) for index in range(width))
+            for i in range(rows)
+        ]
+        _cache[key] = (columns, data)
+    return _cache[key]
+
+
+def _shape_id(rows: int, width: int) -> str:
+    return f"{rows}x{width}"
+
+
+SHAPES = [
+    pytest.param(rows, width, id=_shape_id(rows, width))
+    for rows in ROW_COUNTS
+    for width in (NARROW_COLUMNS, WIDE_COLUMNS)
+]
+
+
+@pytest.mark.parametrize("rows, width", SHAPES)
+def test_row_conversion(benchmark, rows, width):
+    """Bước chuyển row -> dict với convert_value."""
+    columns, data = synthetic_result(rows, width)
+    result = benchmark(rows_to_dicts, columns, data)
+    assert len(result) == rows
+
+
+@pytest.mark.parametrize("rows, width", SHAPES)
+def test_json_encoding(benchmark, rows, width):
+    """json.dumps giống tool_execute_query (indent=2, ensure_ascii=False)."""
+    columns, data = synthetic_result(rows, width)
+    converted = rows_to_dicts(columns, data)
+    text = benchmark(json.dumps, converted, indent=2, ensure_ascii=False)
+    assert text.startswith("[")
+
+
+@pytest.mark.parametrize("rows, width", SHAPES)
+def test_response_model(benchmark, rows, width):
+    """Tạo JsonRpcResponse và encode bằng render_response như endpoint /mcp/."""
+    columns, data = synthetic_result(rows, width)
+    content = {
+        "content": [
+            {"type": "text", "text": f"Query executed successfully. Found {rows} rows."},
+            {"type": "text", "text": json.dumps(rows_to_dicts(columns, data), indent=2, ensure_ascii=False)},
+        ]
+    }
+
+    def build_and_render():
+        return render_response(create_success_response(content, 1)).body
+
+    payload = benchmark(build_and_render)
+    assert payload.endswith(b'"id":1}')
+
+
+@pytest.fixture
+def static_tool():
+    """Tool trả về nội dung dựng sẵn để chỉ đo chi phí dispatch."""
+    name = "bench_static"
+    response = {"content": [{"type": "text", "text": "ok"}]}
+
+    @register_tool(name, description="Benchmark tool", input_schema={"type": "object", "properties": {}})
+    async def tool_bench_static(arguments: dict) -> dict:
+        return response
+
+    yield name
+    TOOL_HANDLERS.pop(name, None)
+
+
+def test_tools_call_dispatch(benchmark, static_tool):
+    """Chi phí handle_tools_call (lookup registry + await tool)."""
+    loop = asyncio.new_event_loop()
+    params = {"name": static_tool, "arguments": {}}
+    try:
+        result = benchmark(lambda: loop.run_until_complete(handle_tools_call(params)))
+    finally:
+        loop.close()
+    assert result["content"][0]["text"] == "ok"
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# File: test/conftest.py
+"""
+Cấu hình pytest dùng chung: trỏ app tới một file SQLite tạm để các test
+chạy in-process, không cần server hay database bên ngoài.
+"""
+
+import os
+import tempfile
+
+import pytest
+
+_TEST_DB_DIR = tempfile.mkdtemp(prefix="database-mcp-test-")
+os.environ.setdefault("DATABASE_TYPE", "sqlite")
+os.environ.setdefault(
+    "SQLITE_URL", f"sqlite:///{os.path.join(_TEST_DB_DIR, 'test.db')}"
+)
+os.environ.setdefault("MCP_DATA_DIR", os.path.join(_TEST_DB_DIR, "data"))
+os.environ.setdefault("MCP_JOB_DIR", os.path.join(_TEST_DB_DIR, "jobs"))
+os.environ.setdefault("MCP_SNAPSHOT_DIR", os.path.join(_TEST_DB_DIR, "snapshots"))
+os.environ.setdefault("MCP_VALUE_DIR", os.path.join(_TEST_DB_DIR, "values"))
+
+
+@pytest.fixture
+def sample_tables():
+    """Tạo hai bảng mẫu customers/orders và xóa sau khi test xong."""
+    from app.db import execute_transaction
+
+    execute_transaction([
+        {"query": "CREATE TABLE customers (id INTEGER PRIMARY KEY, name VARCHAR(50) NOT NULL, city VARCHAR(50))"},
+        {"query": "CREATE TABLE orders (id INTEGER PRIMARY KEY, customer_id INTEGER REFERENCES customers(id), amount NUMERIC(10, 2))"},
+        {"query": "INSERT INTO customers (id, name, city) VALUES (1, 'An', 'Hanoi'), (2, 'Binh', 'Hue'), (3, 'Chi', NULL)"},
+        {"query": "INSERT INTO orders (id, customer_id, amount) VALUES (1, 1, 10.5), (2, 1, 20), (3, 2, 7.25)"},
+    ])
+    yield ["customers", "orders"]
+    execute_transaction([
+        {"query": "DROP TABLE IF EXISTS orders"},
+        {"query": "DROP TABLE IF EXISTS customers"},
+    ])
+
+
+@pytest.fixture
+def mcp_client():
+    """TestClient gọi router /mcp/ in-process, đã kèm header API key."""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from app.config import MCP_API_KEY
+    from app.mcp import router
+
+    app = FastAPI()
+    app.include_router(router, prefix="/mcp")
+    with TestClient(app, headers={"MCP_API_KEY": MCP_API_KEY}) as client:
+        yield client
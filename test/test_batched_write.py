@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# File: test_batched_write.py
+"""
+Test batched_write: UPDATE/DELETE theo từng khoảng primary key.
+"""
+
+import pytest
+
+from app.db import batched_write, execute_query, execute_transaction
+
+
+@pytest.fixture
+def events():
+    execute_transaction([
+        {"query": "CREATE TABLE bw_events (id INTEGER PRIMARY KEY, kind VARCHAR(10) NOT NULL, status VARCHAR(10))"},
+        {"query": "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 25) "
+                  "INSERT INTO bw_events (id, kind, status) SELECT x, CASE WHEN x % 2 = 0 THEN 'even' ELSE 'odd' END, 'new' FROM c"},
+    ])
+    yield "bw_events"
+    execute_transaction([{"query": "DROP TABLE bw_events"}])
+
+
+def _count(where):
+    return execute_query(f"SELECT COUNT(*) AS n FROM bw_events WHERE {where}")[0]["n"]
+
+
+def test_delete_in_chunks(events):
+    result = batched_write(events, "delete", "kind = :kind", params={"kind": "odd"}, chunk_size=5)
+
+    assert result["status"] == "success"
+    assert result["rows_affected"] == 13
+    assert result["chunks"] == 3
+    assert _count("1=1") == 12
+    assert result["resume_token"] is None
+
+
+def test_update_can_stop_and_resume(events):
+    """max_chunks dừng giữa chừng; resume_token chạy tiếp đúng chỗ, không làm lại."""
+    first = batched_write(events, "update", "1=1", values={"status": "done"}, chunk_size=10, max_chunks=1)
+
+    assert first["status"] == "partial"
+    assert first["rows_affected"] == 10
+    assert _count("status = 'done'") == 10
+
+    rest = batched_write(events, "update", "1=1", values={"status": "done"}, chunk_size=10,
+                         resume_token=first["resume_token"])
+
+    assert rest["status"] == "success"
+    assert rest["rows_affected"] == 15
+    assert _count("status = 'done'") == 25
+
+
+def test_failed_chunk_reports_resume_token(events):
+    """Lỗi giữa chừng giữ lại các chunk đã commit và trả về chỗ để chạy tiếp."""
+    execute_transaction([{"query": (
+        "CREATE TRIGGER bw_fail BEFORE UPDATE ON bw_events WHEN old.id = 15 "
+        "BEGIN SELECT RAISE(ABORT, 'row 15 is locked'); END"
+    )}])
+    failed = batched_write(events, "update", "1=1", values={"status": "done"}, chunk_size=10)
+
+    assert failed["status"] == "error"
+    assert "row 15 is locked" in failed["error"]
+    assert failed["chunks"] == 1
+    assert _count("status = 'done'") == 10
+
+    execute_transaction([{"query": "DROP TRIGGER bw_fail"}])
+    resumed = batched_write(events, "update", "1=1", values={"status": "done"}, chunk_size=10,
+                            resume_token=failed["resume_token"])
+
+    assert resumed["rows_affected"] == 15
+    assert _count("status = 'done'") == 25
+
+
+def test_rejects_unsafe_input(events):
+    with pytest.raises(ValueError):
+        batched_write(events, "delete", "1=1; DROP TABLE customers")
+    with pytest.raises(ValueError):
+        batched_write(events, "update", "1=1", values={"id": 5})
+    with pytest.raises(ValueError):
+        batched_write(events, "truncate", "1=1")
+    with pytest.raises(ValueError):
+        batched_write(events, "delete", "")
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# File: test_coalesce.py
+"""
+Test gộp tool call trùng nhau (single-flight).
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from app.coalesce import SingleFlight, coalesce_key, is_deterministic_sql
+from app.sessions import bind_connection
+
+
+def test_key_ignores_argument_order():
+    assert coalesce_key("t", {"a": 1, "b": 2}) == coalesce_key("t", {"b": 2, "a": 1})
+    assert coalesce_key("t", {"a": 1}) != coalesce_key("u", {"a": 1})
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"rows": [1]}
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do("k", work) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+
+    assert len(calls) == 1
+    assert [shared for _, shared in results].count(False) == 1
+    assert all(result == {"rows": [1]} for result, _ in results)
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 4}
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def scenario():
+        leader = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(scenario()) == ("done", True)
+
+
+def test_error_is_shared_and_not_cached():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def scenario():
+        return await asyncio.gather(flight.do("k", fail), flight.do("k", fail), return_exceptions=True)
+
+    assert all(isinstance(error, RuntimeError) for error in asyncio.run(scenario()))
+    assert flight.stats()["in_flight"] == 0
+
+
+@pytest.fixture
+def slow_execute_query(monkeypatch):
+    calls = []
+
+    def fake_execute_query(query, params=None, *options):
+        calls.append(query)
+        time.sleep(0.05)
+        return [{"n": 1}]
+
+    monkeypatch.setattr("app.mcp.execute_query", fake_execute_query)
+    return calls
+
+
+def test_volatile_sql_is_detected():
+    assert is_deterministic_sql("SELECT name FROM customers WHERE id = 1")
+    assert is_deterministic_sql("SELECT random_code FROM t")
+    assert not is_deterministic_sql("SELECT * FROM t ORDER BY random() LIMIT 5")
+    assert not is_deterministic_sql("SELECT nextval('seq')")
+    assert not is_deterministic_sql("SELECT CURRENT_TIMESTAMP")
+
+
+def _call_twice(query="SELECT 1 AS n"):
+    from app.mcp import handle_tools_call
+
+    params = {"name": "execute_query", "arguments": {"query": query}}
+    return asyncio.gather(handle_tools_call(params), handle_tools_call(params))
+
+
+def test_identical_tool_calls_hit_database_once(slow_execute_query):
+    async def scenario():
+        return await _call_twice()
+
+    first, second = asyncio.run(scenario())
+
+    assert slow_execute_query == ["SELECT 1 AS n"]
+    assert first == second
+
+
+def test_session_bound_calls_are_not_coalesced(slow_execute_query):
+    """Request trên connection được ghim có thể thấy temp table riêng, không gộp."""
+    async def scenario():
+        with bind_connection(object()):
+            return await _call_twice()
+
+    asyncio.run(scenario())
+
+    assert len(slow_execute_query) == 2
+
+
+def test_volatile_queries_are_not_coalesced(slow_execute_query):
+    async def scenario():
+        return await _call_twice("SELECT random() AS n")
+
+    asyncio.run(scenario())
+
+    assert len(slow_execute_query) == 2
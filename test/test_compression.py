@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# File: test_compression.py
+"""
+Test nén response theo Accept-Encoding.
+"""
+
+import gzip
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.compression import CompressionMiddleware, negotiate_encoding
+
+_LARGE = {"rows": [{"id": i, "name": f"customer {i}"} for i in range(500)]}
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
+    @app.get("/large")
+    def large():
+        return _LARGE
+
+    @app.get("/small")
+    def small():
+        return {"ok": True}
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse((f"line {i}\n" for i in range(100)), media_type="text/plain")
+
+    @app.get("/precompressed")
+    def precompressed():
+        return JSONResponse(_LARGE, headers={"Content-Encoding": "identity"})
+
+    with TestClient(app) as client:
+        yield client
+
+
+def test_negotiate_encoding():
+    supported = ["zstd", "br", "gzip"]
+    assert negotiate_encoding("gzip, deflate", supported) == "gzip"
+    assert negotiate_encoding("gzip;q=0.5, br", supported) == "br"
+    assert negotiate_encoding("*", supported) == "zstd"
+    assert negotiate_encoding("gzip;q=0", supported) is None
+    assert negotiate_encoding("identity", supported) is None
+
+
+def test_large_response_is_gzipped(client):
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert response.json() == _LARGE
+
+
+def test_small_response_is_not_compressed(client):
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert response.json() == {"ok": True}
+
+
+def test_not_compressed_without_accept_encoding(client):
+    response = client.get("/large", headers={"Accept-Encoding": ""})
+
+    assert "content-encoding" not in response.headers
+
+
+def test_unavailable_encoding_falls_back_to_identity(client):
+    response = client.get("/large", headers={"Accept-Encoding": "unknown-codec"})
+
+    assert "content-encoding" not in response.headers
+
+
+def test_streaming_response_is_compressed_per_chunk(client):
+    with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+        raw = b"".join(response.iter_raw())
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert gzip.decompress(raw).decode() == "".join(f"line {i}\n" for i in range(100))
+
+
+def test_already_encoded_response_is_left_alone(client):
+    response = client.get("/precompressed", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "identity"
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# File: test_data_tools.py
+"""
+Test các tool đọc dữ liệu: sample_table, profile_table, scan_table.
+"""
+
+import pytest
+
+from app.db import execute_transaction, sample_table, scan_table
+
+
+def test_sample_table_projects_columns(sample_tables):
+    """Chỉ trả về các cột được yêu cầu và không vượt quá limit."""
+    result = sample_table("customers", columns=["name"], limit=2)
+
+    assert result["method"] == "random_rowid"
+    assert result["row_count"] == 2
+    assert all(list(row) == ["name"] for row in result["rows"])
+
+
+def test_sample_table_converts_values(sample_tables):
+    """Giá trị Decimal được chuyển qua cùng đường convert như execute_query."""
+    result = sample_table("orders", columns=["amount"], limit=10)
+
+    assert sorted(row["amount"] for row in result["rows"]) == [7.25, 10.5, 20.0]
+
+
+def test_sample_table_without_rowid():
+    """Bảng WITHOUT ROWID không có rowid nên lấy mẫu bằng ORDER BY random()."""
+    execute_transaction([
+        {"query": "CREATE TABLE tags (name TEXT PRIMARY KEY, hits INTEGER) WITHOUT ROWID"},
+        {"query": "INSERT INTO tags VALUES ('a', 1), ('b', 2), ('c', 3)"},
+    ])
+    try:
+        result = sample_table("tags", limit=2)
+    finally:
+        execute_transaction([{"query": "DROP TABLE tags"}])
+
+    assert result["method"] == "order_by_random"
+    assert result["row_count"] == 2
+
+
+@pytest.mark.parametrize("percent", [0, -5, 150])
+def test_sample_table_rejects_invalid_percent(sample_tables, percent):
+    """percent ngoài khoảng (0, 100] bị từ chối trước khi tới database."""
+    with pytest.raises(ValueError, match="percent"):
+        sample_table("customers", percent=percent)
+
+
+def test_sample_table_rejects_unknown_column(sample_tables):
+    """Tên cột không tồn tại bị từ chối trước khi ghép vào SQL."""
+    with pytest.raises(ValueError):
+        sample_table("customers", columns=["name; DROP TABLE customers"])
+
+
+def test_profile_table_aggregates(sample_tables):
+    """profile_table trả về thống kê tóm tắt, không trả dữ liệu thô."""
+    from app.db import profile_table
+
+    result = profile_table("customers", columns=["city"], top_n=1)
+    city = result["columns"]["city"]
+
+    assert result["source"] == "aggregate"
+    assert result["row_count"] == 3
+    assert city["null_fraction"] == pytest.approx(1 / 3)
+    assert city["distinct_count"] == 2
+    assert (city["min"], city["max"]) == ("Hanoi", "Hue")
+    assert len(city["top_values"]) == 1
+
+
+def test_profile_table_previews_long_text(sample_tables, monkeypatch):
+    """min/max/top value là TEXT dài được rút gọn như dữ liệu của các tool khác."""
+    import app.db as db_module
+
+    monkeypatch.setattr(db_module, "VALUE_PREVIEW_CHARS", 2)
+    result = db_module.profile_table("customers", columns=["city"], top_n=1)
+    city = result["columns"]["city"]
+
+    assert city["min"]["truncated"] and city["min"]["preview"] == "Ha"
+    assert city["top_values"][0]["value"]["truncated"]
+
+
+def test_profile_table_falls_back_for_columns_without_pg_stats(sample_tables, monkeypatch):
+    """Cột không có dòng pg_stats được tính bằng aggregate, các cột khác giữ nguyên."""
+    from types import SimpleNamespace
+
+    import app.db as db_module
+
+    stats = {"null_fraction": 0.0, "distinct_count": 3, "min": "x", "max": "z", "top_values": []}
+    calls = []
+
+    def fake_pg_stats(db, table_name, columns, top_n):
+        return {"row_count": 3, "source": "pg_stats", "columns": {"name": stats, "city": {}}}
+
+    def fake_aggregates(db, table_name, columns, top_n):
+        calls.append(columns)
+        return original(db, table_name, columns, top_n)
+
+    original = db_module._profile_with_aggregates
+    dialect = SimpleNamespace(name="postgresql", identifier_preparer=db_module.engine.dialect.identifier_preparer)
+    monkeypatch.setattr(db_module, "engine", SimpleNamespace(dialect=dialect))
+    monkeypatch.setattr(db_module, "_profile_from_pg_stats", fake_pg_stats)
+    monkeypatch.setattr(db_module, "_profile_with_aggregates", fake_aggregates)
+
+    result = db_module.profile_table("customers", columns=["name", "city"])
+
+    assert calls == [["city"]]
+    assert result["source"] == "pg_stats"
+    assert result["aggregate_columns"] == ["city"]
+    assert result["columns"]["name"] == stats
+    assert result["columns"]["city"]["distinct_count"] == 2
+
+
+def _scan_all(table_name, **kwargs):
+    pages, token = [], None
+    while True:
+        page = scan_table(table_name, after=token, **kwargs)
+        pages.append(page)
+        token = page["next_token"]
+        if not page["has_more"]:
+            return pages
+
+
+def test_scan_table_walks_by_primary_key(sample_tables):
+    """Mỗi trang tiếp tục từ key cuối của trang trước, không trùng không sót."""
+    pages = _scan_all("customers", columns=["name"], limit=2)
+
+    assert [page["row_count"] for page in pages] == [2, 1]
+    assert pages[0]["key_columns"] == ["id"]
+    assert [row["name"] for page in pages for row in page["rows"]] == ["An", "Binh", "Chi"]
+    assert pages[-1]["next_token"] is None
+
+
+def test_scan_table_composite_unique_key():
+    """Bảng không có primary key dùng unique constraint NOT NULL nhiều cột."""
+    execute_transaction([
+        {"query": "CREATE TABLE scan_events (day INTEGER NOT NULL, seq INTEGER NOT NULL, note TEXT, UNIQUE (day, seq))"},
+        {"query": "INSERT INTO scan_events VALUES (2, 1, 'c'), (1, 2, 'b'), (1, 1, 'a'), (2, 2, 'd'), (3, 1, 'e')"},
+    ])
+    try:
+        pages = _scan_all("scan_events", limit=2)
+        assert [row["note"] for page in pages for row in page["rows"]] == ["a", "b", "c", "d", "e"]
+    finally:
+        execute_transaction([{"query": "DROP TABLE scan_events"}])
+
+
+def test_scan_table_rejects_token_of_other_table(sample_tables):
+    token = scan_table("customers", limit=1)["next_token"]
+
+    with pytest.raises(ValueError):
+        scan_table("orders", after=token)
+    with pytest.raises(ValueError):
+        scan_table("customers", after="not-a-token")
+
+
+def test_scan_table_requires_unique_key():
+    execute_transaction([{"query": "CREATE TABLE scan_heap (value TEXT, UNIQUE (value))"}])
+    try:
+        with pytest.raises(ValueError, match="no primary key"):
+            scan_table("scan_heap")
+    finally:
+        execute_transaction([{"query": "DROP TABLE scan_heap"}])
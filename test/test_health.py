@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# File: test_health.py
+"""
+Test health/readiness/diagnostics: endpoint chỉ đọc kết quả ping đã cache.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app import health
+from app.config import MCP_API_KEY
+from app.db import engine
+from app.health import HealthMonitor
+
+
+@pytest.fixture
+def api_client(monkeypatch):
+    from app.api import router
+
+    monitor = HealthMonitor(interval=5, timeout=1, max_pool_utilization=0.9)
+    monkeypatch.setattr("app.api.HEALTH_MONITOR", monitor)
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    with TestClient(app) as client:
+        yield client, monitor
+
+
+def test_health_does_not_touch_database(api_client):
+    client, _ = api_client
+    response = client.get("/api/health")
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "ok"
+
+
+def test_ready_reflects_cached_ping(api_client):
+    """Chưa ping thì 503; ping thành công thì 200."""
+    client, monitor = api_client
+    assert client.get("/api/ready").status_code == 503
+
+    asyncio.run(monitor.check())
+    response = client.get("/api/ready")
+
+    assert response.status_code == 200
+    assert response.json()["database"]["ok"] is True
+
+
+def test_slow_ping_times_out_without_blocking(monkeypatch):
+    """Database treo thì check trả về sau timeout và đánh dấu không ready."""
+    release = threading.Event()
+    monkeypatch.setattr(HealthMonitor, "_ping", staticmethod(lambda: release.wait(5)))
+    monitor = HealthMonitor(interval=5, timeout=0.1, max_pool_utilization=0.9)
+
+    async def timed_check():
+        started = time.monotonic()
+        try:
+            await monitor.check()
+        finally:
+            release.set()
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(timed_check())
+
+    assert elapsed < 1
+    ready, detail = monitor.readiness()
+    assert not ready
+    assert "timed out" in detail["reasons"][0]
+
+
+def test_pool_saturation_is_not_ready(monkeypatch):
+    monitor = HealthMonitor(interval=5, timeout=1, max_pool_utilization=0.5)
+    asyncio.run(monitor.check())
+    monkeypatch.setattr(health, "pool_stats", lambda: {"utilization": 0.75, "checked_out": 3})
+
+    ready, detail = monitor.readiness()
+
+    assert not ready
+    assert "pool saturated" in detail["reasons"][0]
+
+
+def test_diagnostics_requires_api_key(api_client):
+    client, _ = api_client
+    assert client.get("/api/diagnostics").status_code == 401
+
+    response = client.get("/api/diagnostics", headers={"MCP_API_KEY": MCP_API_KEY})
+    body = response.json()
+
+    assert response.status_code == 200
+    assert body["pool"]["class"] == type(engine.pool).__name__
+    assert body["in_flight"] == []
+
+
+def test_workers_requires_api_key(api_client):
+    client, _ = api_client
+    assert client.get("/api/workers").status_code == 401
+    assert client.get("/api/workers", headers={"MCP_API_KEY": MCP_API_KEY}).status_code == 200
+
+
+def test_in_flight_tracks_running_statement():
+    """Câu lệnh đang chạy xuất hiện trong snapshot và biến mất khi xong."""
+    seen = []
+    with engine.connect() as connection:
+        connection.connection.dbapi_connection.create_function(
+            "probe", 0, lambda: seen.append(health.IN_FLIGHT.snapshot()) or 1
+        )
+        connection.execute(text("SELECT probe() AS value"))
+
+    assert seen and "probe()" in seen[0][0]["statement"]
+    assert health.IN_FLIGHT.snapshot() == []
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# File: test_index_advisor.py
+"""
+Test gợi ý index từ workload.
+"""
+
+import json
+
+from app.db import execute_query, execute_transaction
+from app.index_advisor import _candidates, _is_covered, _parse_statement, suggest_indexes
+from app.query_stats import STATEMENT_STATS
+
+
+def test_parse_predicates_joins_and_order_by():
+    parsed = _parse_statement(
+        "SELECT c.name FROM customers c JOIN orders o ON o.customer_id = c.id "
+        "WHERE c.city = ? AND o.amount > ? ORDER BY o.id"
+    )
+    columns = {"customers": {"id", "name", "city"}, "orders": {"id", "customer_id", "amount"}}
+
+    assert parsed["aliases"] == {"customers": "customers", "c": "customers", "orders": "orders", "o": "orders"}
+    assert _candidates(parsed, columns) == {
+        "customers": ("id", "city"),
+        "orders": ("customer_id", "amount"),
+    }
+
+
+def test_existing_index_prefix_covers_candidate():
+    assert _is_covered(("b", "a"), [["a", "b", "c"]])
+    assert not _is_covered(("b",), [["a", "b"]])
+
+
+def test_suggests_index_for_observed_full_scan(sample_tables):
+    STATEMENT_STATS.reset()
+    for customer_id in (1, 2, 3):
+        execute_query("SELECT amount FROM orders WHERE customer_id = :id", {"id": customer_id})
+    execute_query("SELECT name FROM customers WHERE id = :id", {"id": 1})
+
+    result = suggest_indexes()
+
+    # Truy vấn theo customers.id đã có khóa chính bao phủ nên chỉ còn một gợi ý
+    [suggestion] = result["suggestions"]
+    assert suggestion["table_name"] == "orders"
+    assert suggestion["columns"] == ["customer_id"]
+    assert suggestion["calls"] == 3
+    assert suggestion["full_scans"] == 1
+    assert suggestion["ddl"] == "CREATE INDEX ix_orders_customer_id ON orders (customer_id)"
+    assert result["hypopg"] is False
+
+    execute_transaction([{"query": suggestion["ddl"]}])
+    assert suggest_indexes()["suggestions"] == []
+
+
+def test_suggest_indexes_tool(sample_tables, mcp_client):
+    STATEMENT_STATS.reset()
+    response = mcp_client.post("/mcp/", json={
+        "jsonrpc": "2.0", "id": 1, "method": "tools/call",
+        "params": {"name": "suggest_indexes", "arguments": {
+            "queries": ["SELECT * FROM customers WHERE city = 'Hue' ORDER BY name"]
+        }}
+    })
+
+    result = json.loads(response.json()["result"]["content"][1]["text"])
+    assert [s["columns"] for s in result["suggestions"]] == [["city", "name"]]
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# File: test_jobs.py
+"""
+Test query job: submit, poll, đọc kết quả theo trang và hủy.
+"""
+
+import json
+import time
+
+import pytest
+
+from app.jobs import JobNotFoundError, JobQueueFullError, QueryJobManager
+
+_SLOW_QUERY = (
+    "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 100000000) "
+    "SELECT COUNT(*) AS n FROM c"
+)
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = QueryJobManager(str(tmp_path / "jobs"), max_workers=1, max_queued=2, result_ttl=3600)
+    yield manager
+    manager.shutdown()
+
+
+def _wait(manager, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = manager.status(job_id)
+        if status["status"] in ("succeeded", "failed", "cancelled"):
+            return status
+        time.sleep(0.02)
+    raise AssertionError(f"Job {job_id} did not finish: {status}")
+
+
+def test_job_results_are_paged(manager):
+    """Kết quả spill xuống file và đọc lại theo trang, kể cả trang giữa chừng."""
+    job_id = manager.submit(
+        "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 2500) SELECT x FROM c"
+    )["job_id"]
+
+    status = _wait(manager, job_id)
+    assert status["status"] == "succeeded"
+    assert status["rows_fetched"] == 2500
+
+    page = manager.fetch(job_id, offset=1998, limit=4)
+    assert [row["x"] for row in page["rows"]] == [1999, 2000, 2001, 2002]
+    assert page["next_offset"] == 2002
+
+    last = manager.fetch(job_id, offset=2499, limit=10)
+    assert last["rows"] == [{"x": 2500}]
+    assert last["next_offset"] is None
+
+
+def test_failed_job_reports_error(manager):
+    job_id = manager.submit("SELECT * FROM missing_table")["job_id"]
+
+    status = _wait(manager, job_id)
+
+    assert status["status"] == "failed"
+    assert "missing_table" in status["error"]
+    with pytest.raises(ValueError):
+        manager.fetch(job_id)
+
+
+def test_cancel_running_job_interrupts_query(manager):
+    """Hủy job đang chạy ngắt câu lệnh thay vì chờ nó chạy xong."""
+    job_id = manager.submit(_SLOW_QUERY)["job_id"]
+    while manager.status(job_id)["status"] == "queued":
+        time.sleep(0.01)
+
+    started = time.monotonic()
+    manager.cancel(job_id)
+
+    assert _wait(manager, job_id)["status"] == "cancelled"
+    assert time.monotonic() - started < 5
+
+
+def test_queued_job_is_cancelled_and_queue_is_bounded(manager):
+    """Pool có giới hạn: job thừa bị từ chối, job đang chờ hủy được ngay."""
+    running = manager.submit(_SLOW_QUERY)["job_id"]
+    queued = [manager.submit("SELECT 1 AS x")["job_id"] for _ in range(2)]
+    with pytest.raises(JobQueueFullError):
+        manager.submit("SELECT 1 AS x")
+
+    manager.cancel(queued[0])
+    assert manager.status(queued[0])["status"] == "cancelled"
+    manager.cancel(running)
+    assert _wait(manager, queued[1])["status"] == "succeeded"
+
+
+def test_other_worker_reads_status_and_results(manager, tmp_path):
+    """Một manager khác dùng cùng thư mục (như worker khác) đọc được job."""
+    job_id = manager.submit("SELECT 1 AS x UNION ALL SELECT 2")["job_id"]
+    _wait(manager, job_id)
+
+    other = QueryJobManager(str(tmp_path / "jobs"), max_workers=1, max_queued=1, result_ttl=3600)
+
+    assert other.status(job_id)["rows_fetched"] == 2
+    assert [row["x"] for row in other.fetch(job_id)["rows"]] == [1, 2]
+
+
+def test_finished_jobs_expire(manager):
+    job_id = manager.submit("SELECT 1 AS x")["job_id"]
+    _wait(manager, job_id)
+
+    manager.result_ttl = -1
+    assert manager.expire_finished() == [job_id]
+    with pytest.raises(JobNotFoundError):
+        manager.status(job_id)
+
+
+def test_submit_query_tool(mcp_client):
+    """Tool submit_query và query_status qua JSON-RPC."""
+    def call(name, arguments):
+        response = mcp_client.post("/mcp/", json={
+            "jsonrpc": "2.0", "id": 1, "method": "tools/call",
+            "params": {"name": name, "arguments": arguments}
+        })
+        return json.loads(response.json()["result"]["content"][1]["text"])
+
+    job_id = call("submit_query", {"query": "SELECT 42 AS answer"})["job_id"]
+    deadline = time.monotonic() + 10
+    while call("query_status", {"job_id": job_id})["status"] != "succeeded":
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+    assert call("fetch_query_results", {"job_id": job_id})["rows"] == [{"answer": 42}]
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+# File: test_limits.py
+"""
+Test admission control: rate limit, giới hạn đồng thời và hàng đợi ưu tiên.
+"""
+
+import asyncio
+
+import pytest
+
+from app.limits import AdmissionController, OverloadedError, RateLimitedError
+from app.shared_state import TokenBucket
+
+
+def _client(name="agent", rate=100.0, burst=100, max_concurrent=10):
+    return {"name": name, "rate": rate, "burst": burst, "max_concurrent": max_concurrent}
+
+
+def test_token_bucket_refills():
+    """Hết token thì trả về thời gian chờ thay vì cho qua."""
+    bucket = TokenBucket(rate=10, capacity=2)
+
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert 0 < bucket.try_acquire() <= 0.1
+
+
+def test_rate_limit_rejects_fast():
+    """Vượt burst của API key bị từ chối ngay với retry_after."""
+    controller = AdmissionController(max_concurrent=5, queue_size=5, timeout=1)
+    client = _client(rate=1, burst=1)
+
+    async def scenario():
+        async with controller.admit(client):
+            pass
+        with pytest.raises(RateLimitedError) as error:
+            async with controller.admit(client):
+                pass
+        return error.value
+
+    error = asyncio.run(scenario())
+    assert error.retry_after > 0
+
+
+def test_per_client_concurrency_limit():
+    """Một API key không chạy quá max_concurrent tool call cùng lúc."""
+    controller = AdmissionController(max_concurrent=5, queue_size=5, timeout=1)
+    client = _client(max_concurrent=1)
+
+    async def scenario():
+        async with controller.admit(client):
+            with pytest.raises(RateLimitedError):
+                async with controller.admit(client):
+                    pass
+        # Slot được trả lại sau khi xong
+        async with controller.admit(client):
+            pass
+
+    asyncio.run(scenario())
+    assert controller.stats()["active"] == 0
+
+
+def test_interactive_served_before_bulk():
+    """Khi hết slot, request interactive được phục vụ trước bulk đã xếp hàng."""
+    controller = AdmissionController(max_concurrent=1, queue_size=5, timeout=1)
+    order = []
+
+    async def call(name, priority):
+        async with controller.admit(_client(name), priority):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        holder = asyncio.create_task(call("first", "interactive"))
+        await asyncio.sleep(0)
+        bulk = asyncio.create_task(call("bulk", "bulk"))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(call("interactive", "interactive"))
+        await asyncio.gather(holder, bulk, interactive)
+
+    asyncio.run(scenario())
+    assert order == ["first", "interactive", "bulk"]
+
+
+def test_overload_fails_fast():
+    """Hàng đợi đầy hoặc chờ quá timeout trả lỗi quá tải."""
+    controller = AdmissionController(max_concurrent=1, queue_size=1, timeout=0.05)
+
+    async def scenario():
+        async with controller.admit(_client("a")):
+            waiter = asyncio.create_task(controller.admit(_client("b")).__aenter__())
+            await asyncio.sleep(0)
+            with pytest.raises(OverloadedError):
+                async with controller.admit(_client("c")):
+                    pass
+            with pytest.raises(OverloadedError):
+                await waiter
+
+    asyncio.run(scenario())
+    assert controller.stats()["rejected"] == 2
+
+
+def test_slot_handed_off_at_deadline_is_returned(monkeypatch):
+    """Slot chuyển tới đúng lúc hết timeout được trả lại, không bị rò."""
+    controller = AdmissionController(max_concurrent=1, queue_size=1, timeout=0.05)
+
+    async def hand_off_then_time_out(future, timeout):
+        # Như asyncio.wait_for của Python 3.12: future đã có kết quả nhưng task vẫn bị timeout
+        controller._release_slot()
+        assert future.done()
+        raise asyncio.TimeoutError
+
+    async def scenario():
+        await controller._acquire_slot(0)
+        monkeypatch.setattr(asyncio, "wait_for", hand_off_then_time_out)
+        with pytest.raises(OverloadedError):
+            await controller._acquire_slot(0)
+        monkeypatch.undo()
+        # Slot đã quay về: request mới được nhận ngay
+        await asyncio.wait_for(controller._acquire_slot(0), 0.5)
+
+    asyncio.run(scenario())
+    assert controller.stats()["active"] == 1
+
+
+def test_rejected_tool_call_returns_jsonrpc_error(mcp_client, monkeypatch):
+    """Tool call bị từ chối trả lỗi JSON-RPC thay vì chờ connection pool."""
+    import app.mcp
+
+    monkeypatch.setattr(app.mcp, "ADMISSION_CONTROLLER", AdmissionController(0, 0, 0.01))
+    response = mcp_client.post("/mcp/", json={
+        "jsonrpc": "2.0",
+        "id": 7,
+        "method": "tools/call",
+        "params": {"name": "echo", "arguments": {"message": "hi"}}
+    })
+
+    body = response.json()
+    assert body["error"]["code"] == -32000
+    assert body["id"] == 7
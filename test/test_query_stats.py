@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# File: test_query_stats.py
+"""
+Test thống kê câu lệnh theo fingerprint.
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.config import MCP_API_KEY
+from sqlalchemy import inspect
+
+from app.db import execute_query, internal_engine
+from app.health import HEALTH_MONITOR
+from app.query_stats import STATEMENT_STATS, QueryStats, fingerprint, merge_snapshots, merged_top
+
+
+def test_fingerprint_strips_literals():
+    assert fingerprint("SELECT * FROM t WHERE id = 42 AND name = 'O''Brien'") == \
+        "SELECT * FROM t WHERE id = ? AND name = ?"
+    assert fingerprint("select a\n  from t -- note\n where b in (1, 2, 3)") == "select a from t where b in (...)"
+    assert fingerprint("SELECT * FROM t2 WHERE x = :x") == fingerprint("SELECT * FROM t2 WHERE x = %(x)s")
+    # Số trong tên định danh giữ nguyên
+    assert fingerprint("SELECT col1 FROM t2") == "SELECT col1 FROM t2"
+
+
+def test_stats_aggregate_by_fingerprint():
+    stats = QueryStats(max_entries=10)
+    for duration in range(1, 101):
+        stats.record(f"SELECT * FROM t WHERE id = {duration}", float(duration), rows=1)
+    stats.record("SELECT * FROM t WHERE id = 0", 5.0, error=True)
+
+    [entry] = stats.top()["statements"]
+
+    assert entry["query"] == "SELECT * FROM t WHERE id = ?"
+    assert entry["calls"] == 101
+    assert entry["errors"] == 1
+    assert entry["rows"] == 100
+    assert entry["max_ms"] == 100
+    assert entry["p95_ms"] == 95
+
+
+def test_stats_are_bounded():
+    stats = QueryStats(max_entries=2)
+    stats.record("SELECT a FROM t", 1.0)
+    stats.record("SELECT b FROM t", 1.0)
+    stats.record("SELECT a FROM t", 1.0)
+    stats.record("SELECT c FROM t", 1.0)
+
+    result = stats.top(order_by="calls")
+
+    assert [entry["query"] for entry in result["statements"]] == ["SELECT a FROM t", "SELECT c FROM t"]
+    assert result["evicted"] == 1
+    with pytest.raises(ValueError):
+        stats.top(order_by="nope")
+
+
+def test_engine_statements_are_recorded(sample_tables):
+    STATEMENT_STATS.reset()
+    execute_query("SELECT name FROM customers WHERE id = :id", {"id": 1})
+    execute_query("SELECT name FROM customers WHERE id = :id", {"id": 2})
+    with pytest.raises(Exception):
+        execute_query("SELECT missing FROM customers")
+
+    by_query = {entry["query"]: entry for entry in STATEMENT_STATS.top(limit=100)["statements"]}
+
+    assert by_query["SELECT name FROM customers WHERE id = ?"]["calls"] == 2
+    assert by_query["SELECT missing FROM customers"]["errors"] == 1
+
+
+def test_internal_statements_are_not_recorded(sample_tables):
+    """Reflect catalog và health check của server không lẫn vào thống kê."""
+    STATEMENT_STATS.reset()
+    HEALTH_MONITOR._ping()
+    inspect(internal_engine).get_columns("customers")
+    assert STATEMENT_STATS.top()["fingerprints"] == 0
+
+    execute_query("SELECT COUNT(*) AS n FROM customers")
+    assert merged_top()["fingerprints"] == 1
+    assert merged_top()["workers"] == 1
+
+
+def test_merge_snapshots_of_workers():
+    worker_a, worker_b = QueryStats(max_entries=10), QueryStats(max_entries=10)
+    worker_a.record("SELECT * FROM t WHERE id = 1", 10.0, rows=1)
+    worker_b.record("SELECT * FROM t WHERE id = 2", 30.0, rows=1)
+    worker_b.record("SELECT a FROM u", 1.0)
+
+    merged = merge_snapshots({"1": worker_a.snapshot(), "2": worker_b.snapshot()}, order_by="calls")
+
+    assert merged["workers"] == 2
+    assert merged["fingerprints"] == 2
+    [top, _] = merged["statements"]
+    assert (top["query"], top["calls"], top["rows"]) == ("SELECT * FROM t WHERE id = ?", 2, 2)
+    assert (top["min_ms"], top["max_ms"], top["mean_ms"]) == (10.0, 30.0, 20.0)
+
+
+def test_query_stats_api_requires_key():
+    from app.api import router
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    with TestClient(app) as client:
+        assert client.get("/api/query-stats").status_code == 401
+        response = client.get("/api/query-stats?order_by=calls&limit=5", headers={"MCP_API_KEY": MCP_API_KEY})
+        assert response.status_code == 200
+        assert response.json()["order_by"] == "calls"
+        assert client.get("/api/query-stats?order_by=bad", headers={"MCP_API_KEY": MCP_API_KEY}).status_code == 400
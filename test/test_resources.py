@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# File: test_resources.py
+"""
+Test MCP resources, subscription và notification khi bảng thay đổi.
+"""
+
+import asyncio
+import json
+import sqlite3
+
+from app.db import engine, execute_command, execute_transaction
+from app.resources import (
+    SCHEMA_URI,
+    ChangeMonitor,
+    SubscriptionManager,
+    WRITE_COUNTERS,
+    table_uri,
+)
+
+
+def _rpc(mcp_client, method, params=None, headers=None):
+    return mcp_client.post(
+        "/mcp/", json={"jsonrpc": "2.0", "id": 1, "method": method, "params": params or {}}, headers=headers or {}
+    ).json()
+
+
+def test_list_and_read_resources(sample_tables, mcp_client):
+    uris = [resource["uri"] for resource in _rpc(mcp_client, "resources/list")["result"]["resources"]]
+    assert SCHEMA_URI in uris and table_uri("orders") in uris
+
+    [content] = _rpc(mcp_client, "resources/read", {"uri": table_uri("orders")})["result"]["contents"]
+    assert [column["name"] for column in json.loads(content["text"])["columns"]] == ["id", "customer_id", "amount"]
+
+    schema = _rpc(mcp_client, "resources/read", {"uri": SCHEMA_URI})["result"]["contents"][0]["text"]
+    assert "customers(" in schema
+
+    assert _rpc(mcp_client, "resources/read", {"uri": "db://tables/missing"})["error"]["code"] == -32602
+
+
+def test_subscribe_requires_session(mcp_client):
+    response = _rpc(mcp_client, "resources/subscribe", {"uri": table_uri("orders")})
+    assert response["error"]["code"] == -32600
+
+    response = _rpc(mcp_client, "resources/subscribe", {"uri": table_uri("orders")}, {"Mcp-Session-Id": "s1"})
+    assert response["result"] == {}
+
+
+def test_initialize_issues_session_id_for_subscriptions(mcp_client):
+    """Không cần MCP_SESSION_REUSE: id do initialize cấp dùng được để subscribe."""
+    response = mcp_client.post("/mcp/", json={"jsonrpc": "2.0", "id": 1, "method": "initialize"})
+    session_id = response.headers["Mcp-Session-Id"]
+
+    result = _rpc(mcp_client, "resources/subscribe", {"uri": table_uri("orders")}, {"Mcp-Session-Id": session_id})
+    assert result["result"] == {}
+
+
+def test_resource_reads_go_through_admission(mcp_client, monkeypatch):
+    import app.mcp
+    from app.limits import AdmissionController
+
+    monkeypatch.setattr(app.mcp, "ADMISSION_CONTROLLER", AdmissionController(0, 0, 0.01))
+    assert _rpc(mcp_client, "resources/read", {"uri": SCHEMA_URI})["error"]["code"] == -32000
+
+
+def test_write_counters_track_statements(sample_tables):
+    before = WRITE_COUNTERS.get("orders")
+    execute_command("UPDATE orders SET amount = amount + 1 WHERE id = 1")
+    execute_command('DELETE FROM "orders" WHERE id = 3')
+    assert WRITE_COUNTERS.get("orders") == before + 2
+
+
+def test_monitor_notifies_subscribers_of_changes(sample_tables):
+    subscriptions = SubscriptionManager()
+    monitor = ChangeMonitor(subscriptions, interval=1, notify_channel="")
+
+    async def scenario():
+        subscriptions.subscribe("s1", table_uri("orders"))
+        subscriptions.subscribe("s2", SCHEMA_URI)
+        stream = subscriptions.stream("s1")
+        assert await stream.__anext__() == b": connected\n\n"
+
+        await monitor.check()  # lượt đầu chỉ ghi nhận trạng thái ban đầu
+        await asyncio.to_thread(execute_command, "UPDATE orders SET amount = 99 WHERE id = 2")
+        await monitor.check()
+
+        event = await asyncio.wait_for(stream.__anext__(), 1)
+        await stream.aclose()
+        return event
+
+    event = asyncio.run(scenario())
+
+    message = json.loads(event.decode().split("data: ", 1)[1])
+    assert message == {
+        "jsonrpc": "2.0", "method": "notifications/resources/updated", "params": {"uri": table_uri("orders")}
+    }
+    # Session s2 chỉ subscribe schema (không đổi) nên không có gì chờ gửi
+    assert "s2" not in subscriptions._pending
+
+
+def test_monitor_detects_schema_change(sample_tables):
+    subscriptions = SubscriptionManager()
+    monitor = ChangeMonitor(subscriptions, interval=1, notify_channel="")
+    uris = {SCHEMA_URI}
+
+    assert monitor.poll(uris) == []
+    execute_command("ALTER TABLE customers ADD COLUMN email VARCHAR(100)")
+    assert monitor.poll(uris) == [SCHEMA_URI]
+
+
+def test_monitor_sees_writes_from_other_connections():
+    """Ghi từ ngoài engine (không qua WRITE_COUNTERS) được phát hiện qua data_version."""
+    execute_transaction([{"query": "CREATE TABLE tags (name TEXT PRIMARY KEY, hits INTEGER) WITHOUT ROWID"}])
+    monitor = ChangeMonitor(SubscriptionManager(), interval=1, notify_channel="")
+    uris = {table_uri("tags")}
+    try:
+        assert monitor.poll(uris) == []
+        assert monitor.poll(uris) == []
+
+        with sqlite3.connect(engine.url.database) as other:
+            other.execute("INSERT INTO tags VALUES ('a', 1)")
+        assert monitor.poll(uris) == [table_uri("tags")]
+        assert monitor.poll(uris) == []
+    finally:
+        monitor.close()
+        execute_transaction([{"query": "DROP TABLE tags"}])
+
+
+def test_monitor_keeps_state_when_counters_fail(sample_tables, monkeypatch):
+    monitor = ChangeMonitor(SubscriptionManager(), interval=1, notify_channel="")
+    uris = {table_uri("orders")}
+    assert monitor.poll(uris) == []
+
+    def fail():
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(monitor, "_data_version", fail)
+    assert monitor.poll(uris) == []
+    monkeypatch.undo()
+
+    execute_command("UPDATE orders SET amount = 1 WHERE id = 1")
+    assert monitor.poll(uris) == [table_uri("orders")]
+    monitor.close()
+
+
+def test_closed_stream_drops_subscriptions():
+    subscriptions = SubscriptionManager()
+
+    async def scenario():
+        subscriptions.subscribe("s1", table_uri("orders"))
+        first = subscriptions.stream("s1")
+        await first.__anext__()
+        # Luồng mới của cùng session thay luồng cũ: subscription được giữ
+        second = subscriptions.stream("s1")
+        await second.__anext__()
+        await first.aclose()
+        assert subscriptions.subscribed_uris() == {table_uri("orders")}
+
+        await second.aclose()
+
+    asyncio.run(scenario())
+    assert subscriptions.subscribed_uris() == set()
+    assert subscriptions.stats()["sessions"] == 0
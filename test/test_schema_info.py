@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# File: test_schema_info.py
+"""
+Test các chế độ introspection schema của get_table_info.
+"""
+
+from app.db import get_table_info
+
+
+def test_full_schema_all_tables(sample_tables):
+    """full_schema trả về cột, PK, FK của mọi bảng trong một lần gọi."""
+    result = get_table_info(full_schema=True)
+
+    assert set(sample_tables) <= set(result["tables"])
+    orders = result["tables"]["orders"]
+    assert [c["name"] for c in orders["columns"]] == ["id", "customer_id", "amount"]
+    assert orders["primary_keys"]["constrained_columns"] == ["id"]
+    assert orders["foreign_keys"][0]["referred_table"] == "customers"
+
+
+def test_full_schema_filtered(sample_tables):
+    """table_names giới hạn kết quả theo danh sách bảng."""
+    result = get_table_info(table_names=["customers"], full_schema=True)
+
+    assert list(result["tables"]) == ["customers"]
+    assert result["table_count"] == 1
+
+
+def test_full_schema_missing_table(sample_tables):
+    """Bảng không tồn tại trả về lỗi thay vì exception."""
+    result = get_table_info(table_names=["nope"], full_schema=True)
+
+    assert "error" in result
+
+
+def test_schema_summary_compact_lines(sample_tables):
+    """get_schema_summary trả về mỗi bảng một dòng dạng DDL rút gọn."""
+    from app.db import get_schema_summary
+
+    result = get_schema_summary(pattern="ORD*")
+
+    assert result["total_tables"] == 1
+    assert result["next_offset"] is None
+    assert result["schema"].startswith("orders(id INTEGER PK, customer_id INTEGER -> customers.id")
+
+
+def test_schema_summary_paging(sample_tables):
+    """offset/limit phân trang trên danh sách bảng đã sắp xếp."""
+    from app.db import get_schema_summary
+
+    first = get_schema_summary(limit=1)
+    second = get_schema_summary(offset=first["next_offset"], limit=1)
+
+    assert first["schema"].startswith("customers(")
+    assert "name VARCHAR(50) NOT NULL" in first["schema"]
+    assert second["schema"].startswith("orders(")
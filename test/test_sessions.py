@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# File: test_sessions.py
+"""
+Test giữ connection theo MCP session (Mcp-Session-Id).
+"""
+
+import pytest
+
+import app.mcp
+from app.sessions import SESSION_REGISTRY, PinnedConnectionRegistry, SessionLimitError
+
+
+@pytest.fixture
+def session_reuse(monkeypatch):
+    """Bật MCP_SESSION_REUSE trong phạm vi một test."""
+    monkeypatch.setattr(app.mcp, "SESSION_REUSE", True)
+    yield
+    SESSION_REGISTRY.close_all()
+
+
+def _call(client, tool, arguments, session_id=None):
+    headers = {"Mcp-Session-Id": session_id} if session_id else {}
+    response = client.post("/mcp/", headers=headers, json={
+        "jsonrpc": "2.0",
+        "id": 1,
+        "method": "tools/call",
+        "params": {"name": tool, "arguments": arguments}
+    })
+    return response.json()["result"]["content"][0]["text"]
+
+
+def test_initialize_assigns_session_id(session_reuse, mcp_client):
+    """initialize trả về Mcp-Session-Id mới khi bật session reuse."""
+    response = mcp_client.post("/mcp/", json={"jsonrpc": "2.0", "id": 1, "method": "initialize"})
+
+    assert len(response.headers["Mcp-Session-Id"]) == 32
+
+
+def test_temp_table_survives_across_calls(session_reuse, mcp_client):
+    """Temp table tạo ở lần gọi trước vẫn còn ở lần gọi sau cùng session."""
+    session_id = SESSION_REGISTRY.new_key()
+
+    _call(mcp_client, "execute_command", {"query": "CREATE TEMP TABLE scratch (x INTEGER)"}, session_id)
+    _call(mcp_client, "execute_command", {"query": "INSERT INTO scratch VALUES (1), (2)"}, session_id)
+
+    assert "Found 2 rows" in _call(mcp_client, "execute_query", {"query": "SELECT * FROM scratch"}, session_id)
+    assert _call(mcp_client, "execute_query", {"query": "SELECT * FROM scratch"}).startswith("Error")
+
+    response = mcp_client.delete("/mcp/", headers={"Mcp-Session-Id": session_id})
+    assert response.json() == {"status": "terminated"}
+    assert SESSION_REGISTRY.get(session_id) is None
+
+
+def test_registry_limit_and_idle_expiry():
+    """Vượt giới hạn connection ghim bị từ chối; connection rảnh bị đóng."""
+    expired = []
+    registry = PinnedConnectionRegistry(
+        max_pinned=1, idle_timeout=60, on_expire=lambda entry: expired.append(entry.key)
+    )
+
+    registry.acquire("a")
+    with pytest.raises(SessionLimitError):
+        registry.acquire("b")
+
+    registry.idle_timeout = 0
+    assert registry.expire_idle() == ["a"]
+    assert expired == ["a"]
+    assert len(registry) == 0
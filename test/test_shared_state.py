@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# File: test_shared_state.py
+"""
+Test trạng thái dùng chung giữa các worker (memory và sqlite).
+"""
+
+import asyncio
+
+import pytest
+
+from app import shared_state
+from app.limits import AdmissionController, RateLimitedError
+from app.shared_state import MemoryBackend, SqliteBackend, WorkerMismatchError, create_backend
+from app.transactions import TRANSACTION_REGISTRY, begin_transaction, rollback_transaction
+
+
+def test_sqlite_token_bucket_is_shared(tmp_path):
+    """Hai backend trỏ cùng file (như hai worker) dùng chung một bucket."""
+    path = str(tmp_path / "state.db")
+    worker_a = SqliteBackend(path)
+    worker_b = SqliteBackend(path)
+
+    assert worker_a.take_token("rate:agent", 1, 2) == 0
+    assert worker_b.take_token("rate:agent", 1, 2) == 0
+    assert worker_a.take_token("rate:agent", 1, 2) > 0
+    assert worker_b.take_token("rate:other", 1, 2) == 0
+
+
+def test_sqlite_publish_collect(tmp_path):
+    """Snapshot của mọi worker đọc được từ bất kỳ worker nào."""
+    path = str(tmp_path / "state.db")
+    worker_a = SqliteBackend(path)
+    worker_b = SqliteBackend(path)
+
+    worker_a.publish("admission", "1", {"active": 2})
+    worker_b.publish("admission", "2", {"active": 0})
+    worker_b.publish("admission", "2", {"active": 5})
+
+    assert worker_a.collect("admission") == {"1": {"active": 2}, "2": {"active": 5}}
+    assert worker_a.collect("sessions") == {}
+
+
+def test_memory_backend_publish_collect():
+    backend = MemoryBackend()
+    backend.publish("admission", "1", {"active": 1})
+
+    assert backend.collect("admission") == {"1": {"active": 1}}
+
+
+def test_create_backend_rejects_unknown():
+    with pytest.raises(ValueError):
+        create_backend("redis")
+
+
+def test_admission_rate_limit_uses_shared_state(tmp_path):
+    """Rate limit áp dụng chung khi các controller dùng cùng backend sqlite."""
+    path = str(tmp_path / "state.db")
+    client = {"name": "agent", "rate": 0.01, "burst": 1, "max_concurrent": 10}
+    first = AdmissionController(5, 5, 1, state=SqliteBackend(path))
+    second = AdmissionController(5, 5, 1, state=SqliteBackend(path))
+
+    asyncio.run(first._check_client(client))
+    with pytest.raises(RateLimitedError):
+        asyncio.run(second._check_client(client))
+
+
+def test_sqlite_handle_owner_is_shared(tmp_path):
+    path = str(tmp_path / "state.db")
+    worker_a = SqliteBackend(path)
+    worker_b = SqliteBackend(path)
+
+    worker_a.set_owner("transaction", "t1", "1")
+    assert worker_b.get_owner("transaction", "t1") == "1"
+    worker_b.clear_owner("transaction", "t1")
+    assert worker_a.get_owner("transaction", "t1") is None
+
+
+def test_handle_of_other_worker_reports_owner(monkeypatch):
+    """Handle do worker khác giữ báo lỗi rõ ràng; worker đã chết thì coi như hết hạn."""
+    state = MemoryBackend()
+    monkeypatch.setattr(shared_state, "SHARED_STATE", state)
+
+    transaction_id = begin_transaction()["transaction_id"]
+    assert state.get_owner("transaction", transaction_id) == shared_state.worker_id()
+    rollback_transaction(transaction_id)
+    assert state.get_owner("transaction", transaction_id) is None
+
+    state.set_owner("transaction", "t-other", "other")
+    state.publish("sessions", "other", {})
+    with pytest.raises(WorkerMismatchError, match="belongs to worker other"):
+        TRANSACTION_REGISTRY.acquire("t-other", create=False)
+
+    state.set_owner("transaction", "t-dead", "dead")
+    assert TRANSACTION_REGISTRY.acquire("t-dead", create=False) is None
+    assert state.get_owner("transaction", "t-dead") is None
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# File: test_snapshots.py
+"""
+Test snapshot cục bộ của kết quả truy vấn.
+"""
+
+import json
+import os
+import time
+
+import pytest
+from sqlalchemy import inspect, text
+
+from app.db import engine
+from app.snapshots import SnapshotNotFoundError, SnapshotStore, _begin_read_only, _end_read_only
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SnapshotStore(str(tmp_path / "snapshots"), ttl=3600, max_rows=1000, query_timeout=5)
+
+
+def test_snapshot_and_follow_up_queries(sample_tables, store):
+    created = store.create(
+        "SELECT o.id, c.id, c.city, o.amount FROM orders o JOIN customers c ON c.id = o.customer_id",
+        table_name="orders_by_city",
+        index_columns=["city"]
+    )
+
+    assert created["row_count"] == 3
+    assert created["columns"] == ["id", "id_2", "city", "amount"]
+
+    result = store.query(
+        created["snapshot_id"],
+        "SELECT city, SUM(amount) AS total FROM orders_by_city WHERE amount > :min GROUP BY city ORDER BY city",
+        {"min": 5}
+    )
+    assert result["rows"] == [{"city": "Hanoi", "total": 30.5}, {"city": "Hue", "total": 7.25}]
+
+    # Thêm bảng vào snapshot có sẵn rồi join trong snapshot
+    store.create("SELECT id, name FROM customers", table_name="names", snapshot_id=created["snapshot_id"])
+    result = store.query(
+        created["snapshot_id"],
+        "SELECT n.name, COUNT(*) AS n FROM orders_by_city o JOIN names n ON n.id = o.id_2 GROUP BY n.name ORDER BY n.name"
+    )
+    assert result["rows"] == [{"name": "An", "n": 2}, {"name": "Binh", "n": 1}]
+    assert result["tables"] == ["orders_by_city", "names"]
+
+
+def test_snapshot_is_read_only_and_limited(sample_tables, store):
+    snapshot_id = store.create("SELECT * FROM customers")["snapshot_id"]
+
+    with pytest.raises(Exception):
+        store.query(snapshot_id, "DELETE FROM result")
+    with pytest.raises(Exception):
+        store.query(snapshot_id, "ATTACH DATABASE ':memory:' AS other")
+
+    result = store.query(snapshot_id, "SELECT * FROM result ORDER BY id", limit=2)
+    assert result["row_count"] == 2
+    assert result["truncated"] is True
+
+
+def test_snapshot_rejects_writes_on_primary(sample_tables, store):
+    with pytest.raises(ValueError):
+        store.create("CREATE TABLE zz (a int)")
+    assert "zz" not in inspect(engine).get_table_names()
+
+    # Truy vấn nguồn chạy trong transaction chỉ đọc, trạng thái được khôi phục sau đó
+    with engine.connect() as connection:
+        _begin_read_only(connection)
+        with pytest.raises(Exception):
+            connection.execute(text("DELETE FROM orders"))
+        _end_read_only(connection)
+        assert connection.execute(text("DELETE FROM orders WHERE id = 3")).rowcount == 1
+        connection.rollback()
+
+
+def test_snapshot_query_encodes_blobs_as_base64(store):
+    snapshot_id = store.create("SELECT x'00ff' AS data")["snapshot_id"]
+    [row] = store.query(snapshot_id, "SELECT data FROM result")["rows"]
+    assert row["data"]["data"] == "AP8="
+
+
+def test_snapshot_row_cap_and_expiry(tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshots"), ttl=60, max_rows=1500, query_timeout=5)
+    created = store.create(f"SELECT value AS x FROM json_each('{json.dumps(list(range(5000)))}')")
+    assert created["row_count"] == 1500
+    assert created["truncated"] is True
+
+    path = os.path.join(store.snapshot_dir, f"{created['snapshot_id']}.sqlite")
+    os.utime(path, (time.time() - 120, time.time() - 120))
+    assert store.expire() == [created["snapshot_id"]]
+    with pytest.raises(SnapshotNotFoundError):
+        store.query(created["snapshot_id"], "SELECT 1")
+
+
+def test_snapshot_tools(sample_tables, mcp_client):
+    def call(name, arguments):
+        response = mcp_client.post("/mcp/", json={
+            "jsonrpc": "2.0", "id": 1, "method": "tools/call",
+            "params": {"name": name, "arguments": arguments}
+        })
+        return json.loads(response.json()["result"]["content"][1]["text"])
+
+    snapshot_id = call("snapshot_query", {"query": "SELECT * FROM orders"})["snapshot_id"]
+    assert call("query_snapshot", {"snapshot_id": snapshot_id, "query": "SELECT COUNT(*) AS n FROM result"})["rows"] == [{"n": 3}]
+    assert call("drop_snapshot", {"snapshot_id": snapshot_id})["status"] == "success"
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# File: test_tracing.py
+"""
+Test tracing span cho một request tools/call.
+"""
+
+import pytest
+
+from app import tracing
+
+
+@pytest.fixture
+def exporter():
+    """Bật tracing với InMemorySpanExporter trong phạm vi một test."""
+    memory = tracing.InMemorySpanExporter()
+    tracing.set_exporter(memory)
+    yield memory
+    tracing.set_exporter(None)
+
+
+def test_execute_query_spans(exporter, sample_tables, mcp_client):
+    """Một tools/call tạo đủ span dispatch, DB và encode, cùng trace và request id."""
+    exporter.clear()
+    response = mcp_client.post("/mcp/", json={
+        "jsonrpc": "2.0",
+        "id": "req-42",
+        "method": "tools/call",
+        "params": {"name": "execute_query", "arguments": {"query": "SELECT * FROM customers"}}
+    })
+
+    assert response.status_code == 200
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    expected = {
+        "mcp.handle_request", "mcp.tools_call", "db.execute_query", "db.checkout",
+        "db.execute", "db.fetch", "db.convert", "mcp.encode_results", "mcp.encode_response",
+    }
+    assert expected <= set(spans)
+    assert {span.trace_id for span in spans.values()} == {spans["mcp.handle_request"].trace_id}
+    assert all(span.attributes["mcp.request_id"] == "req-42" for span in spans.values())
+    assert spans["db.fetch"].attributes["db.rows"] == 3
+    assert spans["db.execute"].parent_span_id == spans["db.execute_query"].span_id
+
+
+def test_span_records_error(exporter):
+    """Exception trong span được ghi nhận với status ERROR."""
+    with pytest.raises(ValueError):
+        with tracing.start_span("failing"):
+            raise ValueError("boom")
+
+    [span] = exporter.get_finished_spans()
+    assert span.status == "ERROR"
+    assert "boom" in span.status_description
+
+
+def test_tracing_disabled_is_noop():
+    """Khi tắt tracing, start_span không lưu gì."""
+    tracing.set_exporter(None)
+    with tracing.start_span("ignored") as span:
+        span.set_attribute("key", "value")
+    assert not tracing.is_enabled()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# File: test_transactions.py
+"""
+Test transaction tương tác: begin/execute/commit/rollback và savepoint.
+"""
+
+import pytest
+
+from app.db import execute_query
+from app.transactions import (
+    TRANSACTION_REGISTRY,
+    TransactionNotFoundError,
+    begin_transaction,
+    commit_transaction,
+    execute_in_transaction,
+    rollback_transaction,
+)
+
+
+def _names():
+    return [row["name"] for row in execute_query("SELECT name FROM customers ORDER BY id")]
+
+
+def test_read_then_write_then_commit(sample_tables):
+    """Đọc rồi ghi trong cùng transaction, chỉ thấy thay đổi sau commit."""
+    transaction_id = begin_transaction()["transaction_id"]
+
+    read = execute_in_transaction(transaction_id, "SELECT COUNT(*) AS n FROM customers")
+    assert read["rows"] == [{"n": 3}]
+    written = execute_in_transaction(
+        transaction_id, "INSERT INTO customers (id, name) VALUES (:id, :name)", {"id": 4, "name": "Dung"}
+    )
+    assert written["rows_affected"] == 1
+
+    commit_transaction(transaction_id)
+    assert _names() == ["An", "Binh", "Chi", "Dung"]
+    assert TRANSACTION_REGISTRY.get(transaction_id) is None
+
+
+def test_rollback_to_savepoint_keeps_transaction(sample_tables):
+    """Rollback về savepoint chỉ hủy phần sau savepoint."""
+    transaction_id = begin_transaction()["transaction_id"]
+
+    execute_in_transaction(transaction_id, "UPDATE customers SET name = 'A1' WHERE id = 1")
+    execute_in_transaction(transaction_id, "UPDATE customers SET name = 'B1' WHERE id = 2", savepoint="before_b")
+    rollback_transaction(transaction_id, savepoint="before_b")
+    commit_transaction(transaction_id)
+
+    assert _names() == ["A1", "Binh", "Chi"]
+
+
+def test_idle_transaction_is_rolled_back(sample_tables, monkeypatch):
+    """Transaction rảnh quá timeout bị rollback và không dùng tiếp được."""
+    transaction_id = begin_transaction()["transaction_id"]
+    execute_in_transaction(transaction_id, "DELETE FROM orders")
+
+    monkeypatch.setattr(TRANSACTION_REGISTRY, "idle_timeout", 0)
+    assert transaction_id in TRANSACTION_REGISTRY.expire_idle()
+
+    assert len(execute_query("SELECT * FROM orders")) == 3
+    with pytest.raises(TransactionNotFoundError):
+        rollback_transaction(transaction_id)
+
+
+def test_invalid_savepoint_name(sample_tables):
+    """Tên savepoint được kiểm tra trước khi ghép vào SQL."""
+    transaction_id = begin_transaction()["transaction_id"]
+    try:
+        with pytest.raises(ValueError):
+            execute_in_transaction(transaction_id, "SELECT 1", savepoint="x; DROP TABLE customers")
+    finally:
+        rollback_transaction(transaction_id)
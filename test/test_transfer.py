@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+# File: test_transfer.py
+"""
+Test export/import dữ liệu giữa database và file theo batch.
+"""
+
+import csv
+import json
+
+import pytest
+
+from app.db import execute_transaction
+from app.transfer import export_query
+
+
+def test_export_csv_in_batches(sample_tables):
+    """Export CSV ghi header và toàn bộ row qua nhiều batch."""
+    result = export_query("SELECT id, name FROM customers ORDER BY id", "out/customers.csv", batch_size=2)
+
+    assert result["row_count"] == 3
+    assert result["batches"] == 2
+    with open(result["path"], newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["id", "name"]
+    assert rows[1] == ["1", "An"]
+    assert result["bytes"] > 0
+
+
+def test_export_ndjson_converts_values(sample_tables):
+    """NDJSON dùng cùng convert_value như execute_query."""
+    result = export_query("SELECT amount FROM orders ORDER BY id", "orders.ndjson")
+
+    with open(result["path"], encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    assert rows == [{"amount": 10.5}, {"amount": 20.0}, {"amount": 7.25}]
+
+
+def test_export_parquet(sample_tables):
+    """Parquet ghi mỗi batch thành một row group."""
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    result = export_query("SELECT id, city FROM customers", "customers.parquet", batch_size=2)
+
+    assert pq.ParquetFile(result["path"]).metadata.num_row_groups == 2
+    assert pq.read_table(result["path"]).num_rows == 3
+
+
+def test_export_parquet_column_null_in_first_batch():
+    """Cột toàn NULL ở batch đầu nhận kiểu từ batch sau thay vì làm export lỗi."""
+    pq = pytest.importorskip("pyarrow.parquet")
+    execute_transaction([
+        {"query": "CREATE TABLE sparse (id INTEGER PRIMARY KEY, note TEXT, empty TEXT)"},
+        {"query": "INSERT INTO sparse (id, note) VALUES (1, NULL), (2, NULL), (3, 'x')"},
+    ])
+    try:
+        result = export_query("SELECT * FROM sparse ORDER BY id", "sparse.parquet", batch_size=2)
+        table = pq.read_table(result["path"])
+
+        assert table.column("note").to_pylist() == [None, None, "x"]
+        assert str(table.schema.field("note").type) == "string"
+        assert table.column("empty").to_pylist() == [None, None, None]
+        assert pq.ParquetFile(result["path"]).metadata.num_row_groups == 2
+    finally:
+        execute_transaction([{"query": "DROP TABLE IF EXISTS sparse"}])
+
+
+def test_export_rejects_path_outside_data_dir(sample_tables):
+    """Không cho ghi file ra ngoài thư mục data."""
+    with pytest.raises(ValueError):
+        export_query("SELECT 1", "../escape.csv")
+
+
+def _write_data_file(name: str, content: str) -> str:
+    """Ghi file nguồn vào thư mục data và trả về đường dẫn tương đối."""
+    from app.transfer import resolve_data_path
+    import os
+
+    file_path = resolve_data_path(name)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return name
+
+
+def test_import_csv_creates_table_in_batches():
+    """Import CSV tạo bảng với kiểu suy ra và commit theo batch."""
+    from app.db import execute_query, execute_command
+    from app.transfer import import_file
+
+    path = _write_data_file("in/people.csv", "id,name,score\n1,An,1.5\n2,Binh,\n3,Chi,3\n")
+    try:
+        result = import_file(path, "people", create_table=True, batch_size=2)
+
+        assert result["status"] == "success"
+        assert result["rows_imported"] == 3
+        assert result["committed_batches"] == 2
+        assert result["column_types"] == {"id": "BIGINT", "name": "TEXT", "score": "FLOAT"}
+        rows = execute_query("SELECT id, score FROM people ORDER BY id")
+        assert rows == [{"id": 1, "score": 1.5}, {"id": 2, "score": None}, {"id": 3, "score": 3.0}]
+    finally:
+        execute_command("DROP TABLE IF EXISTS people")
+
+
+def test_import_ndjson_resumes_from_checkpoint(sample_tables):
+    """Import lỗi giữa chừng có thể chạy lại từ batch đã commit cuối cùng."""
+    from app.db import execute_query
+    from app.transfer import import_file
+
+    lines = [
+        '{"id": 10, "name": "D"}',
+        '{"id": 11, "name": "E"}',
+        '{"id": 12, "name": null}',
+        '{"id": 13, "name": "G"}',
+    ]
+    path = _write_data_file("customers.ndjson", "\n".join(lines) + "\n")
+
+    failed = import_file(path, "customers", batch_size=2)
+    assert failed["status"] == "error"
+    assert failed["resume_from_batch"] == 1
+
+    _write_data_file("customers.ndjson", "\n".join(lines).replace("null", '"F"') + "\n")
+    resumed = import_file(path, "customers", batch_size=2, resume=True)
+
+    assert resumed["status"] == "success"
+    assert resumed["skipped_batches"] == 1
+    names = [row["name"] for row in execute_query("SELECT name FROM customers WHERE id >= 10 ORDER BY id")]
+    assert names == ["D", "E", "F", "G"]
+
+
+def test_import_ndjson_rejects_keys_missing_from_table():
+    """Key chỉ xuất hiện ở batch sau không bị bỏ qua âm thầm."""
+    from app.db import execute_query, execute_command
+    from app.transfer import import_file
+
+    lines = [
+        '{"id": 1, "name": "An"}',
+        '{"id": 2, "city": "Hue"}',
+        '{"id": 3, "name": "Chi", "email": "c@example.com"}',
+    ]
+    path = _write_data_file("in/contacts.ndjson", "\n".join(lines) + "\n")
+    try:
+        result = import_file(path, "contacts", create_table=True, batch_size=2)
+
+        # Batch đầu gồm hợp các key của mọi row trong batch
+        assert result["status"] == "error"
+        assert result["committed_batches"] == 1
+        assert "email" in result["message"]
+        rows = execute_query("SELECT id, name, city FROM contacts ORDER BY id")
+        assert rows == [{"id": 1, "name": "An", "city": None}, {"id": 2, "name": None, "city": "Hue"}]
+    finally:
+        execute_command("DROP TABLE IF EXISTS contacts")
+
+
+def test_import_rejects_first_batch_keys_missing_from_existing_table(sample_tables):
+    """Bảng có sẵn: key lạ ngay ở batch đầu bị báo lỗi trước khi insert row nào."""
+    from app.db import execute_query
+    from app.transfer import import_file
+
+    lines = ['{"id": 20, "name": "H", "nickname": "h"}', '{"id": 21, "name": "I"}']
+    path = _write_data_file("customers_extra.ndjson", "\n".join(lines) + "\n")
+
+    result = import_file(path, "customers", batch_size=10)
+
+    assert result["status"] == "error"
+    assert result["committed_batches"] == 0
+    assert "nickname" in result["message"]
+    assert execute_query("SELECT id FROM customers WHERE id >= 20") == []
+
+
+def test_import_checkpoint_reports_rows_and_bytes(sample_tables):
+    """Checkpoint ghi số row và số byte đã đọc để theo dõi tiến độ."""
+    from app.transfer import import_file, import_status
+
+    lines = ['{"id": 30, "name": "J"}', '{"id": 31, "name": "K"}', '{"id": 32, "name": null}']
+    content = "\n".join(lines) + "\n"
+    path = _write_data_file("customers_progress.ndjson", content)
+
+    assert import_status(path)["status"] == "none"
+    failed = import_file(path, "customers", batch_size=2)
+    status = import_status(path)
+
+    assert failed["status"] == "error"
+    assert status["status"] == "checkpoint"
+    assert status["rows_imported"] == 2
+    assert status["bytes_read"] == len((lines[0] + "\n" + lines[1] + "\n").encode("utf-8"))
+    assert status["total_bytes"] == len(content.encode("utf-8"))
+
+    _write_data_file("customers_progress.ndjson", content.replace("null", '"L"'))
+    resumed = import_file(path, "customers", batch_size=2, resume=True)
+
+    assert resumed["status"] == "success"
+    assert resumed["bytes_read"] == len(content.replace("null", '"L"').encode("utf-8"))
+    assert import_status(path)["status"] == "none"
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# File: test_validation.py
+"""
+Test kiểm tra arguments theo input_schema trước khi chạy tool.
+"""
+
+import pytest
+
+from app.validation import InvalidParamsError, compile_validator
+
+_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "query": {"type": "string", "minLength": 1},
+        "limit": {"type": "integer", "minimum": 1, "maximum": 1000},
+        "format": {"type": "string", "enum": ["csv", "ndjson"]},
+        "columns": {"type": "array", "items": {"type": "string"}},
+        "params": {"type": "object"},
+    },
+    "required": ["query"],
+}
+
+
+def _errors(arguments, schema=_SCHEMA):
+    with pytest.raises(InvalidParamsError) as error:
+        compile_validator(schema)(arguments)
+    return error.value.errors
+
+
+def test_valid_arguments_pass():
+    validate = compile_validator(_SCHEMA)
+    validate({"query": "SELECT 1", "limit": 10, "columns": ["a"], "params": {}, "extra": True})
+    validate({"query": "SELECT 1", "limit": 10.0})
+
+
+def test_integral_floats_become_ints():
+    """1.0 hợp lệ với integer và được đổi thành int trước khi tới tool."""
+    schema = {"type": "object", "properties": {"limit": {"type": "integer"}, "ids": {"type": "array", "items": {"type": "integer"}}}}
+    arguments = {"limit": 2.0, "ids": [1.0, 2]}
+    compile_validator(schema)(arguments)
+
+    assert arguments == {"limit": 2, "ids": [1, 2]}
+    assert all(type(value) is int for value in [arguments["limit"], *arguments["ids"]])
+    assert _errors({"query": "x", "limit": 1.5}) == ["arguments.limit: expected integer, got float"]
+
+
+def test_schema_summary_accepts_integral_float_offset(sample_tables, mcp_client):
+    response = mcp_client.post("/mcp/", json={
+        "jsonrpc": "2.0", "id": 1, "method": "tools/call",
+        "params": {"name": "get_schema_summary", "arguments": {"offset": 1.0, "limit": 2}}
+    })
+    assert response.json()["result"]["content"][0]["text"].startswith("Tables 2-")
+
+
+def test_errors_name_the_offending_path():
+    errors = _errors({"limit": "10", "format": "xml", "columns": ["a", 2]})
+
+    assert errors == [
+        "arguments: missing required property 'query'",
+        "arguments.limit: expected integer, got str",
+        "arguments.format: must be one of ['csv', 'ndjson']",
+        "arguments.columns[1]: expected string, got int",
+    ]
+
+
+def test_bounds_and_booleans():
+    assert _errors({"query": "", "limit": 0}) == [
+        "arguments.query: length must be at least 1",
+        "arguments.limit: must be >= 1",
+    ]
+    # true là boolean, không phải integer
+    assert _errors({"query": "x", "limit": True}) == ["arguments.limit: expected integer, got bool"]
+
+
+def test_additional_properties_false():
+    schema = {"type": "object", "properties": {"a": {"type": "string"}}, "additionalProperties": False}
+    assert _errors({"a": "x", "b": 1}, schema) == ["arguments: unexpected property 'b'"]
+
+
+def test_non_object_arguments():
+    assert _errors(["SELECT 1"]) == ["arguments: expected object, got list"]
+
+
+def test_tool_call_rejected_before_admission(mcp_client, monkeypatch):
+    """Arguments sai trả INVALID_PARAMS mà không chạm tới admission hay database."""
+    def fail_admit(*args, **kwargs):
+        raise AssertionError("admission should not be reached")
+
+    monkeypatch.setattr("app.mcp.ADMISSION_CONTROLLER.admit", fail_admit)
+    response = mcp_client.post("/mcp/", json={
+        "jsonrpc": "2.0", "id": 7, "method": "tools/call",
+        "params": {"name": "sample_table", "arguments": {"table_name": "customers", "limit": "many"}}
+    })
+    body = response.json()
+
+    assert body["id"] == 7
+    assert body["error"]["code"] == -32602
+    assert body["error"]["data"]["errors"] == ["arguments.limit: expected integer, got str"]
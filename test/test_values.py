@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# File: test_values.py
+"""
+Test rút gọn giá trị TEXT/BLOB lớn và đọc lại theo handle.
+"""
+
+import base64
+import json
+
+import pytest
+
+from app.db import execute_query, execute_transaction
+from app.values import ValueNotFoundError, ValueStore, preview_value
+
+
+@pytest.fixture
+def blobs():
+    execute_transaction([
+        {"query": "CREATE TABLE documents (id INTEGER PRIMARY KEY, body TEXT, data BLOB)"},
+        {"query": "INSERT INTO documents VALUES (1, :body, :data)",
+         "params": {"body": "ab" * 5000, "data": bytes(range(256)) * 20}},
+        {"query": "INSERT INTO documents VALUES (2, 'short', x'00ff')"},
+    ])
+    yield
+    execute_transaction([{"query": "DROP TABLE IF EXISTS documents"}])
+
+
+def test_preview_value_truncates_text_and_binary(tmp_path):
+    store = ValueStore(str(tmp_path / "values"), ttl=3600)
+
+    text = preview_value("x" * 100, max_chars=10, max_bytes=4, store=store)
+    assert text["truncated"] is True
+    assert text["length"] == 100
+    assert text["preview"] == "x" * 10
+
+    binary = preview_value(memoryview(b"\x00\x01\x02\x03\x04\x05"), max_chars=10, max_bytes=4)
+    assert binary == {"encoding": "base64", "size": 6, "truncated": True, "data": base64.b64encode(b"\x00\x01\x02\x03").decode()}
+    assert preview_value("short", max_chars=10, max_bytes=4) == "short"
+    assert preview_value("x" * 100, max_chars=0, max_bytes=0) == "x" * 100
+
+
+def test_store_reads_values_in_chunks(tmp_path):
+    store = ValueStore(str(tmp_path / "values"), ttl=3600)
+    text_handle = store.put("héllo wörld" * 10)
+    binary_handle = store.put(memoryview(bytes(range(200))))
+
+    first = store.fetch(text_handle, 0, 11)
+    assert first["data"] == "héllo wörld"
+    assert first["next_offset"] == 11
+    assert store.fetch(text_handle, 99, 50)["data"] == "héllo wörld"[-11:]
+    assert store.fetch(text_handle, 99, 50)["next_offset"] is None
+
+    chunk = store.fetch(binary_handle, 150, 100)
+    assert base64.b64decode(chunk["data"]) == bytes(range(150, 200))
+    assert chunk["size"] == 200
+    assert chunk["next_offset"] is None
+
+    with pytest.raises(ValueNotFoundError):
+        store.fetch("0" * 32)
+
+
+def test_execute_query_limits_wide_columns(blobs):
+    rows = execute_query("SELECT * FROM documents ORDER BY id", preview_chars=100)
+
+    assert rows[0]["body"]["length"] == 10000
+    assert rows[0]["body"]["preview"] == "ab" * 50
+    assert rows[0]["data"]["size"] == 5120
+    assert rows[0]["data"]["truncated"] is True
+    assert rows[1]["body"] == "short"
+    assert rows[1]["data"] == {"encoding": "base64", "size": 2, "truncated": False, "data": "AP8="}
+    json.dumps(rows)
+
+    rows = execute_query("SELECT body FROM documents WHERE id = 1", preview_chars=100, full_columns=["body"])
+    assert rows[0]["body"] == "ab" * 5000
+
+
+def test_fetch_value_tool(blobs, mcp_client):
+    def call(name, arguments):
+        response = mcp_client.post("/mcp/", json={
+            "jsonrpc": "2.0", "id": 1, "method": "tools/call",
+            "params": {"name": name, "arguments": arguments}
+        })
+        return response.json()["result"]["content"]
+
+    content = call("execute_query", {
+        "query": "SELECT body FROM documents WHERE id = 1", "preview_chars": 10, "value_handles": True
+    })
+    [row] = json.loads(content[1]["text"])
+    handle = row["body"]["handle"]
+
+    result = json.loads(call("fetch_value", {"handle": handle, "offset": 9990, "length": 100})[1]["text"])
+    assert result["data"] == "ab" * 5
+    assert result["next_offset"] is None
+
+
+def test_row_tools_accept_preview_options(blobs):
+    """sample_table, scan_table và execute_in_transaction nhận cùng tùy chọn rút gọn như execute_query."""
+    from app.db import sample_table, scan_table
+    from app.transactions import begin_transaction, execute_in_transaction, rollback_transaction
+
+    sampled = sample_table("documents", columns=["id", "body"], limit=2, preview_chars=0)["rows"]
+    assert {row["id"]: row["body"] for row in sampled}[1] == "ab" * 5000
+
+    page = scan_table("documents", columns=["body"], limit=1, preview_chars=10, value_handles=True)
+    assert page["rows"][0]["body"]["preview"] == "ab" * 5
+    assert "handle" in page["rows"][0]["body"]
+
+    transaction_id = begin_transaction()["transaction_id"]
+    try:
+        result = execute_in_transaction(
+            transaction_id, "SELECT body FROM documents WHERE id = 1", full_columns=["body"]
+        )
+    finally:
+        rollback_transaction(transaction_id)
+    assert result["rows"][0]["body"] == "ab" * 5000